@@ -0,0 +1,94 @@
+"""
+Latency of remote calls while the client is busy handling slow API calls, with and without concurrent dispatch.
+
+A plugin server with two functions is started in a subprocess. `announce` sends a burst of display API calls back to
+the client, whose API object takes a while for each (as e.g. a websocket push in a web frontend would). Meanwhile the
+client measures the round trip of a trivial echo call. With MAX_CONCURRENT_HANDLERS = 1 the returns of the echo
+calls queue up behind the display calls on the client socket.
+
+Run from a working directory with USE_AUTH_SYSTEM = False:
+    python head_of_line.py
+"""
+import asyncio
+import multiprocessing
+import statistics
+import time
+
+PORT = 15124
+N_API_CALLS = 10
+API_CALL_DURATION = 0.1
+N_CALLS = 50
+
+
+def run_server():
+    # plugin functions are defined here, otherwise the client would find them locally
+    from rixaplugin import init_plugin_system, PluginModeFlags as PMF, create_and_start_plugin_server
+    from rixaplugin.decorators import plugfunc
+
+    @plugfunc()
+    def announce(n):
+        import rixaplugin.sync_api as api
+        for i in range(n):
+            api.display(text=f"Message {i}")
+
+    @plugfunc()
+    async def echo(value):
+        return value
+
+    async def main():
+        init_plugin_system(PMF.THREAD)
+        server, future = await create_and_start_plugin_server(PORT, use_auth=False)
+        await future
+
+    asyncio.run(main())
+
+
+async def measure(concurrent):
+    from rixaplugin import settings, async_execute
+    from rixaplugin.internal.api import BaseAPI
+
+    class SlowAPI(BaseAPI):
+        async def display(self, html=None, json=None, plotly=None, text=None, custom_msg=None):
+            await asyncio.sleep(API_CALL_DURATION)
+
+    settings.MAX_CONCURRENT_HANDLERS = 64 if concurrent else 1
+    api_obj = SlowAPI(BaseAPI.get_request_id("announce", (), {}), 0)
+    announced = await async_execute("announce", args=[N_API_CALLS], api_obj=api_obj, return_future=True)
+    latencies = []
+    for i in range(N_CALLS):
+        start = time.perf_counter()
+        await async_execute("echo", args=[i])
+        latencies.append(time.perf_counter() - start)
+    await announced
+    # let the remaining display calls finish before the next run
+    await asyncio.sleep(N_API_CALLS * API_CALL_DURATION)
+    return latencies
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return (f"median {statistics.median(latencies) * 1000:7.1f} ms, "
+            f"max {latencies[-1] * 1000:7.1f} ms")
+
+
+async def run_client():
+    from rixaplugin import init_plugin_system, PluginModeFlags as PMF, create_and_start_plugin_client
+    init_plugin_system(PMF.THREAD)
+    await create_and_start_plugin_client("localhost", PORT, use_auth=False)
+    # warm up
+    await measure(True)
+    inline = await measure(False)
+    concurrent = await measure(True)
+    print(f"{N_API_CALLS} API calls of {API_CALL_DURATION * 1000:.0f} ms each in flight, echo round trip:")
+    print(f"Handled inline:       {summary(inline)}")
+    print(f"Dispatched:           {summary(concurrent)}")
+
+
+if __name__ == "__main__":
+    server = multiprocessing.Process(target=run_server, daemon=True)
+    server.start()
+    time.sleep(2)
+    try:
+        asyncio.run(run_client())
+    finally:
+        server.terminate()
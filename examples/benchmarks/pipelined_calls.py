@@ -0,0 +1,64 @@
+"""
+Throughput of small remote calls with and without PIPELINED_CALLS.
+
+A plugin server with a trivial echo function is started in a subprocess. The client then issues many small calls,
+once waiting for the acknowledgement of every call (default) and once in pipelined mode.
+
+Run from a working directory with USE_AUTH_SYSTEM = False:
+    python pipelined_calls.py
+"""
+import asyncio
+import multiprocessing
+import time
+
+PORT = 15123
+N_CALLS = 2000
+
+
+def run_server():
+    # plugin functions are defined here, otherwise the client would find them locally
+    from rixaplugin import init_plugin_system, PluginModeFlags as PMF, create_and_start_plugin_server
+    from rixaplugin.decorators import plugfunc
+
+    @plugfunc()
+    async def echo(value):
+        return value
+
+    async def main():
+        init_plugin_system(PMF.THREAD)
+        server, future = await create_and_start_plugin_server(PORT, use_auth=False)
+        await future
+
+    asyncio.run(main())
+
+
+async def measure(n_calls, pipelined):
+    from rixaplugin import settings, async_execute
+    settings.PIPELINED_CALLS = pipelined
+    start = time.perf_counter()
+    # calls are issued one after another, as e.g. done by execute_code
+    futures = [await async_execute("echo", args=[i], return_future=True) for i in range(n_calls)]
+    await asyncio.gather(*futures)
+    return n_calls / (time.perf_counter() - start)
+
+
+async def run_client():
+    from rixaplugin import init_plugin_system, PluginModeFlags as PMF, create_and_start_plugin_client
+    init_plugin_system(PMF.THREAD)
+    await create_and_start_plugin_client("localhost", PORT, use_auth=False)
+    # warm up
+    await measure(100, False)
+    acked = await measure(N_CALLS, False)
+    pipelined = await measure(N_CALLS, True)
+    print(f"With acknowledgement: {acked:8.1f} calls/s")
+    print(f"Pipelined:            {pipelined:8.1f} calls/s ({pipelined / acked:.2f}x)")
+
+
+if __name__ == "__main__":
+    server = multiprocessing.Process(target=run_server, daemon=True)
+    server.start()
+    time.sleep(2)
+    try:
+        asyncio.run(run_client())
+    finally:
+        server.terminate()
@@ -0,0 +1,52 @@
+"""
+Round trip of large numpy arrays to process workers, copied through the pool's pipe vs. passed through shared memory.
+
+A sync plugin function returning a modified copy of its argument is called in PROCESS mode, once with
+SHARED_MEMORY_THRESHOLD = 0 (always copy) and once with the default threshold.
+
+Run from a working directory with USE_AUTH_SYSTEM = False:
+    python shared_memory.py
+"""
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+from rixaplugin.decorators import plugfunc
+
+SIZES_MB = [1, 10, 100]
+N_CALLS = 10
+
+
+@plugfunc()
+def scale(array):
+    return array * 2
+
+
+async def measure(array):
+    from rixaplugin import async_execute
+    durations = []
+    for i in range(N_CALLS):
+        start = time.perf_counter()
+        await (await async_execute("scale", args=[array], return_future=True))
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+async def main():
+    from rixaplugin import init_plugin_system, PluginModeFlags as PMF, settings
+    init_plugin_system(PMF.PROCESS)
+    threshold = settings.SHARED_MEMORY_THRESHOLD
+    print(f"Median round trip of {N_CALLS} calls:")
+    for size in SIZES_MB:
+        array = np.random.random(size * 2 ** 20 // 8)
+        settings.SHARED_MEMORY_THRESHOLD = 0
+        copied = await measure(array)
+        settings.SHARED_MEMORY_THRESHOLD = threshold
+        shared = await measure(array)
+        print(f"{size:4d} MB: pipe {copied * 1000:8.1f} ms, shared memory {shared * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
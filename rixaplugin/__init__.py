@@ -1,9 +1,11 @@
 import pickle
 import threading, asyncio
 from . import decorators
-from .internal.executor import init_plugin_system, execute as async_execute, execute_code as async_execute_code
+from .internal.executor import init_plugin_system, execute as async_execute, execute_code as async_execute_code, \
+    execute_many as async_execute_many
 from .data_structures.enums import PluginModeFlags
 from .internal.networking import create_and_start_plugin_server, create_and_start_plugin_client
+from .internal.fanout import scatter_gather as async_scatter_gather
 from .internal.memory import _memory, get_function_entry
 from .internal.utils import supervise_future
 from .internal import api as _api
@@ -48,7 +50,7 @@ async def _execute_code_and_await(code, api_obj, timeout):
     return ret_val
 
 
-def execute(function_name, plugin_name=None, args=None, kwargs=None, timeout=30):
+def execute(function_name, plugin_name=None, args=None, kwargs=None, timeout=None):
     """
     Execute a function in the plugin system synchronously i.e. wait for the result.
 
@@ -56,7 +58,7 @@ def execute(function_name, plugin_name=None, args=None, kwargs=None, timeout=30)
     :param plugin_name:
     :param args:
     :param kwargs:
-    :param timeout: Timeout in s before a TimeoutError is raised
+    :param timeout: Time in s until the deadline of the call. Defaults to settings.DEFAULT_CALL_DEADLINE
     :return:
     """
     api_obj = _api.get_api()
@@ -78,6 +80,22 @@ def execute(function_name, plugin_name=None, args=None, kwargs=None, timeout=30)
     return future.result()
 
 
+def is_cancelled():
+    """
+    Check whether the call of the current (synchronous) plugin function was cancelled by the caller, e.g. to stop a
+    long-running loop early. Async plugin functions are cancelled directly instead.
+    Calls cancelled while waiting for a worker don't start. In PROCESS mode this does not hold for the few calls the
+    pool already passed on to its workers, these start and only notice the cancellation here.
+
+    :return: True if the result is no longer wanted
+    """
+    if _api._mode.get() == 2:
+        process_socket = _api._socket.get()
+        process_socket.send(pickle.dumps([_api._req_id.get(), "IS_CANCELLED"]))
+        return pickle.loads(process_socket.recv())
+    return getattr(_api.get_api(), "cancelled", False)
+
+
 def execute_code(code, timeout=30):
     api_obj = _api.get_api()
     procmode = _api._mode.get()
@@ -31,6 +31,7 @@ class FunctionPointerType(AutoNumber):
     SYNC = auto()
     ASYNC = auto()
     LOCAL_ONLY = auto()
+    GENERATOR = auto()
 
 class HeaderFlags(AutoNumber):
     NONE = 0
@@ -45,6 +46,13 @@ class HeaderFlags(AutoNumber):
     FUNCTION_NOT_FOUND = auto()
     API_CALL = auto()
     UPDATE_REMOTE_PLUGINS = auto()
+    FUNCTION_CALL_BATCH = auto()
+    FUNCTION_RETURN_BATCH = auto()
+    FUNCTION_RETURN_CHUNK = auto()
+    CREDIT = auto()
+    COMPRESSED = auto()
+    HEARTBEAT = auto()
+    CANCEL = auto()
 
 
 class CallstackType(AutoNumber):
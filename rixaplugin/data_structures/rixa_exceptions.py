@@ -19,6 +19,12 @@ class QueueOverflowException(Exception):
         super().__init__(self.message)
 
 
+class QuorumNotReachedException(Exception):
+    def __init__(self, message="Not enough matching results for a quorum"):
+        self.message = message
+        super().__init__(self.message)
+
+
 class SignatureMismatchException(Exception):
     def __init__(self, message="Signature mismatch"):
         self.message = message
@@ -69,3 +75,11 @@ class RemoteTimeoutException(RemoteUnavailableException):
         # self.message = message
         # self.plugin_name = plugin_name
         super().__init__(message, plugin_name)
+
+
+class DeadlineExceededException(RemoteTimeoutException):
+    """
+    The deadline of a call passed before it was done. Remotes raise it for calls that were still queued by then.
+    """
+    def __init__(self, message="Deadline exceeded", plugin_name=None):
+        super().__init__(message, plugin_name)
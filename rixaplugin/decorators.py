@@ -24,7 +24,8 @@ import inspect
 #         return wrapper_sync
 
 
-def plugfunc(local_only: bool = False, tags: list = None, ):
+def plugfunc(local_only: bool = False, tags: list = None, idempotent: bool = False, affinity: str = None,
+             executor: str = None):
     def plugin_method(original_function):
         if _memory.plugin_system_active:
             raise Exception("Cant add plugins when plugin system has been started!")
@@ -32,12 +33,24 @@ def plugfunc(local_only: bool = False, tags: list = None, ):
         dic_entry["type"] = FunctionPointerType.LOCAL
         dic_entry["pointer"] = original_function
         is_coroutine = asyncio.iscoroutinefunction(original_function)
-        if is_coroutine:
+        is_async_generator = inspect.isasyncgenfunction(original_function)
+        if is_coroutine or is_async_generator:
             dic_entry["type"] |= FunctionPointerType.ASYNC
         else:
             dic_entry["type"] |= FunctionPointerType.SYNC
+        if is_async_generator or inspect.isgeneratorfunction(original_function):
+            dic_entry["type"] |= FunctionPointerType.GENERATOR
         if local_only:
             dic_entry["type"] |= FunctionPointerType.LOCAL_ONLY
+        if idempotent:
+            # calls may be repeated after a lost connection
+            dic_entry["idempotent"] = True
+        if affinity is not None:
+            # name of the argument by which calls are routed to a consistent worker, see settings.WORKER_AFFINITY
+            dic_entry["affinity"] = affinity
+        if executor is not None:
+            # name of the executor sync calls run on, see settings.EXECUTORS
+            dic_entry["executor"] = executor
         if tags is not None:
             dic_entry["tags"] = tags
         # dic_entry["coroutine"] = asyncio.iscoroutinefunction(original_function)
@@ -56,6 +69,11 @@ def plugfunc(local_only: bool = False, tags: list = None, ):
             @functools.wraps(original_function)
             async def wrapper_func(*args, **kwargs):
                 return await original_function(*args, **kwargs)
+        elif is_async_generator:
+            @functools.wraps(original_function)
+            async def wrapper_func(*args, **kwargs):
+                async for chunk in original_function(*args, **kwargs):
+                    yield chunk
         else:
             @functools.wraps(original_function)
             def wrapper_func(*args, **kwargs):
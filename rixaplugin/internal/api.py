@@ -86,7 +86,7 @@ class BaseAPI:
 
     @staticmethod
     def get_request_id(function_name, args, kwargs):
-        return utils.identifier_from_signature(function_name, args, kwargs)
+        return _memory.new_request_id(function_name, args, kwargs)
     @property
     def worker_ctx(self):
         return _context.get()
@@ -97,6 +97,11 @@ class BaseAPI:
         self.is_remote = False
         self.plugin_variables = {}
         self.state = {}
+        # absolute deadline (time.time()) inherited from the caller and number of hops so far, see RemoteAPI
+        self.deadline = None
+        self.node_count = 0
+        # set once the caller cancelled the call, see rixaplugin.is_cancelled
+        self.cancelled = False
         if scope:
             self.scope = scope
         else:
@@ -240,13 +245,18 @@ class RemoteAPI(BaseAPI):
     the server.
     """
 
-    def __init__(self, request_id, identity, network_adapter, scope=None, plugin_variables=None, state=None):
+    def __init__(self, request_id, identity, network_adapter, scope=None, plugin_variables=None, state=None,
+                 deadline=None, node_count=0):
         self.request_id = request_id
         self.identity = identity
         self.is_remote = True
         self.network_adapter = network_adapter
         self.plugin_variables = {} if plugin_variables is None else plugin_variables
         self.state = {} if state is None else state
+        # calls made on behalf of the remote can't take longer than the remote is willing to wait
+        self.deadline = deadline
+        self.node_count = node_count
+        self.cancelled = False
         if scope:
             self.scope = scope
         else:
@@ -322,9 +332,11 @@ def get_api():
     return _plugin_ctx.get()
 
 
-def _call_function_sync_process(name, plugin_name, req_id, args, kwargs,state, plugin_variables):
+def _call_function_sync_process(name, plugin_name, req_id, call_args, state, plugin_variables):
     global _req_id
     _req_id.set(req_id)
+    # large buffers are mapped from shared memory, see shared_buffers
+    args, kwargs = shared_buffers.unpack(call_args)
     api_obj = _plugin_ctx.get()
     api_obj.state = state
     api_obj.plugin_variables = plugin_variables
@@ -332,7 +344,17 @@ def _call_function_sync_process(name, plugin_name, req_id, args, kwargs,state, p
     func = get_function_entry(name, plugin_name)["pointer"]
 
     return_val = func(*args, **kwargs)
-    return api_obj.state, api_obj.plugin_variables, return_val
+    if inspect.isgenerator(return_val):
+        # chunks are sent one by one. The main process answers once the chunk is buffered (flow control)
+        socket = _socket.get()
+        for chunk in return_val:
+            socket.send(pickle.dumps([req_id, "STREAM_CHUNK", shared_buffers.pack(chunk, os.getppid())]))
+            if not pickle.loads(socket.recv()):
+                # the consumer cancelled the stream
+                return_val.close()
+                break
+        return_val = None
+    return api_obj.state, api_obj.plugin_variables, shared_buffers.pack(return_val, os.getppid())
 
 
 def _call_function_sync(func, api_obj, args, kwargs, ):
@@ -341,11 +363,23 @@ def _call_function_sync(func, api_obj, args, kwargs, ):
     return return_val
 
 
+def _call_generator_sync(func, api_obj, args, kwargs, stream, loop):
+    _plugin_ctx.set(api_obj)
+    for chunk in func(*args, **kwargs):
+        asyncio.run_coroutine_threadsafe(stream.put(chunk), loop).result()
+
+
 async def _call_function_async(func, api_obj, args, kwargs, return_future=True):
     _plugin_ctx.set(api_obj)
     return await func(*args, **kwargs)
 
 
+async def _call_generator_async(func, api_obj, args, kwargs, stream):
+    _plugin_ctx.set(api_obj)
+    async for chunk in func(*args, **kwargs):
+        await stream.put(chunk)
+
+
 def relay_module(*args, **kwargs):
     global _mode
     print("RELAY", _mode.get(), args, kwargs)
@@ -362,5 +396,5 @@ _socket = contextvars.ContextVar('_socket', default=None)
 _mode = contextvars.ContextVar('_mode', default=0)
 _variables = contextvars.ContextVar('_variables', default={})
 
-from rixaplugin.internal import executor, utils
+from rixaplugin.internal import executor, utils, shared_buffers
 
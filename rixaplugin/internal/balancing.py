@@ -0,0 +1,89 @@
+"""
+Choice between replicas i.e. several remotes serving a plugin with the same name.
+"""
+import random
+import time
+
+from rixaplugin import settings
+from rixaplugin.data_structures.rixa_exceptions import RemoteOfflineException
+
+def least_tasks(replicas):
+    """
+    Replica with the fewest calls in flight.
+    """
+    return min(replicas, key=lambda i: i["active_tasks"])
+
+
+def power_of_two(replicas):
+    """
+    Less busy of two randomly chosen replicas. Avoids that all clients pile onto the same replica.
+    """
+    if len(replicas) <= 2:
+        return least_tasks(replicas)
+    return least_tasks(random.sample(replicas, 2))
+
+
+def expected_completion(replicas):
+    """
+    Replica with the lowest expected time until a new call is done, based on the observed latency.
+    Replicas without any finished call are tried first.
+    """
+    def expected_time(replica):
+        if replica["latency"].mean is None:
+            return -1
+        return (replica["active_tasks"] + 1) * replica["latency"].mean
+
+    return min(replicas, key=expected_time)
+
+
+POLICIES = {"least_tasks": least_tasks, "power_of_two": power_of_two, "expected_completion": expected_completion}
+
+
+def register_policy(name, policy):
+    """
+    Add a policy that can be selected via settings.REPLICA_POLICY.
+
+    :param name: Name of the policy
+    :param policy: Callable that gets a list of live replicas and returns one of them
+    """
+    POLICIES[name] = policy
+
+
+def choose_replica(plugin):
+    """
+    Choose the replica of a remote plugin for the next call.
+
+    :param plugin: Plugin entry from _memory.plugins
+    :return: Replica dict
+    :raises RemoteOfflineException: If no replica is alive
+    """
+    alive = [i for i in plugin["replicas"] if i["is_alive"]]
+    if not alive:
+        raise RemoteOfflineException(f"{plugin['name']} is currently unreachable.", plugin_name=plugin["name"])
+    if len(alive) == 1:
+        return alive[0]
+    return POLICIES[settings.REPLICA_POLICY](alive)
+
+
+def call_started(plugin, replica):
+    """
+    Count a call on the plugin and replica.
+
+    :return: Start time, to be passed to call_finished
+    """
+    plugin["active_tasks"] += 1
+    replica["active_tasks"] += 1
+    return time.monotonic()
+
+
+def call_finished(plugin, replica, started, future=None):
+    """
+    Count a call as done. Can be used as done callback of the call future.
+
+    The latency of the replica is only updated by successful calls.
+    """
+    plugin["active_tasks"] = max(plugin["active_tasks"] - 1, 0)
+    replica["active_tasks"] = max(replica["active_tasks"] - 1, 0)
+    if future is None or future.cancelled() or future.exception() is not None:
+        return
+    replica["latency"].add(time.monotonic() - started)
@@ -1,6 +1,8 @@
 import asyncio
 import atexit
 import concurrent
+import contextvars
+import multiprocessing
 import os
 import pickle
 import time
@@ -17,7 +19,9 @@ from enum import Flag, auto
 from rixaplugin.internal.utils import *
 import logging
 from rixaplugin.data_structures.rixa_exceptions import *
-from rixaplugin.internal import api, utils
+from rixaplugin.internal import api, utils, balancing, shared_buffers
+from rixaplugin.internal.streaming import ResultStream, close_stream_when_done
+from rixaplugin.internal.lanes import LaneExecutor
 from rixaplugin.pylot import python_parsing
 import ast
 
@@ -37,17 +41,18 @@ def handle_return_process(fut, socket=None, identity=None, api_obj=None):
         socket.send_multipart([identity, pickle.dumps([e,api_obj.state, api_obj.plugin_variables ])])
 
 async def _start_process_server(socket):
-    executor = _memory.executor
+    dispatcher = utils.OrderedDispatcher(settings.MAX_CONCURRENT_HANDLERS, core_log)
     while True:
         identity, message = await socket.recv_multipart()
         message = pickle.loads(message)
-        if "ABORT" in message:
+        # only the header is checked, payloads (e.g. arrays) don't support comparisons
+        if message == "ABORT" or message[1] == "ABORT":
             core_log.error("Worker requested shutdown. Shutting down immediately.")
             _memory.clean()
         # if message[0] == "EXECUTE_FUNCTION":
-        proc_api = executor.get_api(message[0])
+        proc_api = _get_process_api(message[0])
         if message[1] == "EXECUTE_FUNCTION":
-            future = await execute(message[2], message[3], message[4], message[5], proc_api, True, message[6])
+            future = await execute(message[2], message[3], message[4], message[5], proc_api, True, timeout=message[6])
             future.add_done_callback(lambda fut: socket.send_multipart([identity, pickle.dumps(fut.result())]))
         elif message[1] == "EXECUTE_CODE":
             try:
@@ -58,16 +63,91 @@ async def _start_process_server(socket):
             except Exception as e:
                 socket.send_multipart([identity, pickle.dumps(e)])
 
+        elif message[1] == "STREAM_CHUNK":
+            # buffering may wait for the consumer, which must not block messages of other workers
+            asyncio.create_task(_forward_stream_chunk(socket, identity, proc_api.stream, message[2]))
+        elif message[1] == "IS_CANCELLED":
+            await socket.send_multipart([identity, pickle.dumps(getattr(proc_api, "cancelled", False))])
         elif message[1] == "API_FUNCTION":
             api_callable = getattr(proc_api, message[2])
             if proc_api.is_remote:
-                await api_callable(message[3], message[4])
+                call = api_callable(message[3], message[4])
             else:
-                await api_callable(*message[3], **message[4])
+                call = api_callable(*message[3], **message[4])
+            # same as for network messages, slow API calls must not block the other workers
+            if settings.MAX_CONCURRENT_HANDLERS <= 1:
+                await call
+            else:
+                await dispatcher.submit(message[0], call)
         else:
             raise Exception("Invalid proc message received on main thread. Process is dead!")
 
 
+async def _forward_stream_chunk(socket, identity, stream, chunk):
+    try:
+        await stream.put(shared_buffers.unpack(chunk, release=True))
+        accepted = True
+    except (asyncio.CancelledError, RuntimeError):
+        # stream was cancelled or closed, the worker stops the generator
+        accepted = False
+    await socket.send_multipart([identity, pickle.dumps(accepted)])
+
+
+def _parse_executor_spec(spec):
+    """
+    :param spec: name:kind[:workers], see settings.EXECUTORS
+    :return: (name, kind, workers)
+    """
+    name, kind, *workers = spec.split(":")
+    if kind not in ("thread", "process", "inline"):
+        raise ValueError(f"Unknown executor kind '{kind}' of executor '{name}'")
+    return name, kind, int(workers[0]) if workers else settings.DEFAULT_MAX_WORKERS
+
+
+def _create_executor(kind, num_workers):
+    if kind == "inline":
+        return InlineExecutor()
+    if kind == "thread":
+        def create_pool(max_workers):
+            return CountingThreadPoolExecutor(max_workers=max_workers, initializer=api._init_thread_worker)
+    else:
+        def create_pool(max_workers):
+            return CountingProcessPoolExecutor(max_workers=max_workers, initializer=api._init_process_worker,
+                                               initargs=(_memory.ID,))
+    # threads share the memory of the process, recycling them wouldn't free anything
+    recycle = kind == "process" and bool(settings.WORKER_MAX_TASKS or settings.WORKER_MAX_RSS or settings.WORKER_MAX_AGE)
+    if settings.WORKER_AFFINITY or settings.AUTOSCALE_MAX_WORKERS > num_workers or recycle:
+        return LaneExecutor(functools.partial(create_pool, 1), num_workers, settings.AUTOSCALE_MAX_WORKERS,
+                            recycle=recycle)
+    return create_pool(num_workers)
+
+
+def get_executor(entry):
+    """
+    Executor the sync function of an entry runs on.
+
+    :return: The named executor from @plugfunc(executor=...) or settings.PLUGIN_EXECUTORS, else the default executor
+        of the plugin system mode
+    """
+    name = entry.get("executor") or _memory.plugin_executors.get(entry["plugin_name"])
+    if not name:
+        return _memory.executor
+    if name not in _memory.executors:
+        raise Exception(f"Executor '{name}' of {entry['plugin_name']}.{entry['name']} is not configured. "
+                        f"See settings.EXECUTORS")
+    return _memory.executors[name]
+
+
+def _get_process_api(request_id):
+    for executor in [_memory.executor, *_memory.executors.values()]:
+        if getattr(executor, "processes", False):
+            try:
+                return executor.get_api(request_id)
+            except KeyError:
+                pass
+    raise KeyError(f"No process worker is running request {request_id}")
+
+
 def init_plugin_system(mode=PMF_DebugLocal, num_workers=None, debug=False, max_jupyter_messages=10):
     if _memory.plugin_system_active:
         raise Exception("Plugin system already initialized. You'll need to restart the process to reinitialize.")
@@ -98,11 +178,10 @@ def init_plugin_system(mode=PMF_DebugLocal, num_workers=None, debug=False, max_j
     if mode & PluginModeFlags.THREAD and mode & PluginModeFlags.PROCESS:
         raise Exception("Cannot run in both THREAD and PROCESS mode.")
     api.construct_api_module()
-    if mode & PluginModeFlags.THREAD:
-        _memory.executor = CountingThreadPoolExecutor(max_workers=num_workers, initializer=api._init_thread_worker)
-        test_future = _memory.executor.submit(api._test_job)
-
-    if mode & PluginModeFlags.PROCESS:
+    named_executors = [_parse_executor_spec(spec) for spec in settings.EXECUTORS]
+    _memory.plugin_executors = dict(spec.split(":") for spec in settings.PLUGIN_EXECUTORS)
+    if mode & PluginModeFlags.PROCESS or any(kind == "process" for name, kind, workers in named_executors):
+        # process workers send API calls and nested calls through this socket
         socket = _memory.zmq_context.socket(zmq.ROUTER)
         try:
             socket.bind(f"ipc:///tmp/worker_{_memory.ID}.ipc")
@@ -110,11 +189,21 @@ def init_plugin_system(mode=PMF_DebugLocal, num_workers=None, debug=False, max_j
             core_log.critical(f"IPC name not unique! Maybe this program was previously started without proper cleanup? {e}")
             raise e
         fut = asyncio.create_task(_start_process_server(socket))
-        _memory.executor = CountingProcessPoolExecutor(max_workers=num_workers, initializer=api._init_process_worker,
-                                                       initargs=(_memory.ID,))
+        # shared memory files whose receiver never got to them
+        atexit.register(shared_buffers.cleanup)
+
+    if mode & PluginModeFlags.THREAD:
+        _memory.executor = _create_executor("thread", num_workers)
+        test_future = _memory.executor.submit(api._test_job)
+
+    if mode & PluginModeFlags.PROCESS:
+        _memory.executor = _create_executor("process", num_workers)
         fake_api = api.BaseAPI(0, 0)
         test_future = _memory.executor.submit(api._test_job, fake_api)
 
+    for name, kind, workers in named_executors:
+        _memory.executors[name] = _create_executor(kind, workers)
+
 
     if mode & PluginModeFlags.LOCAL:
         pass
@@ -179,16 +268,26 @@ def init_plugin_system(mode=PMF_DebugLocal, num_workers=None, debug=False, max_j
 
 
 async def execute_networked(func_name, plugin_name, plugin_id, args, kwargs, oneway, request_id,
-                            identity, network_adapter, scope, plugin_variables=None, state=None):
+                            identity, network_adapter, scope, plugin_variables=None, state=None, deadline=None,
+                            node_count=0):
     plugin_entry = get_function_entry(func_name, plugin_id)
 
-    api_obj = api.RemoteAPI(request_id, identity, network_adapter, scope=scope, plugin_variables=plugin_variables, state=state)
+    api_obj = api.RemoteAPI(request_id, identity, network_adapter, scope=scope, plugin_variables=plugin_variables,
+                            state=state, deadline=deadline, node_count=node_count)
     try:
         fut = await _execute(plugin_entry, args, kwargs, api_obj, return_future=True)
 
     except Exception as e:
         await network_adapter.send_exception(identity, request_id, e)
         return
+    if isinstance(fut, ResultStream):
+        try:
+            await network_adapter.send_stream(identity, request_id, fut, api_obj)
+        except asyncio.CancelledError:
+            # the caller cancelled, stop the generator at its next chunk
+            fut.cancel()
+            raise
+        return
     try:
         return_val = await fut
         if not oneway:
@@ -197,6 +296,46 @@ async def execute_networked(func_name, plugin_name, plugin_id, args, kwargs, one
         await network_adapter.send_exception(identity, request_id, e)
 
 
+async def execute_networked_batch(calls, identity, network_adapter, scope, plugin_variables=None, state=None,
+                                  deadline=None, node_count=0):
+    """
+    Execute the calls of a FUNCTION_CALL_BATCH and send back the results.
+
+    All calls share scope, state and plugin variables. Results are sent as soon as they are available.
+    Calls that finish at the same time are answered with a single FUNCTION_RETURN_BATCH.
+    """
+    state = {} if state is None else state
+
+    async def execute_call(call, api_obj):
+        plugin_entry = get_function_entry(call["func_name"], call["plugin_id"])
+        fut = await _execute(plugin_entry, call["args"], call["kwargs"], api_obj, return_future=True)
+        return await fut
+
+    tasks = {}
+    for call in calls:
+        api_obj = api.RemoteAPI(call["request_id"], identity, network_adapter, scope=scope,
+                                plugin_variables=plugin_variables, state=state, deadline=deadline,
+                                node_count=node_count)
+        task = asyncio.create_task(execute_call(call, api_obj))
+        # single calls of a batch can be cancelled
+        network_adapter.track_call(identity, call["request_id"], task)
+        tasks[task] = (call["request_id"], api_obj)
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        results = []
+        for task in done:
+            if task.cancelled():
+                continue
+            request_id, api_obj = tasks[task]
+            exc = task.exception()
+            results.append((request_id, None if exc else task.result(), exc))
+            # process workers return a new state object, thread workers modify the shared one
+            state = api_obj.state
+        if results:
+            await network_adapter.send_return_batch(identity, results, state=state)
+
+
 async def _execute_code(code_str, api_obj):
 
     async def _code_visitor_callback(entry, args, kwargs):
@@ -260,9 +399,9 @@ async def _process_api_state(fut, api_obj):
     state, plugin_variables, return_val = results
     api_obj.state = state
     api_obj.plugin_variables = plugin_variables
-    return return_val
+    return shared_buffers.unpack(return_val, release=True)
 
-async def execute_sync(entry, args, kwargs, api_obj, return_future):
+async def execute_sync(entry, args, kwargs, api_obj, return_future, deadline=None):
     """
     Runs a local sync function in the plugin system.
 
@@ -271,34 +410,173 @@ async def execute_sync(entry, args, kwargs, api_obj, return_future):
     :param args:
     :param kwargs:
     :param return_future:
+    :param deadline: Absolute time (time.time()). If a worker only becomes free after it, the call is dropped
     :return:
     """
-    if _memory.max_queue < _memory.executor.get_queued_task_count():
+    executor = get_executor(entry)
+    capacity = get_call_capacity(executor) if executor else None
+    if capacity is not None and executor.get_task_count() >= capacity:
         raise QueueOverflowException(f"{entry['plugin_name']} has no available workers.")
-    if not _memory.executor and _memory.plugin_system_active:
+    if not executor and _memory.plugin_system_active:
         raise Exception("Plugin system is wrongly initialized. There is no executor."
                         "Did you forget to set the mode (THREAD/PLUGIN)?")
-    if _memory.mode & PluginModeFlags.THREAD:
-        fun = functools.partial(api._call_function_sync, entry["pointer"], api_obj, args, kwargs)
+    stream = None
+    if entry["type"] & FunctionPointerType.GENERATOR:
+        if isinstance(executor, InlineExecutor):
+            raise Exception(f"Generator {entry['name']} can't run on an inline executor")
+        stream = ResultStream()
+    processes = getattr(executor, "processes", False)
+    if not processes:
+        if stream:
+            fun = functools.partial(api._call_generator_sync, entry["pointer"], api_obj, args, kwargs, stream,
+                                    _memory.event_loop)
+        else:
+            fun = functools.partial(api._call_function_sync, entry["pointer"], api_obj, args, kwargs)
     else:
+        if stream:
+            api_obj.stream = stream
+        call_args = shared_buffers.pack((args, kwargs))
         fun = functools.partial(api._call_function_sync_process, entry["name"], entry["plugin_id"],
                                 api_obj.request_id,
-                                args, kwargs, api_obj.state, api_obj.plugin_variables)
-    future = _memory.event_loop.run_in_executor(_memory.executor,
-                                                fun, api_obj)  # _memory.executor.submit(pointer, *args, **kwargs)
+                                call_args, api_obj.state, api_obj.plugin_variables)
+    fun = functools.partial(_timed_call, fun, deadline)
+    if isinstance(executor, LaneExecutor):
+        future = asyncio.wrap_future(executor.submit(fun, api_obj, _affinity_key(entry, args, kwargs, api_obj)))
+    else:
+        future = _memory.event_loop.run_in_executor(executor,
+                                                    fun, api_obj)  # _memory.executor.submit(pointer, *args, **kwargs)
+    if processes:
+        future.add_done_callback(lambda _: shared_buffers.release(call_args))
+    future = asyncio.ensure_future(_record_duration(future, entry))
+    if processes:
+        future = asyncio.ensure_future(_process_api_state(future, api_obj))
+    if stream:
+        # generators always return their stream, the chunks are the result
+        future.add_done_callback(functools.partial(close_stream_when_done, stream=stream))
+        # cancelling the stream drops a queued generator, running ones stop at their next chunk
+        stream.add_done_callback(functools.partial(_mark_cancelled, api_obj))
+        stream.add_done_callback(lambda s: future.cancel() if s.cancelled() else None)
+        return stream
     if return_future:
-        if _memory.mode & PluginModeFlags.PROCESS:
-            wrapped_future = asyncio.ensure_future(_process_api_state(future, api_obj))
-            return wrapped_future
-        else:
-            return future
+        # queued calls are skipped by the pool on cancellation, running ones can poll rixaplugin.is_cancelled().
+        # Process pools hand a few calls ahead to their workers. These count as running and start anyway
+        future.add_done_callback(functools.partial(_mark_cancelled, api_obj))
+        return future
         # return future
     else:
         await supervise_future(future)
 
 
+def _affinity_key(entry, args, kwargs, api_obj):
+    """
+    Key by which the call is routed to a consistent worker, see settings.WORKER_AFFINITY
+
+    :return: Value of the argument named in @plugfunc(affinity=...), else the first source of
+        settings.WORKER_AFFINITY that is set, else None
+    """
+    if entry.get("affinity"):
+        if entry["affinity"] in kwargs:
+            return kwargs[entry["affinity"]]
+        names = [arg["name"] for arg in entry["args"] + entry["kwargs"]]
+        if entry["affinity"] in names and names.index(entry["affinity"]) < len(args):
+            return args[names.index(entry["affinity"])]
+    for source in settings.WORKER_AFFINITY:
+        if source == "identity":
+            if api_obj.is_remote:
+                return api_obj.identity
+        elif api_obj.state and api_obj.state.get(source) is not None:
+            return api_obj.state[source]
+    return None
+
+
+def _mark_cancelled(api_obj, future):
+    if future.cancelled():
+        api_obj.cancelled = True
+
+
+def _timed_call(fun, deadline, *args):
+    # runs in the worker, hence queue time is not included
+    if deadline is not None and time.time() > deadline:
+        # the caller gave up while the call was queued
+        raise DeadlineExceededException("Deadline passed while the call was waiting for a worker")
+    start = time.perf_counter()
+    return_val = fun(*args)
+    return return_val, time.perf_counter() - start
+
+
+def _add_function_stat(entry, duration):
+    key = (entry["plugin_name"], entry["name"])
+    if key not in _memory.function_stats:
+        _memory.function_stats[key] = utils.RollingLatency()
+    _memory.function_stats[key].add(duration)
+
+
+async def _record_duration(future, entry):
+    return_val, duration = await future
+    _add_function_stat(entry, duration)
+    return return_val
+
+
+def _record_async_duration(entry, start, future):
+    if not future.cancelled() and future.exception() is None:
+        _add_function_stat(entry, time.perf_counter() - start)
+
+
+def estimate_completion_time(function_name, plugin_id):
+    """
+    Estimate the time in seconds until a new call of a local function would be done.
+
+    Based on the rolling average duration of the function and the number of queued tasks in the executor.
+    :param function_name: Name of the function
+    :param plugin_id: ID of the plugin
+    :return: Estimate or None if the function is unknown or has not been called yet
+    """
+    try:
+        entry = get_function_entry(function_name, plugin_id)
+    except (FunctionNotFoundException, PluginNotFoundException):
+        return None
+    stats = _memory.function_stats.get((entry["plugin_name"], entry["name"]))
+    if not stats or stats.mean is None:
+        return None
+    if entry["type"] & FunctionPointerType.ASYNC:
+        return stats.mean
+    executor = get_executor(entry)
+    if not executor or executor.get_free_worker_count() > 0:
+        return stats.mean
+    # all workers busy: wait for the queue to drain. Assumes queued tasks take about as long as this one
+    return stats.mean * (1 + (executor.get_queued_task_count() + 1) / executor.get_max_task_count())
+
+
+def get_call_capacity(executor):
+    """
+    Number of calls an executor takes at once, running or queued. Further calls fail with QueueOverflowException.
+
+    The call credits advertised to peers are derived from it.
+    :return: Capacity or None if the executor never rejects calls
+    """
+    if isinstance(executor, InlineExecutor):
+        return None
+    # autoscaling executors take as many calls as they have workers once grown
+    return max(executor.get_max_task_count(), getattr(executor, "max_lanes", 0)) + _memory.max_queue
+
+
+def get_queued_task_count():
+    """
+    :return: Number of tasks waiting for a worker of any executor
+    """
+    executors = [executor for executor in [_memory.executor, *_memory.executors.values()] if executor]
+    return sum(executor.get_queued_task_count() for executor in executors)
+
+
 async def execute_async(entry, args, kwargs, api_obj, return_future):
+    if entry["type"] & FunctionPointerType.GENERATOR:
+        stream = ResultStream()
+        fut = asyncio.create_task(api._call_generator_async(entry["pointer"], api_obj, args, kwargs, stream))
+        fut.add_done_callback(functools.partial(close_stream_when_done, stream=stream))
+        _memory.tasks_in_system -= 1
+        return stream
     fut = asyncio.create_task(api._call_function_async(entry["pointer"], api_obj, args, kwargs))
+    fut.add_done_callback(functools.partial(_record_async_duration, entry, time.perf_counter()))
     _memory.tasks_in_system -= 1
     if return_future:
         return fut
@@ -315,45 +593,78 @@ async def _wait_for_return(future, timeout):
 
 
 
+def call_deadline(api_obj, timeout=None):
+    """
+    Absolute deadline of a new call.
+
+    The earlier of now + timeout and the deadline inherited via the api object, i.e. from the call this one is made
+    on behalf of. Deadlines are sent to remotes as wall clock time (time.time()), hence clocks should be in sync.
+    :param api_obj: API object of the call
+    :param timeout: Time in seconds. Defaults to settings.DEFAULT_CALL_DEADLINE
+    :return: Deadline as time.time() timestamp or None if the call has none
+    """
+    if timeout is None:
+        timeout = settings.DEFAULT_CALL_DEADLINE
+    deadline = time.time() + timeout if timeout else None
+    inherited = getattr(api_obj, "deadline", None)
+    if inherited is not None:
+        deadline = inherited if deadline is None else min(deadline, inherited)
+    return deadline
+
+
 async def _execute(plugin_entry, args=(), kwargs={}, api_obj=None, return_future=False, return_time_estimate=False,
-                   timeout=None):
+                   timeout=None, replica=None):
     if api_obj is None:
         api_obj = api.BaseAPI(0, 0)
+    deadline = call_deadline(api_obj, timeout)
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceededException(f"Deadline of call to {plugin_entry['name']} passed before it was started",
+                                        plugin_name=plugin_entry["plugin_name"])
     if return_future:
         # tasks that don't return are tasks too. But it's hard to accurately check if/when they're done.
         _memory.tasks_in_system += 1
-    if not timeout:
-        timeout = settings.FUNCTION_CALL_TIMEOUT
     async def execute_with_timeout(coroutine):
+        # without a deadline, waiting for a worker is still bounded locally
+        wait = deadline - time.time() if deadline is not None else settings.FUNCTION_CALL_TIMEOUT
         try:
-            return await asyncio.wait_for(coroutine, timeout=5)
+            return await asyncio.wait_for(coroutine, timeout=wait)
         except asyncio.TimeoutError:
-            raise Exception(f"Execution of {plugin_entry['plugin_name']} timed out after {timeout} seconds.")
+            raise DeadlineExceededException(f"Execution of {plugin_entry['plugin_name']} did not start before its "
+                                            f"deadline", plugin_name=plugin_entry["plugin_name"])
 
     if plugin_entry["type"] & FunctionPointerType.LOCAL:
+        est = estimate_completion_time(plugin_entry["name"], plugin_entry["plugin_id"]) if return_time_estimate else None
         if plugin_entry["type"] & FunctionPointerType.SYNC:
-            coroutine = execute_sync(plugin_entry, args, kwargs, api_obj, return_future=return_future)
+            coroutine = execute_sync(plugin_entry, args, kwargs, api_obj, return_future=return_future,
+                                     deadline=deadline)
         else:
             coroutine = execute_async(plugin_entry, args, kwargs, api_obj, return_future=return_future)
         if return_future:
-            return await coroutine
-        return await execute_with_timeout(coroutine)
+            fut = await coroutine
+        else:
+            fut = await execute_with_timeout(coroutine)
+        return (fut, est) if return_time_estimate else fut
 
     elif plugin_entry["type"] & FunctionPointerType.REMOTE:
-        if not _memory.plugins[plugin_entry["id"]]["is_alive"]:
-            raise RemoteOfflineException(f"{plugin_entry['plugin_name']} is currently unreachable.")
-        _memory.plugins[plugin_entry["id"]]["active_tasks"] += 1
-        fut, est = await plugin_entry["remote_origin"].call_remote_function(plugin_entry, api_obj, args, kwargs,
-                                                                            not return_future,
-                                                                            return_time_estimate=True)
-        if return_time_estimate:
-            if return_future:
-                return fut, est
-            return await execute_with_timeout(fut), est
+        plugin = _memory.plugins[plugin_entry["id"]]
+        if replica is None:
+            replica = balancing.choose_replica(plugin)
+        started = balancing.call_started(plugin, replica)
+        is_generator = plugin_entry["type"] & FunctionPointerType.GENERATOR
+        try:
+            fut, est = await replica["remote_origin"].call_remote_function(plugin_entry, api_obj, args, kwargs,
+                                                                           not return_future and not is_generator,
+                                                                           return_time_estimate=True,
+                                                                           replica=replica, deadline=deadline)
+        except Exception as e:
+            balancing.call_finished(plugin, replica, started)
+            raise e
+        if fut is None:
+            balancing.call_finished(plugin, replica, started)
         else:
-            if return_future:
-                return fut
-            return await execute_with_timeout(fut)
+            fut.add_done_callback(functools.partial(balancing.call_finished, plugin, replica, started))
+        # streams are returned as is. Without return_future the call is one way and there is no future
+        return (fut, est) if return_time_estimate else fut
 
     # if plugin_entry["type"] & FunctionPointerType.LOCAL:
     #     if plugin_entry["type"] & FunctionPointerType.SYNC:
@@ -379,7 +690,7 @@ async def _execute(plugin_entry, args=(), kwargs={}, api_obj=None, return_future
 
 
 async def execute(function_name, plugin_name=None, args=None, kwargs=None, api_obj=None, return_future=False,
-                  return_time_estimate=False, timeout=30, scope=None):
+                  return_time_estimate=False, timeout=None, scope=None):
     """
     Execute a function in the plugin system.
 
@@ -393,8 +704,11 @@ async def execute(function_name, plugin_name=None, args=None, kwargs=None, api_o
         kwargs (dict, optional): The keyword arguments to pass to the function. Defaults to {}.
         api_obj (BaseAPI, optional): The API object to use for the function call. If None, a new BaseAPI object is created. Defaults to None.
         return_future (bool, optional): If True, the function will return a future of the function call. Defaults to False.
-        return_time_estimate (bool, optional): If True, the function will return a time estimate of the function call. Defaults to False.
-        timeout (int, optional): The maximum time to wait for the function call to complete. Defaults to 10.
+        return_time_estimate (bool, optional): If True, returns a tuple (result, estimate). The estimate is the expected time in seconds until the call is done,
+            based on measured durations of previous calls on the executing plugin. None if the function was never called before. Defaults to False.
+        timeout (int, optional): Time in seconds until the deadline of the call, which is propagated to remotes and
+            nested calls. Defaults to settings.DEFAULT_CALL_DEADLINE. Deadlines of calls this one is made on behalf of
+            always apply.
         scope (dict, optional): Manual scope if no API obj is provided. Will set scope for constructed API object. Defaults to None.
 
     Raises:
@@ -402,6 +716,7 @@ async def execute(function_name, plugin_name=None, args=None, kwargs=None, api_o
 
     Returns:
         Future or any: If return_future is True, it returns a Future object. Otherwise, it returns the result of the function call.
+        Generator functions always return a ResultStream. Iterate it with async for, or await it to get all chunks as list.
     """
     if kwargs is None:
         kwargs = {}
@@ -413,24 +728,109 @@ async def execute(function_name, plugin_name=None, args=None, kwargs=None, api_o
     if not _memory.plugin_system_active:
         raise Exception("Plugin system not initialized")
     if not api_obj:
-        potential_api = api.get_api()
-        #check if potential_api is BaseAPI or a derived class. If it is "just" a BaseAPI, create a new API object
-        if isinstance(potential_api, api.BaseAPI) and not type(potential_api) == api.BaseAPI:
-            api_obj = potential_api
-
-        else:
-            req_id = utils.identifier_from_signature(function_name, args, kwargs)
-            if _memory.mode & PluginModeFlags.JUPYTER:
-                api_obj = api.JupyterAPI(req_id, _memory.ID, scope=scope)
-            else:
-                api_obj = api.BaseAPI(req_id, _memory.ID, scope=scope)
+        api_obj = _get_api_obj(function_name, args, kwargs, scope)
     plugin_entry = get_function_entry_by_name(function_name, plugin_name)
     utils.is_valid_call(plugin_entry, args, kwargs)
     return await _execute(plugin_entry, args, kwargs, api_obj, return_future=return_future,
                           return_time_estimate=return_time_estimate, timeout=timeout)
 
 
+def _get_api_obj(function_name, args, kwargs, scope):
+    potential_api = api.get_api()
+    #check if potential_api is BaseAPI or a derived class. If it is "just" a BaseAPI, create a new API object
+    if isinstance(potential_api, api.BaseAPI) and not type(potential_api) == api.BaseAPI:
+        return potential_api
+    req_id = _memory.new_request_id(function_name, args, kwargs)
+    if _memory.mode & PluginModeFlags.JUPYTER:
+        return api.JupyterAPI(req_id, _memory.ID, scope=scope)
+    return api.BaseAPI(req_id, _memory.ID, scope=scope)
+
+
+async def execute_many(calls, api_obj=None, return_future=False, timeout=None, scope=None):
+    """
+    Execute several functions in the plugin system at once.
+
+    Calls that go to the same remote are sent in a single FUNCTION_CALL_BATCH message i.e. scope, state and plugin
+    variables are only transferred once. Local calls are executed as with execute.
+
+    Args:
+        calls (list): Calls as (function_name, args, kwargs) tuples or dicts with the keys function_name and optionally
+            plugin_name, args and kwargs.
+        api_obj (BaseAPI, optional): The API object shared by all calls. Defaults to None.
+        return_future (bool, optional): If True, a list of futures is returned. Defaults to False.
+        timeout (int, optional): Time in seconds until the deadline of the calls, see execute. Without return_future,
+            also the maximum time to wait for all calls to complete (settings.FUNCTION_CALL_TIMEOUT if None).
+        scope (dict, optional): Manual scope if no API obj is provided. Defaults to None.
+
+    Returns:
+        list: Futures or results in the order of calls.
+    """
+    if not _memory.plugin_system_active:
+        raise Exception("Plugin system not initialized")
+    parsed_calls = []
+    for call in calls:
+        if isinstance(call, dict):
+            function_name, plugin_name = call["function_name"], call.get("plugin_name")
+            args, kwargs = call.get("args"), call.get("kwargs")
+        else:
+            function_name, args, kwargs = (list(call) + [None, None])[:3]
+            plugin_name = None
+        args = [] if args is None else list(args)
+        kwargs = {} if kwargs is None else kwargs
+        plugin_entry = get_function_entry_by_name(function_name, plugin_name)
+        utils.is_valid_call(plugin_entry, args, kwargs)
+        parsed_calls.append((plugin_entry, args, kwargs))
+    if not parsed_calls:
+        return []
+    if not api_obj:
+        api_obj = _get_api_obj(parsed_calls[0][0]["name"], parsed_calls[0][1], parsed_calls[0][2], scope)
+
+    futures = [None] * len(parsed_calls)
+    remote_groups = {}
+    replicas = {}
+    started = {}
+    for i, (plugin_entry, args, kwargs) in enumerate(parsed_calls):
+        if plugin_entry["type"] & FunctionPointerType.REMOTE and not plugin_entry["type"] & FunctionPointerType.GENERATOR:
+            plugin = _memory.plugins[plugin_entry["id"]]
+            replicas[i] = balancing.choose_replica(plugin)
+            # counted right away, so that the next choice sees the load
+            started[i] = balancing.call_started(plugin, replicas[i])
+            key = (id(replicas[i]["remote_origin"]), replicas[i]["remote_id"])
+            remote_groups.setdefault(key, []).append(i)
+        else:
+            futures[i] = await _execute(plugin_entry, args, kwargs, api_obj, return_future=True, timeout=timeout)
+    for indices in remote_groups.values():
+        if len(indices) == 1:
+            plugin_entry, args, kwargs = parsed_calls[indices[0]]
+            balancing.call_finished(_memory.plugins[plugin_entry["id"]], replicas[indices[0]], started[indices[0]])
+            futures[indices[0]] = await _execute(plugin_entry, args, kwargs, api_obj, return_future=True,
+                                                 timeout=timeout)
+            continue
+        entries = [parsed_calls[i][0] for i in indices]
+        group_replicas = [replicas[i] for i in indices]
+        started_group = [started[i] for i in indices]
+        _memory.tasks_in_system += len(entries)
+        try:
+            batch_futures = await group_replicas[0]["remote_origin"].call_remote_function_batch(
+                entries, api_obj, [parsed_calls[i][1] for i in indices], [parsed_calls[i][2] for i in indices],
+                replicas=group_replicas, deadline=call_deadline(api_obj, timeout))
+        except Exception as e:
+            for plugin_entry, replica, start in zip(entries, group_replicas, started_group):
+                balancing.call_finished(_memory.plugins[plugin_entry["id"]], replica, start)
+            raise e
+        for i, fut, plugin_entry, replica, start in zip(indices, batch_futures, entries, group_replicas,
+                                                        started_group):
+            fut.add_done_callback(functools.partial(balancing.call_finished, _memory.plugins[plugin_entry["id"]],
+                                                    replica, start))
+            futures[i] = fut
+    if return_future:
+        return futures
+    return await asyncio.wait_for(asyncio.gather(*futures), timeout=timeout or settings.FUNCTION_CALL_TIMEOUT)
+
+
 class CountingThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    processes = False
+
     def __init__(self, max_workers=None, *args, **kwargs):
         super().__init__(max_workers, *args, **kwargs)
         self._active_tasks = set()
@@ -455,8 +855,11 @@ class CountingThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
         _memory.tasks_in_system -= 1
         self._active_tasks.remove(future)
 
+    def get_task_count(self):
+        return len(self._active_tasks)
+
     def get_queued_task_count(self):
-        return self._work_queue.qsize()
+        return max(0, len(self._active_tasks) - self._max_workers)
 
     def get_active_task_count(self):
         return len(self._active_tasks)
@@ -465,9 +868,57 @@ class CountingThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
         return self._max_workers - len(self._active_tasks)
 
 
+class InlineExecutor(concurrent.futures.Executor):
+    """
+    Runs calls right away in the event loop thread, without the overhead of a worker.
+
+    Only for quick functions that neither block nor use the sync API or rixaplugin.execute, which would wait for the
+    event loop itself.
+    """
+    processes = False
+
+    def submit(self, fn, *args, **kwargs):
+        _memory.tasks_in_system -= 1
+        future = concurrent.futures.Future()
+        try:
+            # the plugin context must not leak into the calling task
+            future.set_result(contextvars.copy_context().run(fn))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def get_max_task_count(self):
+        return 1
+
+    def get_task_count(self):
+        return 0
+
+    def get_queued_task_count(self):
+        return 0
+
+    def get_active_task_count(self):
+        return 0
+
+    def get_free_worker_count(self):
+        return 1
+
+
+def _report_worker_pid(pids, initializer, *initargs):
+    pids.put(os.getpid())
+    if initializer is not None:
+        initializer(*initargs)
+
+
 class CountingProcessPoolExecutor(concurrent.futures.ProcessPoolExecutor):
-    def __init__(self, max_workers=None, *args, **kwargs):
-        super().__init__(max_workers=max_workers, *args, **kwargs)
+    processes = True
+
+    def __init__(self, max_workers=None, mp_context=None, initializer=None, initargs=(), **kwargs):
+        mp_context = mp_context or multiprocessing.get_context()
+        # workers report their pid once started, the pool keeps its own list private
+        self._pid_queue = mp_context.SimpleQueue()
+        self._worker_pids = set()
+        super().__init__(max_workers=max_workers, mp_context=mp_context, initializer=_report_worker_pid,
+                         initargs=(self._pid_queue, initializer, *initargs), **kwargs)
         self._active_tasks = 0
         self.max_task_count = max_workers
         self.apis = {}
@@ -503,13 +954,14 @@ class CountingProcessPoolExecutor(concurrent.futures.ProcessPoolExecutor):
     def _task_completed(self, future):
         self._active_tasks -= 1
         _memory.tasks_in_system -= 1
-        asyncio.run_coroutine_threadsafe(self.remove_api(future.request_id), _memory.event_loop)
+        # called from a pool thread, the expiry service belongs to the event loop
+        _memory.event_loop.call_soon_threadsafe(_memory.expiry.schedule, (self, future.request_id), 1,
+                                                functools.partial(self.remove_api, future.request_id))
         if settings.LOG_PROCESSPOOL:
             with open(os.path.join(settings.WORKING_DIRECTORY, "log", "processpool.csv"), "a") as f:
                 f.write(f"{datetime.now().isoformat()};{future.request_id};1;{self._active_tasks};{len(self._pending_work_items)}\n")
 
-    async def remove_api(self, request_id):
-        await asyncio.sleep(1)
+    def remove_api(self, request_id):
         try:
             del self.apis[request_id]
         except:
@@ -518,8 +970,20 @@ class CountingProcessPoolExecutor(concurrent.futures.ProcessPoolExecutor):
     def get_api(self, request_id):
         return self.apis[request_id]
 
+    def worker_pids(self):
+        """
+        :return: Set of pids of all workers started so far, including ones that have exited since
+        """
+        while not self._pid_queue.empty():
+            self._worker_pids.add(self._pid_queue.get())
+        return self._worker_pids
+
+    def get_task_count(self):
+        return self._active_tasks
+
     def get_queued_task_count(self):
-        return len(self._pending_work_items)
+        # submitted calls that are not done yet, beyond those the workers are running
+        return max(0, self._active_tasks - self._max_workers)
 
     def get_active_task_count(self):
         return self._active_tasks
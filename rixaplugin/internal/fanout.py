@@ -0,0 +1,195 @@
+"""
+Calling a function on several remotes at once and combining the results (scatter-gather).
+"""
+import asyncio
+
+from rixaplugin.data_structures.enums import FunctionPointerType
+from rixaplugin.data_structures.rixa_exceptions import RemoteTimeoutException, QuorumNotReachedException, \
+    RemoteOfflineException
+from rixaplugin.internal import utils
+from rixaplugin.internal.executor import _execute, _get_api_obj
+from rixaplugin.internal.memory import _memory, get_function_entry_by_name
+
+PENDING = object()
+"""Returned by reducers that need more outcomes before they can produce a result"""
+
+
+def concat(outcomes, total):
+    """
+    Wait for all targets and concatenate the successful results. Lists are merged, other results appended.
+    """
+    if len(outcomes) < total:
+        return PENDING
+    results = [i["result"] for i in outcomes if i["exception"] is None]
+    if not results:
+        raise outcomes[0]["exception"]
+    merged = []
+    for result in results:
+        if isinstance(result, (list, tuple)):
+            merged.extend(result)
+        else:
+            merged.append(result)
+    return merged
+
+
+def first_success(outcomes, total):
+    """
+    Result of the first target that succeeds. The remaining calls are cancelled.
+    """
+    for outcome in outcomes:
+        if outcome["exception"] is None:
+            return outcome["result"]
+    if len(outcomes) == total:
+        raise outcomes[0]["exception"]
+    return PENDING
+
+
+def _equal(a, b):
+    try:
+        eq = a == b
+        return bool(eq.all()) if hasattr(eq, "all") else bool(eq)
+    except Exception:
+        return False
+
+
+def quorum(outcomes, total, size=None):
+    """
+    Result that at least size targets agree on. Failed calls don't vote.
+
+    Use functools.partial(quorum, size=n) for a fixed quorum size.
+    :param size: Number of equal results required. Defaults to a majority of the targets
+    """
+    if size is None:
+        size = total // 2 + 1
+    groups = []
+    for outcome in outcomes:
+        if outcome["exception"] is not None:
+            continue
+        for group in groups:
+            if _equal(group[0], outcome["result"]):
+                group.append(outcome["result"])
+                break
+        else:
+            groups.append([outcome["result"]])
+    largest = max(groups, key=len, default=[])
+    if len(largest) >= size:
+        return largest[0]
+    if len(largest) + total - len(outcomes) < size:
+        raise QuorumNotReachedException(f"Only {len(largest)} of {total} targets agree, {size} required")
+    return PENDING
+
+
+def collect_outcomes(outcomes, total):
+    """
+    All outcomes as they are. Each is a dict with target (replica or None for local functions), result and exception.
+    """
+    if len(outcomes) < total:
+        return PENDING
+    return outcomes
+
+
+REDUCERS = {"concat": concat, "first_success": first_success, "quorum": quorum, "outcomes": collect_outcomes}
+
+
+def register_reducer(name, reducer):
+    """
+    Add a reducer that can be selected by name in scatter_gather.
+
+    :param name: Name of the reducer
+    :param reducer: Callable that gets the outcomes so far and the number of targets. Returns PENDING while it needs
+        more outcomes, otherwise the combined result. May raise to fail the whole call
+    """
+    REDUCERS[name] = reducer
+
+
+def get_targets(plugin_entry, targets=None):
+    """
+    Live replicas of the plugin of a function.
+
+    :param plugin_entry: Function entry
+    :param targets: Only use replicas reached via these network adapters (e.g. PluginClient objects)
+    :return: List of replicas. [None] for local functions
+    """
+    if plugin_entry["type"] & FunctionPointerType.LOCAL:
+        return [None]
+    replicas = [i for i in _memory.plugins[plugin_entry["id"]]["replicas"] if i["is_alive"]]
+    if targets is not None:
+        replicas = [i for i in replicas if any(i["remote_origin"] is j for j in targets)]
+    return replicas
+
+
+async def scatter_gather(function_name, plugin_name=None, args=None, kwargs=None, targets=None, reducer="concat",
+                         max_concurrency=None, timeout=None, allow_partial=True, api_obj=None, scope=None):
+    """
+    Call a function on every remote serving its plugin and combine the results.
+
+    Remotes serving plugins with the same name are replicas of one plugin (see balancing). Instead of choosing one
+    replica, all of them are called, e.g. to query every shard of a dataset.
+    :param function_name: Name of the function
+    :param plugin_name: Name of the plugin, if the function name is ambiguous
+    :param args: Positional arguments, same for all targets
+    :param kwargs: Keyword arguments, same for all targets
+    :param targets: Only call replicas reached via these network adapters. Defaults to all live replicas
+    :param reducer: Name of a reducer in REDUCERS or a reducer callable. See register_reducer
+    :param max_concurrency: Maximum number of calls in flight. Defaults to no limit
+    :param timeout: Time in seconds each target has to answer. A timeout counts as failed call of that target
+    :param allow_partial: If False, the first failed call fails everything. Otherwise the reducer decides
+    :param api_obj: API object shared by all calls
+    :param scope: Manual scope if no API obj is provided
+    :return: Result of the reducer
+    :raises RemoteOfflineException: If there is no live target
+    """
+    args = [] if args is None else list(args)
+    kwargs = {} if kwargs is None else kwargs
+    if not _memory.plugin_system_active:
+        raise Exception("Plugin system not initialized")
+    plugin_entry = get_function_entry_by_name(function_name, plugin_name)
+    utils.is_valid_call(plugin_entry, args, kwargs)
+    if isinstance(reducer, str):
+        reducer = REDUCERS[reducer]
+    if not api_obj:
+        api_obj = _get_api_obj(function_name, args, kwargs, scope)
+    replicas = get_targets(plugin_entry, targets)
+    if not replicas:
+        raise RemoteOfflineException(f"No live target for '{function_name}'", plugin_name=plugin_entry["plugin_name"])
+
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def call_target(replica):
+        if semaphore:
+            await semaphore.acquire()
+        try:
+            fut = await _execute(plugin_entry, args, kwargs, api_obj, return_future=True, timeout=timeout,
+                                 replica=replica)
+            return await asyncio.wait_for(fut, timeout) if timeout else await fut
+        except asyncio.TimeoutError:
+            raise RemoteTimeoutException(f"'{function_name}' did not answer within {timeout} seconds",
+                                         plugin_name=plugin_entry["plugin_name"])
+        finally:
+            if semaphore:
+                semaphore.release()
+
+    tasks = {asyncio.create_task(call_target(replica)): replica for replica in replicas}
+    pending = set(tasks)
+    outcomes = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                exception = task.exception()
+                if exception is not None and not allow_partial:
+                    raise exception
+                outcomes.append({"target": tasks[task], "exception": exception,
+                                 "result": None if exception is not None else task.result()})
+                ret = reducer(outcomes, len(replicas))
+                if ret is not PENDING:
+                    return ret
+    finally:
+        # remaining calls are not needed anymore
+        for task in pending:
+            task.cancel()
+        # failures finishing together with the one that was raised would be logged as never retrieved
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()
+    raise RuntimeError("Reducer did not return a result after all targets answered")
@@ -0,0 +1,251 @@
+"""
+Executor made of lanes, i.e. single worker executors, that are scheduled individually.
+
+Used instead of a plain pool if calls should stick to a worker (settings.WORKER_AFFINITY) or the number of workers
+should follow the load (settings.AUTOSCALE_MAX_WORKERS).
+
+Workers often build expensive per-worker state (see worker_init and worker_context). With a shared pool, consecutive
+calls of the same user land on a random worker and can't reuse it. Here keyed calls go to the lane their key hashes
+to. Unkeyed calls, and keyed calls whose lane is saturated, wait in a shared queue that is served by whichever lane
+becomes free first.
+Lanes are added while calls pile up in the shared queue and removed once they have been idle for a while. worker_init
+runs in every new worker only.
+Process workers that leak memory can be recycled: once a lane hits a task count, memory or age limit, its worker is
+replaced before the next call.
+"""
+import collections
+import concurrent.futures
+import functools
+import itertools
+import logging
+import threading
+import time
+
+import psutil
+
+from rixaplugin import settings
+from rixaplugin.internal.memory import _memory
+
+core_log = logging.getLogger("rixa.core")
+
+_AUTOSCALE_INTERVAL = 0.25
+
+
+class Lane:
+    def __init__(self, lane_id, executor):
+        self.id = lane_id
+        self.executor = executor
+        self.backlog = collections.deque()
+        self.running = None
+        self.idle_since = time.monotonic()
+        self.tasks = 0
+        self.started = time.monotonic()
+
+    def load(self):
+        return len(self.backlog) + (self.running is not None)
+
+    def recycle_reason(self):
+        """
+        :return: Limit of settings.WORKER_MAX_TASKS/WORKER_MAX_RSS/WORKER_MAX_AGE the worker has reached, else None
+        """
+        if settings.WORKER_MAX_TASKS and self.tasks >= settings.WORKER_MAX_TASKS:
+            return "tasks"
+        if settings.WORKER_MAX_AGE and time.monotonic() - self.started >= settings.WORKER_MAX_AGE:
+            return "age"
+        if settings.WORKER_MAX_RSS and self.executor.processes:
+            # the worker process is only started with the first call
+            for pid in self.executor.worker_pids():
+                try:
+                    if psutil.Process(pid).memory_info().rss >= settings.WORKER_MAX_RSS * 2 ** 20:
+                        return "memory"
+                except psutil.NoSuchProcess:
+                    pass
+        return None
+
+
+class LaneExecutor(concurrent.futures.Executor):
+    """
+    Routes calls to a consistent worker by key, with fallback to any free worker once that one is saturated.
+    Optionally grows and shrinks between a minimum and maximum number of workers.
+
+    Offers the same counting interface as CountingThreadPoolExecutor/CountingProcessPoolExecutor.
+    """
+
+    def __init__(self, lane_factory, num_lanes, max_lanes=None, recycle=False):
+        """
+        :param lane_factory: Returns a new single worker executor i.e. a lane
+        :param num_lanes: Number of workers. Minimum if autoscaling
+        :param max_lanes: Number of workers up to which the executor grows. None or num_lanes disables autoscaling
+        :param recycle: Replace workers that reached a limit of settings.WORKER_MAX_TASKS/WORKER_MAX_RSS/WORKER_MAX_AGE
+        """
+        self._lane_factory = lane_factory
+        self._lane_ids = itertools.count()
+        self.lanes = [Lane(next(self._lane_ids), lane_factory()) for _ in range(num_lanes)]
+        self.processes = self.lanes[0].executor.processes
+        self.min_lanes = num_lanes
+        self.max_lanes = max(num_lanes, max_lanes or num_lanes)
+        self.recycle = recycle
+        self._shared = collections.deque()
+        self._lock = threading.RLock()
+        self._shutdown = False
+        self.metrics = collections.Counter()
+        if self.max_lanes > self.min_lanes:
+            self._schedule_autoscale()
+
+    def submit(self, fn, api_obj=None, key=None):
+        """
+        :param fn: Callable without arguments
+        :param api_obj: API object of the call. Process lanes need it.
+        :param key: Affinity key. None for calls that may run on any worker
+        :return: concurrent.futures.Future
+        """
+        future = concurrent.futures.Future()
+        future.add_done_callback(self._call_cancelled)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot schedule new calls after shutdown")
+            lane = self._route(key)
+            if lane:
+                lane.backlog.append((future, fn, api_obj, time.monotonic()))
+            else:
+                self._shared.append((future, fn, api_obj, time.monotonic()))
+            self._dispatch()
+            if len(self._shared) >= settings.AUTOSCALE_QUEUE_LENGTH:
+                self._grow()
+        return future
+
+    def _route(self, key):
+        if key is None:
+            if settings.WORKER_AFFINITY:
+                self.metrics["affinity_unkeyed"] += 1
+            return None
+        try:
+            hash(key)
+        except TypeError:
+            key = repr(key)
+        # rendezvous hashing. Keys only move if their lane is removed or a new lane outranks it
+        lane = max(self.lanes, key=lambda lane: hash((key, lane.id)))
+        if lane.load() < settings.AFFINITY_SPILL_LOAD:
+            self.metrics["affinity_hits"] += 1
+            return lane
+        self.metrics["affinity_spills"] += 1
+        return None
+
+    def _dispatch(self):
+        for lane in self.lanes:
+            while lane.running is None and (lane.backlog or self._shared):
+                future, fn, api_obj, enqueued = (lane.backlog or self._shared).popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if self.recycle:
+                    self._recycle_if_due(lane)
+                lane.tasks += 1
+                lane.running = lane.executor.submit(fn, api_obj)
+                lane.running.add_done_callback(functools.partial(self._call_done, lane, future))
+
+    @staticmethod
+    def _call_cancelled(future):
+        if future.cancelled():
+            # cancelled while queued here. Lanes only count calls that reached them
+            _memory.tasks_in_system -= 1
+
+    def _call_done(self, lane, future, lane_future):
+        # runs in a thread of the lane
+        with self._lock:
+            lane.running = None
+            lane.idle_since = time.monotonic()
+            if not self._shutdown:
+                self._dispatch()
+        if lane_future.cancelled():
+            # lane was shut down
+            future.set_exception(concurrent.futures.CancelledError())
+            return
+        exception = lane_future.exception()
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(lane_future.result())
+
+    def _recycle_if_due(self, lane):
+        # the lane is idle, i.e. the old worker has finished its last call and simply exits
+        reason = lane.recycle_reason()
+        if not reason:
+            return
+        core_log.info(f"Recycling worker after {lane.tasks} calls and {time.monotonic() - lane.started:.0f}s "
+                      f"(limit: {reason})")
+        lane.executor.shutdown(wait=False)
+        lane.executor = self._lane_factory()
+        lane.tasks = 0
+        lane.started = time.monotonic()
+        self.metrics["workers_recycled"] += 1
+        self.metrics[f"workers_recycled_{reason}"] += 1
+
+    def _grow(self):
+        # one lane per queued call, workers start in the background
+        waiting = sum(1 for item in self._shared if not item[0].cancelled())
+        added = min(waiting, self.max_lanes - len(self.lanes))
+        if added <= 0:
+            return
+        for _ in range(added):
+            self.lanes.append(Lane(next(self._lane_ids), self._lane_factory()))
+        self.metrics["workers_added"] += added
+        core_log.info(f"Added {added} worker(s) for {waiting} queued calls, now {len(self.lanes)}")
+        self._dispatch()
+
+    def _shrink(self):
+        now = time.monotonic()
+        for lane in list(self.lanes):
+            if len(self.lanes) <= self.min_lanes:
+                return
+            if lane.running is None and not lane.backlog and now - lane.idle_since >= settings.AUTOSCALE_IDLE_TIME:
+                self.lanes.remove(lane)
+                lane.executor.shutdown(wait=False)
+                self.metrics["workers_removed"] += 1
+                core_log.info(f"Removed idle worker, now {len(self.lanes)}")
+
+    def _autoscale(self):
+        with self._lock:
+            if self._shutdown:
+                return
+            if self._shared and time.monotonic() - self._shared[0][3] >= settings.AUTOSCALE_QUEUE_WAIT:
+                self._grow()
+            self._shrink()
+        self._schedule_autoscale()
+
+    def _schedule_autoscale(self):
+        _memory.expiry.schedule((self, "autoscale"), _AUTOSCALE_INTERVAL, self._autoscale)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            queued = list(self._shared) + [item for lane in self.lanes for item in lane.backlog]
+            self._shared.clear()
+            for lane in self.lanes:
+                lane.backlog.clear()
+        for future, fn, api_obj, enqueued in queued:
+            future.cancel()
+        for lane in self.lanes:
+            lane.executor.shutdown(wait=wait)
+
+    def get_api(self, request_id):
+        for lane in self.lanes:
+            if request_id in lane.executor.apis:
+                return lane.executor.apis[request_id]
+        raise KeyError(request_id)
+
+    def get_max_task_count(self):
+        return len(self.lanes)
+
+    def get_task_count(self):
+        return self.get_queued_task_count() + self.get_active_task_count()
+
+    def get_queued_task_count(self):
+        with self._lock:
+            queued = list(self._shared) + [item for lane in self.lanes for item in lane.backlog]
+        return sum(1 for item in queued if not item[0].cancelled())
+
+    def get_active_task_count(self):
+        return sum(1 for lane in self.lanes if lane.running is not None)
+
+    def get_free_worker_count(self):
+        return sum(1 for lane in self.lanes if lane.running is None)
@@ -1,11 +1,14 @@
 import hashlib
 import importlib
+import json
 import os.path
 import pprint
 import subprocess
 import sys
 import threading
 
+import msgpack
+
 from rixaplugin.pylot.proxy_builder import create_module
 from rixaplugin.pylot.python_parsing import generate_python_doc
 import zmq.asyncio as aiozmq
@@ -48,6 +51,47 @@ def get_function_entry(function_name, plugin_id):
     raise FunctionNotFoundException(function_name)
 
 
+def signature_hash(plugin):
+    """
+    Content hash of a sendable plugin signature. Equal signatures have equal hashes, also across restarts.
+
+    :param plugin: Entry of get_sendable_plugins
+    :return: Hash as hex string
+    """
+    content = {k: v for k, v in plugin.items() if k not in ("active_tasks", "is_alive")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def interface_hash(plugin):
+    """
+    Hash of the part of a plugin signature callers rely on, i.e. its functions and their parameters.
+
+    Unlike signature_hash, ids, tags and pointer types are left out, as they differ between remotes serving the same
+    plugin.
+    :param plugin: Plugin signature as sent by a remote
+    :return: Hash as hex string
+    """
+    functions = []
+    for function in plugin["functions"]:
+        content = {k: v for k, v in function.items() if k not in ("id", "plugin_id", "type", "tags")}
+        content["generator"] = bool(function.get("type", 0) & FunctionPointerType.GENERATOR)
+        functions.append(content)
+    return signature_hash({"name": plugin["name"], "functions": sorted(functions, key=lambda i: i["name"])})
+
+
+def diff_signatures(hashes, known_hashes):
+    """
+    Compare the current plugin signatures with those a peer already has.
+
+    :param hashes: Hashes of the signatures the peer should have (plugin id -> signature_hash)
+    :param known_hashes: Hashes of the signatures the peer has
+    :return: Tuple of (ids of added or changed plugins, ids of removed plugins)
+    """
+    changed = [k for k in hashes if known_hashes.get(k) != hashes[k]]
+    removed = [k for k in known_hashes if k not in hashes]
+    return changed, removed
+
+
 def get_plugin_id(plugin_name):
     plugin_id = None
     for i in _memory.plugins.values():
@@ -98,6 +142,9 @@ class PluginMemory:
         self.plugin_system_active = False
         self.mode = None
         self.executor = None
+        # named executors (settings.EXECUTORS) and the ones picked per plugin (settings.PLUGIN_EXECUTORS)
+        self.executors = {}
+        self.plugin_executors = {}
         self.global_init = []
         self.worker_init = []
         self.listener_socket = None
@@ -112,6 +159,12 @@ class PluginMemory:
         self.auth = None
 
         self.tasks_in_system = 0
+        # (plugin name, function name) -> utils.RollingLatency of local executions
+        self.function_stats = {}
+        # (remote_id, skip, ALLOW_NETWORK_RELAY) -> sendable plugins, their hashes and msgpack encoding
+        self._sendable_cache = {}
+        # deadlines for dropping api objects, stale pending requests etc. of all network adapters and worker pools
+        self.expiry = utils.ExpiryService(core_log)
 
         self.connected_clients = []
 
@@ -121,12 +174,24 @@ class PluginMemory:
         self.ID = hex_dig[:16]
 
         # self.ID = secrets.token_hex(8)
+        # unlike ID, this differs between processes and restarts. Used to tell replicas from reconnects
+        self.instance_id = secrets.token_hex(8)
+        self.request_ids = utils.RequestIdAllocator(self.ID)
         self.max_queue = settings.MAX_QUEUE_SIZE
         self.allow_remote_functions = True if settings.ACCEPT_REMOTE_PLUGINS != 0 else False
         self.remote_dummy_modules = {}
         self.version = get_git_commit_hash()
 
+    def new_request_id(self, fname=None, args=(), kwargs=None):
+        """
+        Allocate a request id, unique across processes and network hops. See utils.RequestIdAllocator.
+
+        :param fname: Function name, only used for readable ids (settings.VERBOSE_REQUEST_ID)
+        """
+        return self.request_ids.new(fname, args, kwargs)
+
     def add_function(self, signature_dict, id=None, fn_type=FunctionPointerType.LOCAL):
+        self.invalidate_sendable_plugins()
         if not id:
             id = self.ID
         self.function_list.append(signature_dict)
@@ -145,6 +210,7 @@ class PluginMemory:
             self.plugins[plugin_id] = plugin
 
     def rename_plugin(self, old_name, new_name):
+        self.invalidate_sendable_plugins()
         plugin_id = get_plugin_id(old_name)
         if plugin_id:
             self.plugins[plugin_id]["name"] = new_name
@@ -155,6 +221,7 @@ class PluginMemory:
 
 
     def add_variable(self, plugin_var):
+        self.invalidate_sendable_plugins()
         plugin_id = get_plugin_id(plugin_var._plugin_name)
         if plugin_id:
             plugin = self.plugins[plugin_id]
@@ -181,9 +248,22 @@ class PluginMemory:
                 variables[plugin["name"]] = plugin_variables
         return variables
 
-    def add_plugin(self, plugin_dict, identity, remote_origin, origin_is_client=False, tags=None):
+    def add_plugin(self, plugin_dict, identity, remote_origin, origin_is_client=False, tags=None, instance=None):
+        """
+        Add remote plugins.
+
+        A plugin with the same name as an existing remote plugin becomes a replica of it, unless it comes from the
+        same connection or instance. Then it replaces the old replica (update or reconnect).
+        Plugins whose functions differ from those of the existing replicas (see interface_hash) are refused.
+        :param plugin_dict: Plugin signatures as sent by the remote
+        :param identity: Identity of the remote on remote_origin
+        :param remote_origin: Network adapter of the connection
+        :param instance: Instance id of the remote process, if known
+        :return: Previous identity of the remote if it reconnected with a new one
+        """
         if not self.allow_remote_functions:
             return
+        self.invalidate_sendable_plugins()
 
         local_plugin_names = [i["name"] for i in self.plugins.values() if i["type"] & FunctionPointerType.LOCAL]
 
@@ -196,15 +276,39 @@ class PluginMemory:
                 core_log.warning(f"Plugin '{i['name']}' already exists locally. Skipping...")
                 to_pop.append(ID)
                 continue
-            if i["id"] in self.plugins:
+            replica = {"id": i["id"], "remote_id": identity, "remote_origin": remote_origin, "instance": instance,
+                       "is_alive": True, "active_tasks": 0, "latency": utils.RollingLatency(),
+                       "interface": interface_hash(i)}
+            existing = next((j for j in self.plugins.values() if j["name"] == i["name"] and "replicas" in j), None)
+            if existing:
+                for old in existing["replicas"]:
+                    same_connection = old["remote_origin"] is remote_origin and old["remote_id"] == identity
+                    if same_connection or (instance is not None and old["instance"] == instance):
+                        if old["remote_id"] != identity:
+                            updated_remote_id = old["remote_id"]
+                        existing["replicas"].remove(old)
+                        break
+                if existing["replicas"]:
+                    if existing["replicas"][0]["interface"] != replica["interface"]:
+                        core_log.warning(f"Plugin '{i['name']}' of {identity} has other functions or parameters than "
+                                         f"the known replicas. Not used as replica.")
+                        to_pop.append(ID)
+                        continue
+                    existing["replicas"].append(replica)
+                    self._sync_replicas(existing)
+                    core_log.debug(f"Plugin '{i['name']}' has {len(existing['replicas'])} replicas")
+                    to_pop.append(ID)
+                    continue
                 core_log.debug(f"Plugin '{i['name']}' updated")
-                updated_remote_id = self.plugins[i["id"]]["remote_id"]
-                del self.plugins[i["id"]]
+                del self.plugins[existing["id"]]
                 self.function_list = [j for j in self.function_list if j["plugin_name"] != i["name"]]
             new_names.append(i["name"])
             i["id"] = i["id"]  # identity
             i["remote_id"] = identity
             i["remote_origin"] = remote_origin
+            i["replicas"] = [replica]
+            i["active_tasks"] = 0
+            i["is_alive"] = True
             if tags:
                 i["tags"] = tags
             if origin_is_client:
@@ -212,7 +316,7 @@ class PluginMemory:
             else:
                 i["type"] |= FunctionPointerType.SERVER
             for j in i["functions"]:
-                j["type"] = i["type"]
+                j["type"] = FunctionPointerType(i["type"] | (j.get("type", 0) & FunctionPointerType.GENERATOR))
                 j["id"] = i["id"]  # identity
                 j["remote_id"] = identity
                 j["remote_origin"] = remote_origin
@@ -241,11 +345,87 @@ class PluginMemory:
 
     def delete_plugin(self, plugin_id):
         if plugin_id in self.plugins:
+            self.invalidate_sendable_plugins()
             # plugin_id = get_plugin_id(name)
             # return
             del self.plugins[plugin_id]
             self.function_list = [i for i in self.function_list if i["plugin_id"] != plugin_id]
 
+    def set_remote_alive(self, remote_origin, remote_id, alive):
+        """
+        Mark all plugin replicas reached via a connection as alive or offline.
+
+        A plugin is alive as long as one of its replicas is.
+        :param remote_origin: Network adapter of the connection
+        :param remote_id: Identity of the remote on that adapter
+        :param alive: New state
+        :return: Names of the plugins whose replica changed state
+        """
+        changed = []
+        for plugin in self.plugins.values():
+            for replica in plugin.get("replicas", []):
+                if replica["remote_origin"] is not remote_origin or replica["remote_id"] != remote_id:
+                    continue
+                if replica["is_alive"] != alive:
+                    replica["is_alive"] = alive
+                    changed.append(plugin["name"])
+                    self._sync_replicas(plugin)
+        if changed:
+            self.invalidate_sendable_plugins()
+            core_log.info(f"Plugins {'online' if alive else 'offline'}: {', '.join(changed)}")
+        return changed
+
+    def remove_remote(self, remote_origin, remote_id=None, plugin_ids=None):
+        """
+        Remove all plugin replicas of a connection. Plugins without replicas left are deleted.
+
+        :param remote_origin: Network adapter of the connection
+        :param remote_id: Identity of the remote. If None, all remotes of remote_origin are removed
+        :param plugin_ids: Only remove the replicas of these plugins (ids as sent by the remote)
+        """
+        self.invalidate_sendable_plugins()
+        for plugin in list(self.plugins.values()):
+            if "replicas" not in plugin:
+                continue
+            plugin["replicas"] = [i for i in plugin["replicas"] if not (
+                    i["remote_origin"] is remote_origin and (remote_id is None or i["remote_id"] == remote_id)
+                    and (plugin_ids is None or i["id"] in plugin_ids))]
+            if plugin["replicas"]:
+                self._sync_replicas(plugin)
+            else:
+                self.delete_plugin(plugin["id"])
+
+    def get_remote_plugin_ids(self, remote_origin, remote_id):
+        """
+        :return: Ids (as sent by the remote) of the plugins served via a connection
+        """
+        return {replica["id"] for plugin in self.plugins.values() for replica in plugin.get("replicas", [])
+                if replica["remote_origin"] is remote_origin and replica["remote_id"] == remote_id}
+
+    def refresh_remote(self, remote_origin, remote_id, instance=None):
+        """
+        Mark the replicas of a connection as alive after reconnecting and take over the new instance id.
+
+        Used when the plugins of a reconnected remote are unchanged and therefore not sent again.
+        """
+        self.invalidate_sendable_plugins()
+        for plugin in self.plugins.values():
+            for replica in plugin.get("replicas", []):
+                if replica["remote_origin"] is remote_origin and replica["remote_id"] == remote_id:
+                    replica["instance"] = instance
+                    replica["is_alive"] = True
+                    self._sync_replicas(plugin)
+
+    @staticmethod
+    def _sync_replicas(plugin):
+        # plugin level fields reflect the replicas. remote_id/remote_origin point to a live replica if possible
+        replicas = plugin["replicas"]
+        plugin["is_alive"] = any(i["is_alive"] for i in replicas)
+        first = next((i for i in replicas if i["is_alive"]), replicas[0])
+        for entry in [plugin] + plugin["functions"]:
+            entry["remote_id"] = first["remote_id"]
+            entry["remote_origin"] = first["remote_origin"]
+
     def force_shutdown(self):
         core_log.error("Force shutdown of plugin system! This should not happen!")
 
@@ -264,7 +444,8 @@ class PluginMemory:
     def delete_connection(self, con):
         with self.lock:
             con.close()
-            self._client_connections.remove(con)
+            # a connection may be deleted explicitly and again by its owner's __del__
+            self._client_connections.discard(con)
 
     def find_function_by_name(self, func_name):
         for i in self.function_list:
@@ -310,6 +491,11 @@ class PluginMemory:
         # w_counts = self.executor.get_free_and_active_worker_count()
         readable_str += f"{_memory.executor.get_active_task_count()}/{_memory.executor.get_max_task_count()} tasks running\n" if self.executor else "No executor\n"
         readable_str += f"{_memory.executor.get_queued_task_count()} tasks additional tasks queued\n" if self.executor else ""
+        if getattr(self.executor, "metrics", None):
+            readable_str += "Executor: " + ", ".join(f"{k} {v}" for k, v in sorted(self.executor.metrics.items())) + "\n"
+        for name, executor in self.executors.items():
+            readable_str += (f"{name}: {executor.get_active_task_count()}/{executor.get_max_task_count()} tasks "
+                             f"running, {executor.get_queued_task_count()} queued\n")
         # readable_str += "Max queue size: " + str(self.max_queue) + "\n" if self.executor else ""
         readable_str += "\nPlugins:\n" + self.pretty_print_plugins()
         return readable_str
@@ -359,7 +545,58 @@ class PluginMemory:
         readable_str += self._pretty_print_plugin(entry, include_docstr=include_docstr)
         return readable_str
 
+    def invalidate_sendable_plugins(self):
+        """
+        Drop the cached sendable plugins. Has to be called whenever plugins are added, removed or change state.
+        """
+        self._sendable_cache.clear()
+
+    def _get_sendable_entry(self, remote_id, skip):
+        key = (remote_id, frozenset(skip or ()), settings.ALLOW_NETWORK_RELAY)
+        entry = self._sendable_cache.get(key)
+        if entry is None:
+            # every peer skips its own plugins, hence there is one key per distinct plugin set of the peers
+            if len(self._sendable_cache) > 64:
+                self._sendable_cache.clear()
+            plugins = self._build_sendable_plugins(remote_id, skip)
+            entry = {"plugins": plugins, "hashes": {k: signature_hash(v) for k, v in plugins.items()}, "packed": {}}
+            self._sendable_cache[key] = entry
+        return entry
+
     def get_sendable_plugins(self, remote_id=-1, skip=None):
+        """
+        Plugin signatures without local data (pointers, connections etc.), as sent to peers.
+
+        The result is cached until plugins change. Do not modify it.
+        :param remote_id: Skip the plugin with this id
+        :param skip: Skip plugins with these ids
+        :return: Dict of plugin id -> signature
+        """
+        return self._get_sendable_entry(remote_id, skip)["plugins"]
+
+    def get_signature_hashes(self, remote_id=-1, skip=None):
+        """
+        :return: Dict of plugin id -> signature_hash for get_sendable_plugins with the same arguments
+        """
+        return self._get_sendable_entry(remote_id, skip)["hashes"]
+
+    def get_packed_plugins(self, plugin_ids=None, remote_id=-1, skip=None):
+        """
+        msgpack encoded signatures of get_sendable_plugins with the same arguments. Each plugin is encoded only once.
+
+        :param plugin_ids: Only return these plugins. Defaults to all
+        :return: Dict of plugin id -> msgpack bytes
+        """
+        entry = self._get_sendable_entry(remote_id, skip)
+        if plugin_ids is None:
+            plugin_ids = entry["plugins"].keys()
+        packed = entry["packed"]
+        for plugin_id in plugin_ids:
+            if plugin_id not in packed:
+                packed[plugin_id] = msgpack.packb(entry["plugins"][plugin_id])
+        return {plugin_id: packed[plugin_id] for plugin_id in plugin_ids}
+
+    def _build_sendable_plugins(self, remote_id=-1, skip=None):
         if skip is None:
             skip = []
         sendable_dict = {}
@@ -375,6 +612,7 @@ class PluginMemory:
                 continue
 
             sendable_plugin = value.copy()
+            sendable_plugin.pop("replicas", None)
             if sendable_plugin["type"] & FunctionPointerType.LOCAL:
                 sendable_plugin["type"] = FunctionPointerType.REMOTE
             elif sendable_plugin["type"] & FunctionPointerType.REMOTE:
@@ -396,10 +634,12 @@ class PluginMemory:
                 j.pop("pointer", None)
                 j.pop("remote_id", None)
                 j.pop("remote_origin", None)
+                # generators stay generators, the receiver needs to expect a stream
+                generator = j["type"] & FunctionPointerType.GENERATOR
                 if j["type"] & FunctionPointerType.LOCAL:
-                    j["type"] = FunctionPointerType.REMOTE
+                    j["type"] = FunctionPointerType.REMOTE | generator
                 elif j["type"] & FunctionPointerType.REMOTE:
-                    j["type"] = FunctionPointerType.INDIRECT | FunctionPointerType.REMOTE
+                    j["type"] = FunctionPointerType.INDIRECT | FunctionPointerType.REMOTE | generator
 
         sendable_dict = {k: v for k, v in sendable_dict.items() if v["functions"]}
 
@@ -529,6 +769,8 @@ class PluginMemory:
             try:
                 if self.executor:
                     self.executor.shutdown()
+                for executor in self.executors.values():
+                    executor.shutdown()
                 if self.listener_socket:
                     self.listener_socket.close()
                 for i in self._client_connections:
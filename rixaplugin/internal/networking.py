@@ -1,26 +1,46 @@
+import functools
 import os
+import socket
 import pickle
+import random
+import time
 
 import msgpack
 import msgpack_numpy
+import numpy as np
 from zmq.auth import Authenticator
 from zmq.auth.asyncio import AsyncioAuthenticator
 
 import rixaplugin.internal.rixalogger
 from rixaplugin.internal import utils
-from rixaplugin.internal.memory import _memory
-from rixaplugin.data_structures.enums import HeaderFlags
+from rixaplugin.internal.memory import _memory, diff_signatures
+from rixaplugin.data_structures.enums import HeaderFlags, FunctionPointerType
+from rixaplugin.internal.streaming import ResultStream
 
 import zmq.auth
 
 from rixaplugin.data_structures.rixa_exceptions import RemoteException, RemoteTimeoutException, \
-    RemoteUnavailableException
+    RemoteUnavailableException, QueueOverflowException, DeadlineExceededException
 from rixaplugin.internal.utils import *
 import asyncio
 import zmq
 
 import pandas as pd
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+import zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 msgpack_numpy.patch()
 # logging.basicConfig(level=logging.DEBUG)
 network_log = logging.getLogger("rixa.plugin_net")
@@ -34,8 +54,48 @@ import msgpack_numpy as m
 # Register numpy support
 m.patch()
 from pyalm.internal.state import ConversationTracker
-def encode_custom(obj):
+
+DATAFRAME_EXT_TYPE = 1
+"""msgpack ExtType code for pandas DataFrames encoded as Arrow IPC stream"""
+
+PACKED_EXT_TYPE = 2
+"""msgpack ExtType code for values that were msgpack encoded in advance, e.g. cached plugin signatures"""
+
+OOB_EXT_TYPE = 3
+"""msgpack ExtType code for the placeholder of a value sent as out-of-band frame"""
+
+
+def _dataframe_to_arrow(df):
+    """
+    :return: Arrow IPC stream of df, None if Arrow can't represent it (e.g. a column with mixed types)
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        network_log.debug(f"DataFrame not convertible to Arrow, sending it as dict: {e}")
+        return None
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _arrow_to_dataframe(buf):
+    if pa is None:
+        raise ImportError("Received a dataframe in Arrow format, but pyarrow is not installed.")
+    return pa.ipc.open_stream(pa.py_buffer(buf)).read_all().to_pandas()
+
+
+def encode_custom(obj, arrow=False):
+    """
+    msgpack default hook.
+
+    :param arrow: Encode DataFrames in Arrow format. Only if the receiver has pyarrow (see ARROW in the handshake)
+    """
     if isinstance(obj, pd.DataFrame):
+        buf = _dataframe_to_arrow(obj) if arrow else None
+        if buf is not None:
+            return msgpack.ExtType(DATAFRAME_EXT_TYPE, buf.to_pybytes())
         return {
             '__pandas_dataframe__': True,
             'data': obj.to_dict(orient='split')
@@ -56,6 +116,256 @@ def decode_custom(obj):
     return obj
 
 
+def _oob_placeholder(index, kind, dtype=None, shape=None):
+    return msgpack.ExtType(OOB_EXT_TYPE, msgpack.packb([index, kind, dtype, shape]))
+
+
+def _load_oob(data, buffers):
+    index, kind, dtype, shape = msgpack.unpackb(data)
+    if buffers is None or index >= len(buffers):
+        raise ValueError(f"Message refers to out-of-band frame {index}, which was not received.")
+    frame = buffers[index]
+    buf = frame.buffer if isinstance(frame, zmq.Frame) else frame
+    if kind == 'ndarray':
+        return np.frombuffer(buf, dtype=np.dtype(dtype)).reshape(shape)
+    if kind == 'arrow':
+        return _arrow_to_dataframe(buf)
+    return frame.bytes if isinstance(frame, zmq.Frame) else bytes(frame)
+
+
+def decode_ext(code, data, buffers=None):
+    if code == DATAFRAME_EXT_TYPE:
+        return _arrow_to_dataframe(data)
+    if code == PACKED_EXT_TYPE:
+        return msgpack.unpackb(data, object_hook=decode_custom, ext_hook=decode_ext)
+    if code == OOB_EXT_TYPE:
+        return _load_oob(data, buffers)
+    return msgpack.ExtType(code, data)
+
+
+def packed_signatures(plugin_ids=None, remote_id=-1, skip=None):
+    """
+    Plugin signatures ready to be put into a message, without encoding them again.
+
+    See PluginMemory.get_packed_plugins for the arguments.
+    :return: Dict of plugin id -> msgpack ExtType, unpacked transparently by the receiver
+    """
+    packed = _memory.get_packed_plugins(plugin_ids, remote_id=remote_id, skip=skip)
+    return {k: msgpack.ExtType(PACKED_EXT_TYPE, v) for k, v in packed.items()}
+
+
+# only these message fields can contain user data. Everything else is protocol and never large.
+_PAYLOAD_FIELDS = ("args", "kwargs", "return", "calls", "returns")
+
+
+def _extract_buffer(obj, buffers, arrow=False):
+    """
+    Replace a large array or buffer by a small descriptor and move it to the list of out-of-band frames.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.nbytes < settings.ZERO_COPY_THRESHOLD or obj.dtype.hasobject or obj.dtype.fields is not None:
+            return obj
+        if not obj.flags.c_contiguous:
+            obj = np.ascontiguousarray(obj)
+        buffers.append(obj)
+        return _oob_placeholder(len(buffers) - 1, "ndarray", obj.dtype.str, list(obj.shape))
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        if memoryview(obj).nbytes < settings.ZERO_COPY_THRESHOLD:
+            return obj
+        buffers.append(obj)
+        return _oob_placeholder(len(buffers) - 1, "bytes")
+    if isinstance(obj, pd.DataFrame) and arrow:
+        buf = _dataframe_to_arrow(obj)
+        if buf is None:
+            return obj
+        if buf.size < settings.ZERO_COPY_THRESHOLD:
+            return msgpack.ExtType(DATAFRAME_EXT_TYPE, buf.to_pybytes())
+        buffers.append(buf)
+        return _oob_placeholder(len(buffers) - 1, "arrow")
+    return obj
+
+
+def _might_hold_buffers(obj, arrow):
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes >= settings.ZERO_COPY_THRESHOLD
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return memoryview(obj).nbytes >= settings.ZERO_COPY_THRESHOLD
+    return arrow and isinstance(obj, pd.DataFrame)
+
+
+def _payload_values(data):
+    # values of the payload fields and their direct items, i.e. where large arrays usually are
+    for key in _PAYLOAD_FIELDS:
+        if key not in data:
+            continue
+        value = data[key]
+        if key in ("calls", "returns"):
+            for entry in value:
+                yield from _payload_values(entry)
+            continue
+        yield value
+        if isinstance(value, (list, tuple)):
+            yield from value
+        elif isinstance(value, dict):
+            yield from value.values()
+
+
+def serialize(data, arrow=False):
+    """
+    Serialize a message into zmq frames.
+
+    The first frame is the msgpack encoded message. Large arrays/buffers in the payload fields are not packed,
+    but appended as additional frames which zmq can send without copying them.
+    Do not modify arrays after they have been passed to the network layer until the message is sent.
+    :param data: Message dict
+    :param arrow: Encode DataFrames in Arrow format, see encode_custom
+    :return: List of frames
+    """
+    default = functools.partial(encode_custom, arrow=arrow)
+    if not settings.ZERO_COPY_THRESHOLD:
+        return [msgpack.packb(data, default=default)]
+    header = None
+    if not any(_might_hold_buffers(i, arrow) for i in _payload_values(data)):
+        # a buffer over the threshold anywhere in the message makes the message at least that large. Only larger
+        # messages have to be searched for buffers.
+        header = msgpack.packb(data, default=default)
+        if len(header) < settings.ZERO_COPY_THRESHOLD:
+            return [header]
+    buffers = []
+    extract = functools.partial(_extract_buffer, buffers=buffers, arrow=arrow)
+    data = {k: utils.map_structure(v, extract) if k in _PAYLOAD_FIELDS else v for k, v in data.items()}
+    if not buffers and header is not None:
+        return [header]
+    return [msgpack.packb(data, default=default)] + buffers
+
+
+def deserialize(frames):
+    """
+    Reconstruct a message from the frames created by serialize.
+
+    Out-of-band arrays are reconstructed as views on the received frames i.e. without copying.
+    :param frames: List of zmq.Frame or bytes
+    :return: Message
+    """
+    header = frames[0]
+    header = header.buffer if isinstance(header, zmq.Frame) else header
+    ext_hook = functools.partial(decode_ext, buffers=frames[1:])
+    msg = msgpack.unpackb(header, object_hook=decode_custom, ext_hook=ext_hook)
+    if isinstance(msg, dict) and msg.get("HEAD") == HeaderFlags.COMPRESSED:
+        if msg["algo"] not in COMPRESSORS:
+            raise ValueError(f"Received message compressed with {msg['algo']}, which is not installed.")
+        msg = msgpack.unpackb(COMPRESSORS[msg["algo"]][1](msg["payload"]), object_hook=decode_custom,
+                              ext_hook=ext_hook)
+    return msg
+
+
+def _get_compressors():
+    compressors = {"zlib": (zlib.compress, zlib.decompress)}
+    if lz4 is not None:
+        compressors["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+    if zstandard is not None:
+        compressors["zstd"] = (zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress)
+    return compressors
+
+
+COMPRESSORS = _get_compressors()
+"""Installed compression algorithms as name: (compress, decompress)"""
+
+
+def supported_compression():
+    """
+    :return: Names of the enabled and installed compression algorithms in order of preference
+    """
+    return [i for i in settings.COMPRESSION_ALGORITHMS if i in COMPRESSORS]
+
+
+def negotiate_compression(offered):
+    """
+    Choose the compression algorithm of a connection.
+
+    :param offered: Algorithms offered by the remote in its order of preference
+    :return: First offered algorithm that is also supported locally or None
+    """
+    supported = supported_compression()
+    for algo in offered or []:
+        if algo in supported:
+            return algo
+    return None
+
+
+def compress(frames, algo):
+    """
+    Compress the message frame if it is larger than settings.COMPRESSION_THRESHOLD.
+
+    The compressed message is wrapped into a COMPRESSED message. Out-of-band frames are left untouched.
+    :param frames: Frames as created by serialize
+    :param algo: Negotiated algorithm. If None, frames are returned as they are
+    :return: List of frames
+    """
+    header = frames[0]
+    if not algo or len(header) < settings.COMPRESSION_THRESHOLD:
+        return frames
+    compressed = COMPRESSORS[algo][0](header)
+    if len(compressed) >= len(header):
+        return frames
+    envelope = msgpack.packb({"HEAD": HeaderFlags.COMPRESSED, "algo": algo, "payload": compressed})
+    return [envelope] + frames[1:]
+
+
+def advertised_call_credits():
+    """
+    :return: Number of calls a peer may have in flight on one connection. See settings.MAX_INFLIGHT_PER_CONNECTION
+    """
+    if settings.MAX_INFLIGHT_PER_CONNECTION:
+        return settings.MAX_INFLIGHT_PER_CONNECTION
+    # the calls may all go to the same executor, which must not reject them
+    capacities = [get_call_capacity(executor) for executor in [_memory.executor, *_memory.executors.values()]
+                  if executor]
+    capacities = [capacity for capacity in capacities if capacity is not None]
+    if not capacities:
+        return settings.DEFAULT_MAX_WORKERS + _memory.max_queue
+    return min(capacities)
+
+
+def set_high_water_marks(con):
+    """
+    Size the zmq queues of a socket for the calls the credits allow.
+    """
+    # besides the call itself, every call can have an ack, a return, API calls and a full window of stream chunks
+    # in the pipe. ROUTER sockets drop messages above the hwm, hence never go below the zmq default
+    hwm = max(1000, advertised_call_credits() * (settings.STREAM_WINDOW + 4))
+    con.setsockopt(zmq.SNDHWM, hwm)
+    con.setsockopt(zmq.RCVHWM, hwm)
+
+
+IPC_IDENTITY_PREFIX = b"ipc:"
+"""Prefix of the identities of peers connected via the ipc endpoint of a server. tcp identities never start with it."""
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def ipc_endpoint(port):
+    """
+    :return: Address of the ipc endpoint of the server on port
+    """
+    return f"ipc://{os.path.join(settings.IPC_DIRECTORY, f'rixaplugin-{port}.sock')}"
+
+
+def find_ipc_endpoint(server_address, port):
+    """
+    Look up the ipc endpoint of a server on this host in the PLUGIN_REGISTRY.
+
+    :return: ipc address or None if the server is remote or has no (existing) ipc endpoint
+    """
+    if server_address not in LOCAL_HOSTS and server_address != socket.gethostname():
+        return None
+    for entry in utils.discover_plugins():
+        address = entry.get("ipc_endpoint")
+        if entry.get("port") == port and address and os.path.exists(address[len("ipc://"):]):
+            return address
+    return None
+
+
 def create_keys(name=None, metadata=None, server_keys=False):
     keys_dir = settings.AUTH_KEY_LOC
     for d in [keys_dir]:
@@ -89,6 +399,10 @@ async def create_and_start_plugin_server(port, address=None, use_auth=False, ret
     server = PluginServer(port, address, use_curve=use_auth, manually_created=False)
 
     future = _memory.event_loop.create_task(server.listen())
+    if server.ipc_con:
+        asyncio.create_task(supervise_future(server.listen(ipc=True)))
+    if settings.HEARTBEAT_INTERVAL:
+        asyncio.create_task(supervise_future(server.heartbeat()))
     _memory.server = server
     if return_future:
         return server, future
@@ -110,8 +424,29 @@ class NetworkAdapter:
         self.is_server = None
         self.is_initialized = False
         self.api_objs = {}
+        self.stream_credits = {}
+        self.compression = {}
+        # identities of peers that can decode DataFrames in Arrow format
+        self.arrow_peers = set()
+        # identity -> utils.CallCredits for calls to the peer, as advertised by the peer
+        self.call_credits = {}
+        # identity -> number of calls from the peer that are running here
+        self.inflight = {}
+        # identity -> {plugin id: signature hash} of the plugins sent to the peer
+        self.peer_hashes = {}
+        # identity -> {plugin id: signature hash} of the plugins received from the peer
+        self.remote_hashes = {}
+        # identity -> instance id of the peer process
+        self.peer_instances = {}
+        self.last_seen = {}
+        # identity -> heartbeat interval advertised by the peer. Only these peers are checked for liveness
+        self.heartbeat_intervals = {}
+        self.offline = set()
         self.auth = None
         self.address = address
+        self.dispatcher = utils.OrderedDispatcher(settings.MAX_CONCURRENT_HANDLERS, network_log)
+        # (identity, request id) -> task executing a call from the peer
+        self.running_calls = {}
 
         if manually_created:
             network_log.warning("Manually created network adapter. No automatic resource management. Cleanup required!")
@@ -119,117 +454,496 @@ class NetworkAdapter:
     async def send(self, identity, data, already_serialized=False):
         if not already_serialized:
             try:
-                data = msgpack.packb(data, default=encode_custom)
+                frames = serialize(data, arrow=identity in self.arrow_peers)
                 # data = pickle.dumps(data)
             except Exception as e:
                 network_log.error(f"A message could not be serialized: {data}")
-                # return
+                raise e
+        elif isinstance(data, bytes):
+            frames = [data]
+        else:
+            frames = data
+        frames = compress(frames, self.compression.get(identity))
         if self.is_server:
             if identity == 0:
                 raise Exception("Identity is 0")
-            await self.con.send_multipart([identity, data])
+            if identity.startswith(IPC_IDENTITY_PREFIX):
+                await self.ipc_con.send_multipart([identity[len(IPC_IDENTITY_PREFIX):]] + frames, copy=False)
+            else:
+                await self.con.send_multipart([identity] + frames, copy=False)
         else:
-            await self.con.send(data)
+            await self.con.send_multipart(frames, copy=False)
 
-    async def send_return(self, identity, request_id, ret, state=None):
+    async def send_return(self, identity, request_id, ret, state=None, end_of_stream=False):
         ret = {"HEAD": HeaderFlags.FUNCTION_RETURN, "return": ret, "request_id": request_id}
+        if end_of_stream:
+            ret["end_of_stream"] = True
         if state:
             ret["state"] = state
         try:
-            raw = msgpack.packb(ret,default=encode_custom)
+            raw = serialize(ret, arrow=identity in self.arrow_peers)
         except Exception as e:
             network_log.exception(f"Function return not serializable")
             await self.send_exception(identity, request_id, e)
             return
         await self.send(identity, raw, already_serialized=True)
 
-    async def send_exception(self, identity, request_id, exception):
-        if settings.LOG_REMOTE_EXCEPTIONS_LOCALLY:
-            network_log.exception(f"Exception has occurred during call from remote '{request_id}'")
+    async def send_stream(self, identity, request_id, stream, api_obj):
+        """
+        Send the chunks of a local stream as FUNCTION_RETURN_CHUNK messages, followed by an end of stream return.
+
+        At most settings.STREAM_WINDOW chunks are sent before the receiver grants new credits.
+        Otherwise a fast producer would flood a slow consumer.
+        :param identity: Receiver
+        :param request_id: Request id of the generator call
+        :param stream: ResultStream of the local generator
+        :param api_obj: API object of the call. Its state is sent with the end of stream
+        """
+        credits = asyncio.Semaphore(settings.STREAM_WINDOW)
+        self.stream_credits[(identity, request_id)] = credits
+        try:
+            async for chunk in stream:
+                try:
+                    await asyncio.wait_for(credits.acquire(), timeout=settings.FUNCTION_CALL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise RemoteTimeoutException(f"Receiver of stream did not consume any chunk for "
+                                                 f"{settings.FUNCTION_CALL_TIMEOUT} seconds.")
+                await self.send(identity, {"HEAD": HeaderFlags.FUNCTION_RETURN_CHUNK, "request_id": request_id,
+                                           "return": chunk})
+        except Exception as e:
+            await self.send_exception(identity, request_id, e)
+            return
+        finally:
+            del self.stream_credits[(identity, request_id)]
+        await self.send_return(identity, request_id, None, state=api_obj.state, end_of_stream=True)
+
+    def _stream_credit_callback(self, identity, request_id):
+        """
+        Create the on_consume callback of a remote stream. Consumed chunks are granted back to the sender in batches.
+        """
+        consumed = 0
+        grant_size = max(settings.STREAM_WINDOW // 2, 1)
+
+        async def on_consume():
+            nonlocal consumed
+            consumed += 1
+            if consumed >= grant_size:
+                await self.send(identity, {"HEAD": HeaderFlags.CREDIT, "request_id": request_id, "credits": consumed})
+                consumed = 0
+
+        return on_consume
+
+    @staticmethod
+    def _exception_to_message(request_id, exception):
         exc_str = rixaplugin.internal.rixalogger.format_exception(exception, without_color=True)
 
         ret = {"HEAD": HeaderFlags.EXCEPTION_RETURN, "message": str(exception), "request_id": request_id,
                "type": type(exception).__name__, "traceback": exc_str}
 
-        if isinstance(exception, RemoteUnavailableException):
+        # a passed deadline says nothing about the plugin being reachable
+        if isinstance(exception, RemoteUnavailableException) and not isinstance(exception, DeadlineExceededException):
             if exception.plugin_name:
                 ret["offline_plugin_name"] = exception.plugin_name
-        await self.send(identity, ret)
+        return ret
+
+    async def send_exception(self, identity, request_id, exception):
+        # dropping calls the caller gave up on is expected and no error of the plugin
+        if settings.LOG_REMOTE_EXCEPTIONS_LOCALLY and not isinstance(exception, DeadlineExceededException):
+            network_log.exception(f"Exception has occurred during call from remote '{request_id}'")
+        await self.send(identity, self._exception_to_message(request_id, exception))
+
+    async def send_return_batch(self, identity, results, state=None):
+        """
+        Send the results of several calls from a FUNCTION_CALL_BATCH in one message.
+
+        :param results: List of (request_id, return value, exception) tuples. Exception is None on success.
+        :param state: Shared state of the batch
+        """
+        returns = []
+        for request_id, ret, exception in results:
+            if exception is None:
+                returns.append({"HEAD": HeaderFlags.FUNCTION_RETURN, "return": ret, "request_id": request_id})
+            else:
+                if settings.LOG_REMOTE_EXCEPTIONS_LOCALLY and not isinstance(exception, DeadlineExceededException):
+                    network_log.error(f"Exception has occurred during call from remote '{request_id}'",
+                                      exc_info=exception)
+                returns.append(self._exception_to_message(request_id, exception))
+        msg = {"HEAD": HeaderFlags.FUNCTION_RETURN_BATCH, "returns": returns}
+        if state:
+            msg["state"] = state
+        try:
+            raw = serialize(msg, arrow=identity in self.arrow_peers)
+        except Exception:
+            # one of the returns is not serializable. Send individually so only the affected call fails
+            for request_id, ret, exception in results:
+                if exception is None:
+                    await self.send_return(identity, request_id, ret, state=state)
+                else:
+                    await self.send(identity, self._exception_to_message(request_id, exception))
+            return
+        await self.send(identity, raw, already_serialized=True)
 
     async def send_api_call(self, identity, request_id, api_func_name, args, kwargs):
         ret = {"HEAD": HeaderFlags.API_CALL, "api_func_name": api_func_name, "args": args, "kwargs": kwargs,
                "request_id": request_id}
         await self.send(identity, ret)
 
+    async def send_plugin_update(self, identity):
+        """
+        Send the plugin signatures that changed since the last update to a peer.
+        """
+        # never send a peer its own plugins
+        own = _memory.get_remote_plugin_ids(self, identity)
+        hashes = _memory.get_signature_hashes(skip=own)
+        changed, removed = diff_signatures(hashes, self.peer_hashes.get(identity, {}))
+        self.peer_hashes[identity] = hashes
+        if not changed and not removed:
+            return
+        await self.send(identity, {"HEAD": HeaderFlags.UPDATE_REMOTE_PLUGINS | HeaderFlags.SERVER, "ID": _memory.ID,
+                                   "plugin_signatures": packed_signatures(changed, skip=own),
+                                   "removed_plugins": removed, "plugin_hashes": hashes})
+
     async def call_remote_function(self, plugin_entry, api_obj, args=None, kwargs=None, one_way=False,
-                                   return_time_estimate=False):
+                                   return_time_estimate=False, replica=None, deadline=None):
 
         if args is None:
             args = []
         if kwargs is None:
             kwargs = {}
 
-        request_id = identifier_from_signature(plugin_entry["name"], args, kwargs)
+        # the replica decides where the call goes. Its plugin id may differ from the one of the entry
+        remote_id = replica["remote_id"] if replica else plugin_entry["remote_id"]
+        request_id = _memory.new_request_id(plugin_entry["name"], args, kwargs)
         self.api_objs[request_id] = api_obj
+        self.schedule_expiry(request_id, settings.PENDING_REQUEST_EXPIRY, deadline)
         message = {
             "HEAD": HeaderFlags.FUNCTION_CALL,
             "request_id": request_id,
             "func_name": plugin_entry["name"],
             "plugin_name": plugin_entry["plugin_name"],
-            "plugin_id": plugin_entry["id"],
+            "plugin_id": replica["id"] if replica else plugin_entry["id"],
             "oneway": one_way,
             "args": args,
             "kwargs": kwargs,
             "scope" : api_obj.scope,
             "plugin_variables": api_obj.plugin_variables,
-            "state": api_obj.state
+            "state": api_obj.state,
+            "deadline": deadline,
+            # hops are counted to detect circular calls
+            "node_count": getattr(api_obj, "node_count", 0) + 1
         }
+        # in pipelined mode the return (or exception) doubles as acknowledgement
+        pipelined = settings.PIPELINED_CALLS
+        if pipelined:
+            message["no_ack"] = True
+        else:
+            self.time_estimate_events[request_id] = asyncio.Event()
+
+        future = None
+        if plugin_entry["type"] & FunctionPointerType.GENERATOR:
+            # chunks arrive before the return. The window on the sender side bounds the buffer
+            future = ResultStream(maxsize=0, on_consume=self._stream_credit_callback(remote_id, request_id))
+            self.pending_requests[request_id] = {"stream": future, "api_obj": api_obj, "remote_id": remote_id,
+                                                 "deadline": deadline}
+        elif not one_way:
+            future = _memory.event_loop.create_future()
+            self.pending_requests[request_id] = {"future": future, "api_obj": api_obj, "remote_id": remote_id}
+        if future is not None:
+            future.add_done_callback(functools.partial(self._cancel_remote_call, request_id))
+            if plugin_entry.get("idempotent"):
+                # kept for replay after a reconnect
+                self.pending_requests[request_id]["message"] = message
 
-        event = asyncio.Event()
-        self.time_estimate_events[request_id] = event
-
-        future = _memory.event_loop.create_future()
+        remote_func_type = plugin_entry["type"]
         if not one_way:
-            self.pending_requests[request_id] = {"future":future, "api_obj":api_obj}
+            await self._take_call_credits(remote_id, [request_id], [future], deadline)
+        await self.send(remote_id, message)
+        time_estimate = None
+        if not pipelined:
+            time_estimate = await self._await_acknowledgement(request_id, plugin_entry)
 
-        remote_func_type = plugin_entry["type"]
-        await self.send(plugin_entry["remote_id"], message)
-        # time estimate is always awaited
-        # need to check whether this makes sense or if call without acknowledgement is possible
-        answer = await utils.event_wait(event, 3)  # event.wait()
-        if not answer:
-            _memory.plugins[plugin_entry["plugin_id"]]["is_alive"] = False
+        if return_time_estimate:
+            return future, time_estimate
+        return future
+
+    async def call_remote_function_batch(self, plugin_entries, api_obj, args_list, kwargs_list, replicas=None,
+                                         deadline=None):
+        """
+        Call several functions on the same remote with one FUNCTION_CALL_BATCH message.
+
+        Scope, state and plugin variables are sent once for all calls. Each call still gets its own request id,
+        hence API calls and returns are routed as for single calls.
+        :param plugin_entries: Function entries. All need to have the same remote
+        :param api_obj: API object shared by all calls
+        :param args_list: List of positional arguments per call
+        :param kwargs_list: List of keyword arguments per call
+        :param replicas: Chosen replica per call. All need to be on the same remote
+        :param deadline: Absolute deadline (time.time()) of all calls. Remotes drop calls that are still queued by then
+        :return: List of futures in the order of plugin_entries
+        """
+        if replicas is None:
+            replicas = [None] * len(plugin_entries)
+        remote_id = replicas[0]["remote_id"] if replicas[0] else plugin_entries[0]["remote_id"]
+        credits = self.call_credits.get(remote_id)
+        if credits and len(plugin_entries) > credits.limit:
+            # the remote rejects batches larger than its credits
+            futures = []
+            for start in range(0, len(plugin_entries), credits.limit):
+                end = start + credits.limit
+                futures += await self.call_remote_function_batch(plugin_entries[start:end], api_obj,
+                                                                 args_list[start:end], kwargs_list[start:end],
+                                                                 replicas[start:end], deadline)
+            return futures
+        batch_id = _memory.new_request_id("batch", [i["name"] for i in plugin_entries])
+        node_count = getattr(api_obj, "node_count", 0) + 1
+        calls = []
+        futures = []
+        for plugin_entry, replica, args, kwargs in zip(plugin_entries, replicas, args_list, kwargs_list):
+            request_id = _memory.new_request_id(plugin_entry["name"], args, kwargs)
+            self.api_objs[request_id] = api_obj
+            self.schedule_expiry(request_id, settings.PENDING_REQUEST_EXPIRY, deadline)
+            calls.append({"request_id": request_id, "func_name": plugin_entry["name"],
+                          "plugin_name": plugin_entry["plugin_name"],
+                          "plugin_id": replica["id"] if replica else plugin_entry["id"],
+                          "args": args if args is not None else [], "kwargs": kwargs if kwargs is not None else {}})
+            future = _memory.event_loop.create_future()
+            future.add_done_callback(functools.partial(self._cancel_remote_call, request_id))
+            self.pending_requests[request_id] = {"future": future, "api_obj": api_obj, "remote_id": remote_id}
+            if plugin_entry.get("idempotent"):
+                self.pending_requests[request_id]["message"] = {
+                    "HEAD": HeaderFlags.FUNCTION_CALL, "oneway": False, "scope": api_obj.scope,
+                    "plugin_variables": api_obj.plugin_variables, "state": api_obj.state, "deadline": deadline,
+                    "node_count": node_count, **calls[-1]}
+            futures.append(future)
+        await self._take_call_credits(remote_id, [call["request_id"] for call in calls], futures, deadline)
+        message = {
+            "HEAD": HeaderFlags.FUNCTION_CALL_BATCH,
+            "request_id": batch_id,
+            "calls": calls,
+            "scope": api_obj.scope,
+            "plugin_variables": api_obj.plugin_variables,
+            "state": api_obj.state,
+            "deadline": deadline,
+            "node_count": node_count
+        }
+        pipelined = settings.PIPELINED_CALLS
+        if pipelined:
+            message["no_ack"] = True
+        else:
+            self.time_estimate_events[batch_id] = asyncio.Event()
+        await self.send(remote_id, message)
+        if not pipelined:
             try:
-                del self.api_objs[request_id]
-            except:
-                pass
+                await self._await_acknowledgement(batch_id, plugin_entries[0])
+            except RemoteTimeoutException as e:
+                for call in calls:
+                    self.pending_requests.pop(call["request_id"], None)
+                    self.api_objs.pop(call["request_id"], None)
+                    _memory.expiry.cancel((self, call["request_id"]))
+                raise e
+        return futures
+
+    def _cancel_remote_call(self, request_id, future):
+        """
+        Done callback of the futures/streams of remote calls. Tells the remote to stop if the call was cancelled here.
+        """
+        if not future.cancelled():
+            return
+        entry = self.pending_requests.pop(request_id, None)
+        if not entry:
+            # already answered or given up on
+            return
+        self.schedule_expiry(request_id, 2)
+        asyncio.ensure_future(self.send_cancel(entry["remote_id"], request_id))
+
+    async def send_cancel(self, identity, request_id):
+        """
+        Cancel a call on the remote. Calls still waiting for a worker are dropped, running async functions are
+        cancelled and sync functions can check rixaplugin.is_cancelled().
+        """
+        await self.send(identity, {"HEAD": HeaderFlags.CANCEL, "request_id": request_id})
+
+    def track_call(self, identity, request_id, task, admitted=True):
+        """
+        Remember the task executing a call from a peer until it is done, so that the peer can cancel it.
+
+        :param admitted: The call was admitted by _admit_calls and counts as in flight until the task is done
+        """
+        key = (identity, request_id)
+        self.running_calls[key] = task
+        task.add_done_callback(lambda _: self.running_calls.pop(key, None))
+        if admitted:
+            task.add_done_callback(lambda _: self._calls_done(identity))
+
+    def set_call_credits(self, identity, limit):
+        """
+        Apply the credit limit advertised by a peer. A limit of None (peer without flow control) removes the limit.
+        """
+        if not limit:
+            self.call_credits.pop(identity, None)
+        elif identity in self.call_credits:
+            self.call_credits[identity].set_limit(limit)
+        else:
+            self.call_credits[identity] = utils.CallCredits(limit)
+
+    async def _take_call_credits(self, identity, request_ids, futures, deadline=None):
+        """
+        Wait until the peer accepts more calls. The credits are given back when the futures are done.
+
+        The wait is bounded like the answer to a call (see schedule_expiry). If it runs out, the calls are dropped.
+        :param request_ids: Ids of the calls about to be sent
+        :param futures: Futures (or streams) of these calls
+        :param deadline: Absolute deadline (time.time()) of the calls, if any
+        :raises RemoteTimeoutException: If the peer accepted no more calls within PENDING_REQUEST_EXPIRY seconds
+        :raises DeadlineExceededException: If the deadline passed first
+        """
+        credits = self.call_credits.get(identity)
+        if not credits:
+            return
+        if not credits.available(len(futures)):
+            network_log.debug(f"Out of call credits for {identity}, holding {len(futures)} call(s)")
+        timeout = settings.PENDING_REQUEST_EXPIRY
+        deadline_exceeded = deadline is not None and deadline - time.time() < timeout
+        if deadline_exceeded:
+            timeout = max(0, deadline - time.time())
+        try:
+            await credits.acquire(len(futures), timeout)
+        except asyncio.TimeoutError:
+            # never sent, hence nothing to cancel on the remote
+            for request_id in request_ids:
+                self.pending_requests.pop(request_id, None)
+                self.api_objs.pop(request_id, None)
+                self.time_estimate_events.pop(request_id, None)
+            for future in futures:
+                if isinstance(future, asyncio.Future) and future.done() and not future.cancelled():
+                    # failed by the expiry of the request meanwhile, superseded by the exception raised here
+                    future.exception()
+            if deadline_exceeded:
+                raise DeadlineExceededException(f"Deadline passed while waiting for {identity} to accept more calls")
+            raise RemoteTimeoutException(f"{identity} accepted no more calls within {timeout} seconds")
+        for future in futures:
+            future.add_done_callback(lambda _: credits.release())
+
+    def _admit_calls(self, identity, count):
+        """
+        Count calls from a peer as in flight, unless the peer exceeds the credits advertised to it.
+
+        :return: False if the calls have to be rejected
+        """
+        inflight = self.inflight.get(identity, 0)
+        if inflight + count > advertised_call_credits():
+            return False
+        self.inflight[identity] = inflight + count
+        return True
+
+    def _calls_done(self, identity, count=1):
+        if identity in self.inflight:
+            self.inflight[identity] -= count
+            if self.inflight[identity] <= 0:
+                del self.inflight[identity]
+
+    async def _reject_calls(self, identity, request_ids, ack_id=None):
+        if ack_id is not None:
+            await self.send(identity, {"HEAD": HeaderFlags.TIME_ESTIMATE_AND_ACKNOWLEDGEMENT, "request_id": ack_id})
+        network_log.warning(f"Rejecting {len(request_ids)} call(s) from {identity}, it ignores the call credits")
+        exception = QueueOverflowException(f"More than {advertised_call_credits()} calls in flight on this connection")
+        for request_id in request_ids:
+            await self.send(identity, self._exception_to_message(request_id, exception))
+
+    def set_connection_alive(self, identity, alive):
+        """
+        Mark all plugins of a connection as alive or offline.
+
+        Offline connections are marked alive again as soon as any message from them arrives.
+        """
+        if alive:
+            self.offline.discard(identity)
+        else:
+            self.offline.add(identity)
+        _memory.set_remote_alive(self, identity, alive)
+
+    async def heartbeat(self):
+        """
+        Periodically check when each connection was last heard from and mark silent ones as offline.
+
+        Clients additionally send a HEARTBEAT every settings.HEARTBEAT_INTERVAL seconds, which the server answers.
+        Hence both sides notice a dead remote without having to call it first.
+        The server only checks clients that advertised heartbeats in their handshake, using their interval. Clients
+        without heartbeats (old versions or HEARTBEAT_INTERVAL = 0) may stay silent while idle.
+        """
+        interval = settings.HEARTBEAT_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for identity, last_seen in list(self.last_seen.items()):
+                peer_interval = interval if identity is self else self.heartbeat_intervals.get(identity)
+                if not peer_interval:
+                    continue
+                timeout = peer_interval * settings.HEARTBEAT_MISS_THRESHOLD
+                if now - last_seen > timeout and identity not in self.offline:
+                    network_log.warning(f"No message from {self.address if identity is self else identity.hex()} "
+                                        f"for {now - last_seen:.1f} seconds. Marking plugins as offline.")
+                    self.set_connection_alive(identity, False)
+            if not self.is_server:
+                try:
+                    # a dead server lets the send queue fill up, which must not stall the liveness check
+                    await asyncio.wait_for(self.send(self, {"HEAD": HeaderFlags.HEARTBEAT}), interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _await_acknowledgement(self, request_id, plugin_entry):
+        """
+        Wait for the TIME_ESTIMATE_AND_ACKNOWLEDGEMENT of a call.
+
+        :return: Time estimate sent by the remote
+        :raises RemoteTimeoutException: If the remote did not acknowledge in time. Only this call fails, a lost
+            connection is detected by the heartbeat.
+        """
+        answer = await utils.event_wait(self.time_estimate_events[request_id], 3)
+        if not answer:
+            self.time_estimate_events.pop(request_id, None)
+            entry = self.pending_requests.pop(request_id, None)
+            if entry and "stream" in entry:
+                entry["stream"].close(asyncio.CancelledError())
+            elif entry and not entry["future"].done():
+                entry["future"].cancel()
+            self.api_objs.pop(request_id, None)
+            _memory.expiry.cancel((self, request_id))
             raise RemoteTimeoutException(
                 f"No acknowledgement for function call. Plugin '{plugin_entry['plugin_name']}' is likely offline",
                 plugin_name=plugin_entry["plugin_name"])
-        time_estimate = self.time_estimate[request_id]
-        del self.time_estimate[request_id]
+        time_estimate = self.time_estimate.pop(request_id)
         del self.time_estimate_events[request_id]
+        return time_estimate
 
-        if return_time_estimate:
-            return future, time_estimate
-        if one_way:
-            return None
-        return future
-
-    async def listen(self):
+    async def listen(self, ipc=False):
+        """
+        Receive and handle messages until the socket is closed.
 
+        :param ipc: Listen on the ipc endpoint of a server instead
+        """
         while True:
+            con = self.ipc_con if ipc else self.con
             try:
+                frames = await con.recv_multipart(copy=False)
                 if self.is_server:
-                    identity, message = await self.con.recv_multipart(copy=True)
+                    identity = frames[0].bytes
+                    if ipc:
+                        identity = IPC_IDENTITY_PREFIX + identity
+                    frames = frames[1:]
                 else:
-                    message = await self.con.recv()
                     identity = self
             except asyncio.CancelledError:
+                if self.con is not con:
+                    # socket was replaced by reconnect
+                    continue
                 return
+            self.last_seen[identity] = time.monotonic()
+            if identity in self.offline:
+                self.set_connection_alive(identity, True)
             try:
                 try:
-                    msg = msgpack.unpackb(message, object_hook=decode_custom)
+                    msg = deserialize(frames)
                 except Exception as e:
                     network_log.exception("Received message is not in msgpack format!")
                     continue
@@ -275,17 +989,55 @@ class NetworkAdapter:
                     network_log.error("Incoming request are faulty and likely stem from erroneous code. Shutting down.")
                     _memory.force_shutdown()
 
+    async def dispatch(self, key, coro):
+        """
+        Handle a message concurrently to the receive loop.
+
+        Returns once the coroutine is scheduled. Waits while MAX_CONCURRENT_HANDLERS messages are being handled,
+        which pauses receiving from the socket.
+        :param key: Coroutines with the same key are run in order of arrival, usually (identity, request id)
+        :param coro: Coroutine handling the message
+        """
+        if settings.MAX_CONCURRENT_HANDLERS <= 1:
+            await coro
+        else:
+            await self.dispatcher.submit(key, coro)
+
+    def _forget_peer(self, identity):
+        """
+        Drop the plugins and connection state of a peer identity that is no longer used.
+        """
+        _memory.remove_remote(self, identity)
+        if identity in _memory.connected_clients:
+            _memory.connected_clients.remove(identity)
+        self.last_seen.pop(identity, None)
+        self.heartbeat_intervals.pop(identity, None)
+        self.offline.discard(identity)
+        self.compression.pop(identity, None)
+        self.arrow_peers.discard(identity)
+        self.call_credits.pop(identity, None)
+        self.inflight.pop(identity, None)
+        self.peer_hashes.pop(identity, None)
+        self.remote_hashes.pop(identity, None)
+        self.peer_instances.pop(identity, None)
+
     async def handle_remote_message(self, header_flags, msg, identity):
         if header_flags & HeaderFlags.ACKNOWLEDGE:
             network_log.debug(f"Acknowledging connection")
-            ret = {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.SERVER, "ID": _memory.ID, "VERSION" : _memory.version}
+            ret = {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.SERVER, "ID": _memory.ID, "VERSION" : _memory.version,
+                   "INSTANCE": _memory.instance_id, "CREDITS": advertised_call_credits()}
             updated = None
             if "request_info" in msg and msg["request_info"] == "plugin_signatures":
-                if "plugin_signatures" in msg:
-                    ret["plugin_signatures"] = _memory.get_sendable_plugins(skip=msg["plugin_signatures"].keys())
-
+                skip = msg["plugin_signatures"].keys() if "plugin_signatures" in msg else None
+                hashes = _memory.get_signature_hashes(skip=skip)
+                if "PLUGIN_HASHES" in msg:
+                    # the peer still has plugins from a previous connection, only send what changed
+                    changed, ret["removed_plugins"] = diff_signatures(hashes, msg["PLUGIN_HASHES"])
+                    ret["plugin_signatures"] = packed_signatures(changed, skip=skip)
                 else:
-                    ret["plugin_signatures"] = _memory.get_sendable_plugins()
+                    ret["plugin_signatures"] = packed_signatures(skip=skip)
+                ret["plugin_hashes"] = hashes
+                self.peer_hashes[identity] = hashes
 
             if "plugin_signatures" in msg:
 
@@ -293,38 +1045,94 @@ class NetworkAdapter:
                     tag = self.auth_dict.get(self.last_accepted_key)
                     if not tag:
                         tag = "unknown"
-                    updated = _memory.add_plugin(msg["plugin_signatures"], identity, self, origin_is_client=True, tags=[tag])
+                    updated = _memory.add_plugin(msg["plugin_signatures"], identity, self, origin_is_client=True,
+                                                 tags=[tag], instance=msg.get("INSTANCE"))
                 else:
-                    updated = _memory.add_plugin(msg["plugin_signatures"], identity, self, origin_is_client=True)
+                    updated = _memory.add_plugin(msg["plugin_signatures"], identity, self, origin_is_client=True,
+                                                 instance=msg.get("INSTANCE"))
+            compression = negotiate_compression(msg.get("COMPRESSION"))
+            ret["COMPRESSION"] = compression
+            ret["ARROW"] = pa is not None
             await self.send(identity, ret)
+            if compression:
+                self.compression[identity] = compression
+                network_log.debug(f"Using {compression} compression for connection")
+            if msg.get("ARROW") and pa is not None:
+                self.arrow_peers.add(identity)
+            else:
+                self.arrow_peers.discard(identity)
+            self.set_call_credits(identity, msg.get("CREDITS"))
+            if msg.get("HEARTBEAT"):
+                self.heartbeat_intervals[identity] = msg["HEARTBEAT"]
+            else:
+                self.heartbeat_intervals.pop(identity, None)
             self.first_connection.set()
             if updated:
                 _memory.connected_clients.remove(updated)
+                if updated != identity:
+                    self._forget_peer(updated)
+            if msg.get("INSTANCE"):
+                # the same process connected before under another identity, e.g. it reconnected or gave up on the
+                # ipc endpoint and fell back to tcp
+                for old, instance in list(self.peer_instances.items()):
+                    if instance == msg["INSTANCE"] and old != identity:
+                        self._forget_peer(old)
+                self.peer_instances[identity] = msg["INSTANCE"]
 
 
             if settings.ALLOW_NETWORK_RELAY:
                 for client in _memory.connected_clients:
                     if client != updated:
-                        ret = {"HEAD": HeaderFlags.UPDATE_REMOTE_PLUGINS | HeaderFlags.SERVER, "ID": _memory.ID,
-                               "plugin_signatures": _memory.get_sendable_plugins()}
-                        await self.send(client, ret)
+                        await self.send_plugin_update(client)
 
             _memory.connected_clients.append(identity)
         elif header_flags & HeaderFlags.UPDATE_REMOTE_PLUGINS:
+            if msg.get("removed_plugins"):
+                _memory.remove_remote(self, identity, plugin_ids=msg["removed_plugins"])
             if "plugin_signatures" in msg:
                 _memory.add_plugin(msg["plugin_signatures"], identity, self, origin_is_client=self.is_server)
+            if "plugin_hashes" in msg:
+                self.remote_hashes[identity] = msg["plugin_hashes"]
 
 
         elif header_flags & HeaderFlags.FUNCTION_CALL:
+            # one way calls can't be tracked by the caller, hence they don't count against the credits
+            if not msg["oneway"] and not self._admit_calls(identity, 1):
+                await self._reject_calls(identity, [msg["request_id"]],
+                                         None if msg.get("no_ack") else msg["request_id"])
+                return
             try:
-                asyncio.create_task(execute_networked(
+                # estimate before the call is queued, otherwise it would count itself
+                time_estimate = estimate_completion_time(msg["func_name"], msg["plugin_id"])
+                task = asyncio.create_task(execute_networked(
                     msg["func_name"], msg["plugin_name"], msg["plugin_id"], msg["args"], msg["kwargs"], msg["oneway"],
-                    msg["request_id"], identity, self, msg["scope"], msg.get("plugin_variables"), msg.get("state")))
-                ret = {"HEAD": HeaderFlags.TIME_ESTIMATE_AND_ACKNOWLEDGEMENT, "request_id": msg["request_id"]}
-                await self.send(identity, ret)
+                    msg["request_id"], identity, self, msg["scope"], msg.get("plugin_variables"), msg.get("state"),
+                    msg.get("deadline"), msg.get("node_count", 0)))
+                self.track_call(identity, msg["request_id"], task, admitted=not msg["oneway"])
+                if not msg.get("no_ack"):
+                    ret = {"HEAD": HeaderFlags.TIME_ESTIMATE_AND_ACKNOWLEDGEMENT, "request_id": msg["request_id"],
+                           "time_estimate": time_estimate, "queued_tasks": get_queued_task_count()}
+                    await self.send(identity, ret)
             except FunctionNotFoundException as e:
                 ret = {"HEAD": HeaderFlags.FUNCTION_NOT_FOUND, "request_id": msg["request_id"]}
                 await self.send(identity, ret)
+        elif header_flags & HeaderFlags.FUNCTION_CALL_BATCH:
+            calls = msg["calls"]
+            if not self._admit_calls(identity, len(calls)):
+                await self._reject_calls(identity, [call["request_id"] for call in calls],
+                                         None if msg.get("no_ack") else msg["request_id"])
+                return
+            # the calls of a batch run concurrently, the slowest one determines when the batch is done
+            estimates = [estimate_completion_time(call["func_name"], call["plugin_id"]) for call in calls]
+            estimates = [est for est in estimates if est is not None]
+            task = asyncio.create_task(execute_networked_batch(calls, identity, self, msg["scope"],
+                                                               msg.get("plugin_variables"), msg.get("state"),
+                                                               msg.get("deadline"), msg.get("node_count", 0)))
+            if not msg.get("no_ack"):
+                ret = {"HEAD": HeaderFlags.TIME_ESTIMATE_AND_ACKNOWLEDGEMENT, "request_id": msg["request_id"],
+                       "time_estimate": max(estimates) if estimates else None,
+                       "queued_tasks": get_queued_task_count()}
+                await self.send(identity, ret)
         elif header_flags & HeaderFlags.API_CALL:
             request_id = msg.get("request_id")
             api_obj = self.api_objs.get(request_id)
@@ -336,51 +1144,53 @@ class NetworkAdapter:
             kwargs = msg.get("kwargs")
             api_callable = getattr(api_obj, api_func_name)
             if api_obj.is_remote:
-                await api_callable(args, kwargs)
+                call = api_callable(args, kwargs)
             else:
-                await api_callable(*args, **kwargs)
+                call = api_callable(*args, **kwargs)
+            # API calls can take long (e.g. a websocket push). Don't block returns of unrelated requests meanwhile,
+            # but keep the order of API calls belonging to the same request.
+            await self.dispatch((identity, request_id), call)
 
         elif header_flags & HeaderFlags.FUNCTION_RETURN:
-            request_id = msg.get("request_id")
-            asyncio.create_task(self.trigger_api_deletion(request_id))
-            if request_id in self.pending_requests:
-                if not self.pending_requests[request_id]:
-                    del self.pending_requests[request_id]
-                    return
-                if "return" in msg:
-                    ret_val = msg.get("return")
-                    if "state" in msg:
-                        self.pending_requests[request_id]["api_obj"].state = msg["state"]
-                    self.pending_requests[request_id]["future"].set_result(ret_val)
-                if "exception" in msg:
-                    ret_val = Exception("Something went wrong on the server side.")
-                    if "state" in msg:
-                        self.pending_requests[request_id]["api_obj"].state = msg["state"]
-                    self.pending_requests[request_id]["future"].set_exception(ret_val)
-                del self.pending_requests[request_id]
-            else:
-                network_log.warning(f"Received response for unknown request id: {request_id}")
+            self._handle_function_return(msg)
 
         elif header_flags & HeaderFlags.EXCEPTION_RETURN:
+            self._handle_exception_return(msg)
+
+        elif header_flags & HeaderFlags.FUNCTION_RETURN_CHUNK:
             request_id = msg.get("request_id")
-            asyncio.create_task(self.trigger_api_deletion(request_id))
-            exc = RemoteException(msg['type'], msg['message'], msg['traceback'])
-            if request_id in self.pending_requests:
-                if request_id in self.pending_requests:
-                    if "state" in msg:
-                        self.pending_requests[request_id]["api_obj"].state = msg["state"]
-                    self.pending_requests[request_id]["future"].set_exception(exc)
-                    del self.pending_requests[request_id]
-                else:
-                    network_log.warning(f"Exception occured in one way call: {exc}")
+            pending = self.pending_requests.get(request_id)
+            if pending and "stream" in pending:
+                pending["stream"].put_nowait(msg["return"])
+                # chunks keep a stream alive, but not beyond the deadline of the call
+                self.schedule_expiry(request_id, settings.PENDING_REQUEST_EXPIRY, pending.get("deadline"))
             else:
-                network_log.warning(f"Received exception for unknown request id: {exc}")
-            if "offline_plugin_name" in msg:
-                network_log.warning(f"Indirect remote plugin '{msg['offline_plugin_name']}' is offline")
-                try:
-                    _memory.plugins[msg["offline_plugin_name"]]["is_alive"] = False
-                except Exception as e:
-                    network_log.exception(f"Error setting plugin offline.")
+                network_log.warning(f"Received chunk for unknown stream: {request_id}")
+
+        elif header_flags & HeaderFlags.CREDIT:
+            credits = self.stream_credits.get((identity, msg.get("request_id")))
+            if credits:
+                for _ in range(msg["credits"]):
+                    credits.release()
+
+        elif header_flags & HeaderFlags.FUNCTION_RETURN_BATCH:
+            for ret in msg["returns"]:
+                if "state" in msg:
+                    ret["state"] = msg["state"]
+                if ret["HEAD"] & HeaderFlags.EXCEPTION_RETURN:
+                    self._handle_exception_return(ret)
+                else:
+                    self._handle_function_return(ret)
+
+        elif header_flags & HeaderFlags.CANCEL:
+            task = self.running_calls.get((identity, msg["request_id"]))
+            if task:
+                network_log.debug(f"Cancelling request {msg['request_id']}")
+                task.cancel()
+
+        elif header_flags & HeaderFlags.HEARTBEAT:
+            if self.is_server:
+                await self.send(identity, {"HEAD": HeaderFlags.HEARTBEAT})
 
         elif header_flags & HeaderFlags.TIME_ESTIMATE_AND_ACKNOWLEDGEMENT:
             request_id = msg.get("request_id")
@@ -391,18 +1201,97 @@ class NetworkAdapter:
             else:
                 network_log.warning(f"Received time estimate for unknown request id: {request_id}")
 
-    async def trigger_api_deletion(self, request_id, time=2):
-        """
-        Trigger the deletion of an api object after a certain time.
+    def _handle_function_return(self, msg):
+        request_id = msg.get("request_id")
+        # API calls can arrive after the return due to the async nature, the api object is kept a bit longer
+        self.schedule_expiry(request_id, 2)
+        if request_id in self.pending_requests:
+            if not self.pending_requests[request_id]:
+                del self.pending_requests[request_id]
+                return
+            if "stream" in self.pending_requests[request_id]:
+                if "state" in msg:
+                    self.pending_requests[request_id]["api_obj"].state = msg["state"]
+                self.pending_requests[request_id]["stream"].close()
+            elif "return" in msg:
+                ret_val = msg.get("return")
+                if "state" in msg:
+                    self.pending_requests[request_id]["api_obj"].state = msg["state"]
+                # the caller may have cancelled the call in the meantime
+                if not self.pending_requests[request_id]["future"].done():
+                    self.pending_requests[request_id]["future"].set_result(ret_val)
+            if "exception" in msg:
+                ret_val = Exception("Something went wrong on the server side.")
+                if "state" in msg:
+                    self.pending_requests[request_id]["api_obj"].state = msg["state"]
+                self.pending_requests[request_id]["future"].set_exception(ret_val)
+            del self.pending_requests[request_id]
+        else:
+            network_log.warning(f"Received response for unknown request id: {request_id}")
+
+    def _handle_exception_return(self, msg):
+        request_id = msg.get("request_id")
+        # API calls can arrive after the return due to the async nature, the api object is kept a bit longer
+        self.schedule_expiry(request_id, 2)
+        exc = RemoteException(msg['type'], msg['message'], msg['traceback'])
+        if request_id in self.pending_requests:
+            if request_id in self.pending_requests:
+                if "state" in msg:
+                    self.pending_requests[request_id]["api_obj"].state = msg["state"]
+                if "stream" in self.pending_requests[request_id]:
+                    self.pending_requests[request_id]["stream"].close(exc)
+                elif not self.pending_requests[request_id]["future"].done():
+                    self.pending_requests[request_id]["future"].set_exception(exc)
+                del self.pending_requests[request_id]
+            else:
+                network_log.warning(f"Exception occured in one way call: {exc}")
+        elif msg["type"] == DeadlineExceededException.__name__:
+            # the request already expired here at the same deadline
+            network_log.debug(f"Remote dropped request {request_id} after its deadline")
+        else:
+            network_log.warning(f"Received exception for unknown request id: {exc}")
+        if "offline_plugin_name" in msg:
+            network_log.warning(f"Indirect remote plugin '{msg['offline_plugin_name']}' is offline")
+            try:
+                _memory.plugins[msg["offline_plugin_name"]]["is_alive"] = False
+                _memory.invalidate_sendable_plugins()
+            except Exception as e:
+                network_log.exception(f"Error setting plugin offline.")
 
-        We can't del immediately as api calls can come after return due to async nature.
-        :param request_id:
-        :param time:
-        :return:
+    def schedule_expiry(self, request_id, delay, deadline=None):
         """
-        await asyncio.sleep(time)
-        if request_id in self.api_objs:
-            del self.api_objs[request_id]
+        Drop the api object of a request after a delay. If the request is still pending by then, it fails with a
+        RemoteTimeoutException.
+
+        Rescheduling replaces the previous deadline.
+        :param request_id: Request id
+        :param delay: Time in seconds
+        :param deadline: Absolute deadline (time.time()) of the call. If earlier, the request expires at the deadline
+            and fails with a DeadlineExceededException instead
+        """
+        callback = functools.partial(self._expire_request, request_id)
+        if deadline is not None and deadline - time.time() < delay:
+            delay = max(0, deadline - time.time())
+            callback = functools.partial(self._expire_request, request_id, deadline_exceeded=True)
+        _memory.expiry.schedule((self, request_id), delay, callback)
+
+    def _expire_request(self, request_id, deadline_exceeded=False):
+        self.api_objs.pop(request_id, None)
+        entry = self.pending_requests.pop(request_id, None)
+        if not entry:
+            return
+        if deadline_exceeded:
+            exc = DeadlineExceededException(f"No answer for request {request_id} before its deadline")
+            # the remote drops the call if it is still queued, but may be running it already
+            asyncio.ensure_future(self.send_cancel(entry["remote_id"], request_id))
+        else:
+            network_log.warning(f"No answer for request {request_id} within {settings.PENDING_REQUEST_EXPIRY} "
+                                f"seconds. Giving up.")
+            exc = RemoteTimeoutException(f"No answer within {settings.PENDING_REQUEST_EXPIRY} seconds")
+        if "stream" in entry:
+            entry["stream"].close(exc)
+        elif not entry["future"].done():
+            entry["future"].set_exception(exc)
 
 
 class CredentialsProvider(object):
@@ -429,10 +1318,13 @@ class PluginServer(NetworkAdapter):
 
         network_log.debug("Starting server")
         self.con = _memory.zmq_context.socket(zmq.ROUTER)
+        set_high_water_marks(self.con)
         _memory.listener_socket = self.con
         self.error_count = 0
         self.is_server = True
         self.last_accepted_key = None
+        self.ipc_con = None
+        self.ipc_address = None
 
         failed = False
         if use_curve:
@@ -462,25 +1354,65 @@ class PluginServer(NetworkAdapter):
         if not failed:
             self.con.bind(address)
             network_log.info(f"Server started at {address}")
+            # ipc has no CURVE, it would bypass the authentication
+            if settings.USE_IPC and zmq.has("ipc") and address.startswith("tcp://") and not self.use_curve:
+                self._bind_ipc(port)
             self.first_connection = asyncio.Event()
-            utils.make_discoverable(_memory.ID, "localhost", port, list(_memory.plugins.keys()))
+            utils.make_discoverable(_memory.ID, "localhost", port, list(_memory.plugins.keys()),
+                                    ipc_endpoint=self.ipc_address)
+
+    def _bind_ipc(self, port):
+        """
+        Additionally listen on an unencrypted ipc endpoint for peers on the same host.
+        """
+        address = ipc_endpoint(port)
+        con = _memory.add_client_connection(zmq.ROUTER)
+        set_high_water_marks(con)
+        # unix sockets can only be connected to with write permission. Set at creation, a chmod after bind would
+        # leave a window in which other users can connect
+        umask = os.umask(0o177)
+        try:
+            con.bind(address)
+        except (zmq.ZMQError, OSError) as e:
+            network_log.warning(f"Could not listen on {address}, local peers will use tcp: {e}")
+            _memory.delete_connection(con)
+            return
+        finally:
+            os.umask(umask)
+        self.ipc_con = con
+        self.ipc_address = address
+        network_log.info(f"Server listening for local peers at {address}")
 
 
 async def create_and_start_plugin_client(server_address, port=2809, raise_on_connection_failure=True,
                                          return_future=False, use_auth=False, client_key_file_name="client.key_secret",
-                                         server_key_file_name="server.key"):
+                                         server_key_file_name="server.key", prefer_ipc=None):
+    """
+    Connect to a plugin server.
+
+    Servers on the same host are reached via their ipc endpoint (see settings.USE_IPC), without encryption. Never
+    with use_auth, as ipc can't authenticate.
+    :param prefer_ipc: Use the ipc endpoint of local servers. Defaults to settings.USE_IPC
+    """
+    if prefer_ipc is None:
+        prefer_ipc = settings.USE_IPC
+    ipc_address = find_ipc_endpoint(server_address, port) if prefer_ipc and not use_auth else None
+    if ipc_address:
+        client = PluginClient(server_address, port, manually_created=False, use_auth=False, address=ipc_address)
+        client.con.connect(client.full_address)
+        msg = await client.handshake(client.con)
+        if msg is not None and msg["HEAD"] & HeaderFlags.ACKNOWLEDGE:
+            return await _start_client(client, msg, return_future)
+        network_log.warning(f"No answer on {ipc_address}, falling back to tcp")
+        _memory.delete_connection(client.con)
     client = PluginClient(server_address, port, manually_created=False, use_auth=use_auth, client_key_file_name=client_key_file_name,
                           server_key_file_name=server_key_file_name)
 
 
     try:
         client.con.connect(client.full_address)
-        packed_msg = msgpack.packb(
-            {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.CLIENT, "request_info": "plugin_signatures",
-             "plugin_signatures": _memory.get_sendable_plugins(), "ID": _memory.ID, })
-        await client.con.send(packed_msg)
-        evts = await client.con.poll(1000)
-        if evts == 0:
+        msg = await client.handshake(client.con)
+        if msg is None:
             addr = client.full_address
             del client
             if raise_on_connection_failure:
@@ -488,35 +1420,25 @@ async def create_and_start_plugin_client(server_address, port=2809, raise_on_con
             else:
                 network_log.error(f"Failed to connect to {addr}")
                 return None
-        try:
-            message = await client.con.recv(zmq.NOBLOCK)
-            msg = msgpack.unpackb(message, object_hook=decode_custom)
-            if msg["HEAD"] & HeaderFlags.ACKNOWLEDGE:
-                if msg["VERSION"] != _memory.version:
-                    network_log.critical(
-                        f"Rixaplugin version mismatch. Server: {msg['VERSION'][:8]}, Client: {_memory.version[:8]}."
-                        f"Network protocol likely incompatible. Do not report bugs using this config!")
-                network_log.info("Connection established")
-
-            else:
+        if not msg["HEAD"] & HeaderFlags.ACKNOWLEDGE:
+            if raise_on_connection_failure:
                 raise Exception(
                     "Connection established but failed to receive acknowledge message. This shouldn't happen.")
-
-            _memory.add_plugin(msg.get("plugin_signatures"), client, client,
-                               origin_is_client=False)
-
-
-        except zmq.ZMQError as e:
-            if raise_on_connection_failure:
-                raise Exception(f"Failed to connect to {client.full_address}: {e}")
-            else:
-                network_log.warning("Connection established but failed to receive acknowledge message."
-                                    "This shouldn't happen.")
-                return None
+            network_log.warning("Connection established but failed to receive acknowledge message."
+                                "This shouldn't happen.")
+            return None
     except zmq.ZMQError as e:
         raise Exception(f"Failed to connect to {server_address}:{port}\n{e}")
+    return await _start_client(client, msg, return_future)
+
+
+async def _start_client(client, msg, return_future):
+    client.apply_handshake(msg)
     future = _memory.event_loop.create_task(client.listen())
-    network_log.info(f"Client connected to {server_address}:{port}")
+    client.last_seen[client] = time.monotonic()
+    if settings.HEARTBEAT_INTERVAL:
+        asyncio.create_task(supervise_future(client.heartbeat()))
+    network_log.info(f"Client connected to {client.full_address}")
     if return_future:
         return client, future
     else:
@@ -527,32 +1449,171 @@ async def create_and_start_plugin_client(server_address, port=2809, raise_on_con
 class PluginClient(NetworkAdapter):
 
     def __init__(self, server_address, port, protocoll="tcp://", use_auth=True, manually_created=True,
-                 server_key_file_name="server.key", client_key_file_name="client.key_secret"):
-        full_address = f"{protocoll}{server_address}:{port}"
+                 server_key_file_name="server.key", client_key_file_name="client.key_secret", address=None):
+        full_address = address if address else f"{protocoll}{server_address}:{port}"
         super().__init__(port, use_auth, manually_created=manually_created, address=full_address)
         self.full_address = full_address
-        self.con = _memory.add_client_connection(zmq.DEALER)
-        if use_auth:
+        self.use_auth = use_auth
+        self.server_key_file_name = server_key_file_name
+        self.client_key_file_name = client_key_file_name
+        self.reconnect_task = None
+        self.con = self._create_socket()
+        self.is_server = False
+
+    def _create_socket(self):
+        con = _memory.add_client_connection(zmq.DEALER)
+        set_high_water_marks(con)
+        if self.use_auth:
             if not _memory.auth:
                 auth = AsyncioAuthenticator(_memory.zmq_context)
                 _memory.auth = auth
                 auth.start()
                 auth.allow('127.0.0.1')
                 auth.configure_curve(domain='*', location=settings.AUTH_KEY_LOC)
-            client_secret_file = os.path.join(settings.AUTH_KEY_LOC, client_key_file_name)
+            client_secret_file = os.path.join(settings.AUTH_KEY_LOC, self.client_key_file_name)
             try:
                 client_public, client_secret = zmq.auth.load_certificate(client_secret_file)
-                self.con.curve_secretkey = client_secret
-                self.con.curve_publickey = client_public
-                server_public_file = os.path.join(settings.AUTH_KEY_LOC, server_key_file_name)
+                con.curve_secretkey = client_secret
+                con.curve_publickey = client_public
+                server_public_file = os.path.join(settings.AUTH_KEY_LOC, self.server_key_file_name)
                 server_public, _ = zmq.auth.load_certificate(server_public_file)
-                self.con.curve_serverkey = server_public
+                con.curve_serverkey = server_public
             except Exception as e:
                 network_log.error(f"Error loading client key files: {e}")
+        return con
 
+    async def handshake(self, con, timeout=1000):
+        """
+        Exchange plugin signatures with the server.
 
+        :param con: Connected socket
+        :param timeout: Time to wait for the answer in ms
+        :return: Answer of the server or None if there was none in time
+        """
+        msg = {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.CLIENT, "request_info": "plugin_signatures",
+               "plugin_signatures": packed_signatures(), "ID": _memory.ID,
+               "INSTANCE": _memory.instance_id, "COMPRESSION": supported_compression(), "ARROW": pa is not None,
+               "CREDITS": advertised_call_credits(), "HEARTBEAT": settings.HEARTBEAT_INTERVAL}
+        if self in self.remote_hashes:
+            # plugins of the previous connection are kept, the server only needs to send changes
+            present = _memory.get_remote_plugin_ids(self, self)
+            msg["PLUGIN_HASHES"] = {k: v for k, v in self.remote_hashes[self].items() if k in present}
+        packed_msg = msgpack.packb(msg)
+        await con.send(packed_msg)
+        evts = await con.poll(timeout)
+        if evts == 0:
+            return None
+        message = await con.recv(zmq.NOBLOCK)
+        return deserialize([message])
 
-        self.is_server = False
+    def apply_handshake(self, msg):
+        """
+        Take over plugins and connection settings from the handshake answer of the server.
+        """
+        if msg["VERSION"] != _memory.version:
+            network_log.critical(
+                f"Rixaplugin version mismatch. Server: {msg['VERSION'][:8]}, Client: {_memory.version[:8]}."
+                f"Network protocol likely incompatible. Do not report bugs using this config!")
+        network_log.info("Connection established")
+        self.compression.pop(self, None)
+        if msg.get("COMPRESSION"):
+            self.compression[self] = msg["COMPRESSION"]
+        if msg.get("ARROW") and pa is not None:
+            self.arrow_peers.add(self)
+        else:
+            self.arrow_peers.discard(self)
+        self.set_call_credits(self, msg.get("CREDITS"))
+        if "plugin_hashes" in msg and self in self.remote_hashes:
+            # only changed plugins were sent, unchanged ones are kept
+            _memory.remove_remote(self, plugin_ids=msg.get("removed_plugins", []))
+            _memory.refresh_remote(self, self, msg.get("INSTANCE"))
+        else:
+            # a restarted server may have different plugins and ids
+            _memory.remove_remote(self)
+        _memory.add_plugin(msg.get("plugin_signatures"), self, self, origin_is_client=False,
+                           instance=msg.get("INSTANCE"))
+        if "plugin_hashes" in msg:
+            self.remote_hashes[self] = msg["plugin_hashes"]
+        self.last_seen[self] = time.monotonic()
+        self.offline.discard(self)
+
+    def set_connection_alive(self, identity, alive):
+        super().set_connection_alive(identity, alive)
+        if alive:
+            return
+        self.fail_pending_requests(keep_idempotent=settings.AUTO_RECONNECT)
+        if settings.AUTO_RECONNECT and not self.reconnect_task:
+            self.reconnect_task = asyncio.create_task(self.reconnect())
+
+    def fail_pending_requests(self, keep_idempotent=False):
+        """
+        Fail pending calls as the connection to the server was lost.
+
+        :param keep_idempotent: Keep calls that can be sent again after reconnecting
+        """
+        for request_id, entry in list(self.pending_requests.items()):
+            if keep_idempotent and entry.get("message"):
+                continue
+            exc = RemoteUnavailableException(f"Connection to {self.full_address} lost during call")
+            if "stream" in entry:
+                entry["stream"].close(exc)
+            elif not entry["future"].done():
+                entry["future"].set_exception(exc)
+            del self.pending_requests[request_id]
+
+    async def reconnect(self):
+        """
+        Reconnect to the server with a new socket, using exponential backoff with jitter between attempts.
+
+        On success the handshake is repeated and pending calls of idempotent functions are sent again.
+        """
+        attempt = 0
+        try:
+            while not settings.RECONNECT_MAX_ATTEMPTS or attempt < settings.RECONNECT_MAX_ATTEMPTS:
+                delay = min(settings.RECONNECT_BACKOFF_MAX, settings.RECONNECT_BACKOFF_BASE * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+                attempt += 1
+                con = self._create_socket()
+                con.connect(self.full_address)
+                try:
+                    msg = await self.handshake(con)
+                except Exception as e:
+                    network_log.warning(f"Reconnect to {self.full_address} failed: {e}")
+                    msg = None
+                if msg is None or not msg["HEAD"] & HeaderFlags.ACKNOWLEDGE:
+                    _memory.delete_connection(con)
+                    network_log.debug(f"Reconnect attempt {attempt} to {self.full_address} failed")
+                    continue
+                old_con, self.con = self.con, con
+                # listen() notices the swap when its pending receive on the old socket is cancelled
+                _memory.delete_connection(old_con)
+                self.apply_handshake(msg)
+                network_log.info(f"Reconnected to {self.full_address} after {attempt} attempts")
+                await self._replay_pending_requests()
+                return True
+            network_log.error(f"Giving up reconnecting to {self.full_address} after {attempt} attempts")
+            self.fail_pending_requests()
+            return False
+        finally:
+            self.reconnect_task = None
+
+    async def _replay_pending_requests(self):
+        plugin_ids = {val["name"]: replica["id"] for val in _memory.plugins.values()
+                      for replica in val.get("replicas", []) if replica["remote_origin"] is self}
+        for request_id, entry in list(self.pending_requests.items()):
+            message = entry.get("message")
+            if not message:
+                continue
+            if message["plugin_name"] not in plugin_ids:
+                self.pending_requests.pop(request_id)
+                entry["future"].set_exception(RemoteUnavailableException(
+                    f"Plugin '{message['plugin_name']}' no longer available after reconnect",
+                    plugin_name=message["plugin_name"]))
+                continue
+            message["plugin_id"] = plugin_ids[message["plugin_name"]]
+            message["no_ack"] = True
+            network_log.debug(f"Replaying {message['func_name']} ({request_id})")
+            await self.send(self, message)
 
     def __del__(self):
         _memory.delete_connection(self.con)
@@ -563,9 +1624,6 @@ class PluginClient(NetworkAdapter):
     def __repr__(self):
         return self.full_address +"AAAAAAAAAAAAAAAAAAAAAA"
 
-    def reconnect(self):
-        raise NotImplementedError()
-
     # def add_remote_to_modules(self):
     #
     #     if not self.name:
@@ -576,4 +1634,5 @@ class PluginClient(NetworkAdapter):
     #     construct_importable(name, self.remote_function_signatures, description="Remote plugin module")
 
 
-from rixaplugin.internal.executor import execute_networked, FunctionNotFoundException
+from rixaplugin.internal.executor import execute_networked, execute_networked_batch, FunctionNotFoundException, \
+    estimate_completion_time, get_queued_task_count, get_call_capacity
@@ -0,0 +1,158 @@
+"""
+Passes large buffers between the main process and process workers through shared memory.
+
+Arguments and return values of functions running in PROCESS mode are normally pickled and sent through the pipe of the
+process pool, i.e. copied several times. Objects containing large buffers (numpy arrays, pandas objects...) are instead
+pickled with out-of-band buffers (pickle protocol 5). The buffers are written into a memory mapped file and only the
+file path and the small in-band part of the pickle are sent.
+The receiver maps the file and reconstructs the objects on top of the mapping without copying. The mapping is reference
+counted by the objects using it, so the file can be removed right after mapping.
+"""
+import glob
+import mmap
+import os
+import pickle
+import tempfile
+
+from rixaplugin import settings
+
+_ALIGNMENT = 64
+
+
+class SharedPayload:
+    """
+    Pickled object whose large buffers live in a memory mapped file.
+    """
+
+    def __init__(self, data, path, layout):
+        """
+        :param data: In-band part of the pickle
+        :param path: File containing the out-of-band buffers
+        :param layout: List of (offset, size) of the buffers in the file
+        """
+        self.data = data
+        self.path = path
+        self.layout = layout
+
+    def load(self, release=False):
+        """
+        Reconstruct the object. Its buffers are copy-on-write mappings of the file, changes are not shared.
+
+        :param release: Remove the file once it is mapped. For payloads with a single receiver.
+        :return: The packed object
+        """
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if release:
+            self.release()
+        view = memoryview(mapped)
+        return pickle.loads(self.data, buffers=[view[offset:offset + size] for offset, size in self.layout])
+
+    def release(self):
+        """
+        Remove the file. Existing mappings stay valid.
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _prefix(owner_pid):
+    return f"rixaplugin-{owner_pid}-"
+
+
+def _nbytes(obj):
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        # numpy arrays, pandas series and indices
+        return nbytes
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        # pandas dataframes
+        return int(obj.memory_usage(index=False).sum())
+    return 0
+
+
+def _contains_large(obj, threshold, depth=4):
+    if isinstance(obj, (list, tuple)):
+        return depth > 0 and any(_contains_large(item, threshold, depth - 1) for item in obj)
+    if isinstance(obj, dict):
+        return depth > 0 and any(_contains_large(item, threshold, depth - 1) for item in obj.values())
+    return _nbytes(obj) >= threshold
+
+
+def pack(obj, owner_pid=None):
+    """
+    Move the large buffers of an object into shared memory.
+
+    :param obj: Object to send to another process. Containers are searched for large objects up to a small depth.
+    :param owner_pid: Process that is responsible for removing leftover files. Defaults to the current one
+    :return: SharedPayload or obj if there is nothing worth sharing (see settings.SHARED_MEMORY_THRESHOLD)
+    """
+    threshold = settings.SHARED_MEMORY_THRESHOLD
+    if not threshold or not _contains_large(obj, threshold):
+        return obj
+    buffers = []
+
+    def keep_large(buffer):
+        try:
+            raw = buffer.raw()
+        except BufferError:
+            # not contiguous
+            return True
+        if raw.nbytes < threshold:
+            return True
+        buffers.append(raw)
+        return False
+
+    data = pickle.dumps(obj, protocol=5, buffer_callback=keep_large)
+    if not buffers:
+        return obj
+    layout = []
+    size = 0
+    for raw in buffers:
+        layout.append((size, raw.nbytes))
+        size += -(-raw.nbytes // _ALIGNMENT) * _ALIGNMENT
+    fd, path = tempfile.mkstemp(prefix=_prefix(owner_pid or os.getpid()), dir=settings.SHARED_MEMORY_DIR)
+    try:
+        os.ftruncate(fd, size)
+        with mmap.mmap(fd, size) as mapped:
+            for (offset, nbytes), raw in zip(layout, buffers):
+                mapped[offset:offset + nbytes] = raw
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        os.close(fd)
+    return SharedPayload(data, path, layout)
+
+
+def unpack(obj, release=False):
+    """
+    Counterpart of pack.
+
+    :param obj: Return value of pack
+    :param release: See SharedPayload.load
+    """
+    if isinstance(obj, SharedPayload):
+        return obj.load(release)
+    return obj
+
+
+def release(obj):
+    """
+    Remove the file of a payload once all receivers have loaded it.
+    """
+    if isinstance(obj, SharedPayload):
+        obj.release()
+
+
+def cleanup():
+    """
+    Remove files of payloads owned by this process that never got released, e.g. because a worker died.
+    """
+    for path in glob.glob(os.path.join(settings.SHARED_MEMORY_DIR, _prefix(os.getpid()) + "*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
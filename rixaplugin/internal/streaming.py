@@ -0,0 +1,134 @@
+import asyncio
+import collections
+
+from rixaplugin import settings
+
+
+class ResultStream:
+    """
+    Async iterator over the chunks yielded by a generator plugin function.
+
+    Use `async for chunk in stream` to process chunks as they arrive. Awaiting the stream itself collects all chunks
+    into a list, so code that expects a single return value keeps working.
+    Chunks are buffered up to maxsize. Producers are paused once the buffer is full.
+    """
+
+    def __init__(self, maxsize=None, on_consume=None):
+        """
+        :param maxsize: Maximum number of buffered chunks. 0 means unbounded. Defaults to settings.STREAM_WINDOW
+        :param on_consume: Coroutine function called after each consumed chunk. Used for network flow control.
+        """
+        self.maxsize = settings.STREAM_WINDOW if maxsize is None else maxsize
+        self._buffer = collections.deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._done = False
+        self._exception = None
+        self._close_exception = None
+        self._callbacks = []
+        self._on_consume = on_consume
+
+    @property
+    def closed(self):
+        return self._done
+
+    async def put(self, chunk):
+        """
+        Add a chunk. Waits while the buffer is full.
+        """
+        while self.maxsize and len(self._buffer) >= self.maxsize and not self._done:
+            self._writable.clear()
+            await self._writable.wait()
+        self.put_nowait(chunk)
+
+    def put_nowait(self, chunk):
+        if self.cancelled():
+            # lets the producer stop
+            raise asyncio.CancelledError()
+        if self._done:
+            raise RuntimeError("Can't add chunks to a closed stream")
+        self._buffer.append(chunk)
+        self._readable.set()
+
+    def close(self, exception=None):
+        """
+        Mark the end of the stream.
+
+        :param exception: If set, the consumer will receive this exception after all buffered chunks.
+        """
+        if self._done:
+            return
+        self._done = True
+        self._exception = exception
+        self._close_exception = exception
+        self._readable.set()
+        self._writable.set()
+        for callback in self._callbacks:
+            callback(self)
+        self._callbacks = []
+
+    def cancel(self):
+        """
+        Stop the stream from the consumer side. Producers are cancelled when they add their next chunk.
+        """
+        self.close(asyncio.CancelledError())
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(stream) once the stream is closed i.e. the producer is done. Mirrors asyncio.Future.
+        """
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def cancelled(self):
+        return isinstance(self._close_exception, asyncio.CancelledError)
+
+    def exception(self):
+        """
+        :return: Exception the producer failed with or None
+        """
+        return self._close_exception
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._buffer:
+            if self._done:
+                if self._exception is not None:
+                    exception, self._exception = self._exception, None
+                    raise exception
+                raise StopAsyncIteration
+            self._readable.clear()
+            await self._readable.wait()
+        chunk = self._buffer.popleft()
+        self._writable.set()
+        if self._on_consume:
+            await self._on_consume()
+        return chunk
+
+    async def collect(self):
+        """
+        Wait for the end of the stream.
+
+        :return: List of all chunks
+        """
+        return [chunk async for chunk in self]
+
+    def __await__(self):
+        return self.collect().__await__()
+
+
+def close_stream_when_done(future, stream):
+    """
+    Done callback for the future of the producer. Closes the stream, forwarding exceptions to the consumer.
+    """
+    if future.cancelled():
+        stream.close(asyncio.CancelledError())
+    elif future.exception() is not None:
+        stream.close(future.exception())
+    else:
+        stream.close()
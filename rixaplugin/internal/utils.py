@@ -1,9 +1,16 @@
+import collections
 import contextlib
+import heapq
 import json
 import os
 import asyncio
+import itertools
 import logging
 import random
+import reprlib
+import secrets
+import threading
+import time
 
 from rixaplugin import settings
 from rixaplugin.settings import DEBUG, VERBOSE_REQUEST_ID
@@ -52,6 +59,24 @@ def is_valid_call(func_metadata, args, kwargs):
 
 
 
+def map_structure(obj, func):
+    """
+    Apply func to every leaf of a nested dict/list/tuple structure.
+
+    The structure is rebuilt, the original is never modified.
+    :param obj: Arbitrarily nested combination of dicts, lists and tuples
+    :param func: Called with every leaf, returns the replacement for that leaf
+    :return: New structure with replaced leaves
+    """
+    if isinstance(obj, dict):
+        return {k: map_structure(v, func) for k, v in obj.items()}
+    if type(obj) is list:
+        return [map_structure(v, func) for v in obj]
+    if type(obj) is tuple:
+        return tuple(map_structure(v, func) for v in obj)
+    return func(obj)
+
+
 async def event_wait(evt, timeout):
     # suppress TimeoutError because we'll return False in case of timeout
     with contextlib.suppress(asyncio.TimeoutError):
@@ -77,39 +102,284 @@ async def supervise_future(future, id=None):
     asyncio.create_task(supervisor(future, id))
 
 
-def identifier_from_signature(fname, args=[], kwargs={}):
-    """
-    Create a unique identifier from function signature.
-
-    If debug mode is enabled, this returns a human-readable string, that allows to identify the function.
-    This means the ID is not necessarily unique!
-    :param fname:
-    :param args:
-    :param kwargs:
-    :return: Unique identifier
-    """
-    if VERBOSE_REQUEST_ID:
-        args_str = str(args)[:10]
-        kwargs_str = str(kwargs)[:10]
-        signature = f"{fname}({args_str}, {kwargs_str})"
-        signature = signature+":"+str(hash(signature))[1:5]+":"+str(random.randint(0, 1000))
-        return signature
-    signature = fname
-    for arg in args:
-        signature += str(arg)
-    if len(args) == 0:
-        signature += "NOARGS"
-    for k, v in kwargs.items():
-        signature += str(k) + str(v)
-    if len(kwargs) == 0:
-        signature += "NOKWARGS"
-    signature+=str(random.randint(0, 1000))
-    return hash(signature)
+class RollingLatency:
+    """
+    Exponentially weighted moving average and variance of durations.
+    """
+
+    def __init__(self, alpha=0.2):
+        """
+        :param alpha: Weight of the newest duration
+        """
+        self.alpha = alpha
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+
+    def add(self, duration):
+        self.count += 1
+        if self.mean is None:
+            self.mean = duration
+            return
+        diff = duration - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+
+    def __repr__(self):
+        return f"RollingLatency(mean={self.mean}, variance={self.variance}, count={self.count})"
+
+
+class CallCredits:
+    """
+    Limits the number of calls in flight on a connection.
+
+    The limit is advertised by the receiving side. A request for more credits than the limit is granted once no
+    other call is in flight, so large batches can't block forever.
+    """
+
+    def __init__(self, limit):
+        """
+        :param limit: Maximum number of calls in flight
+        """
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = []
+
+    def available(self, n=1):
+        return not self.in_use or self.in_use + n <= self.limit
+
+    async def acquire(self, n=1, timeout=None):
+        """
+        Wait until n credits are available and take them.
+
+        :param timeout: Maximum time to wait in seconds. Waits as long as needed if None
+        :raises asyncio.TimeoutError: If the credits did not become available in time
+        """
+        loop = asyncio.get_running_loop()
+        end = None if timeout is None else loop.time() + timeout
+        while not self.available(n):
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                if end is None:
+                    await waiter
+                else:
+                    await asyncio.wait_for(waiter, max(end - loop.time(), 0))
+            finally:
+                self._waiters.remove(waiter)
+        self.in_use += n
+
+    def release(self, n=1):
+        self.in_use = max(0, self.in_use - n)
+        self._wake()
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class OrderedDispatcher:
+    """
+    Runs coroutines concurrently while preserving the order of those that share a key.
+
+    Coroutines with the same key run one after another in order of submission, different keys don't wait for each
+    other. At most limit coroutines are pending at once, submitting more waits until one is done. This way a receive
+    loop stops reading from its socket instead of piling up handlers.
+    """
+
+    def __init__(self, limit, log=None):
+        """
+        :param limit: Maximum number of pending coroutines
+        :param log: Logger for exceptions raised by the coroutines
+        """
+        self.slots = CallCredits(limit)
+        self.log = log or task_superviser_log
+        self._queues = {}
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        return self.slots.in_use
+
+    async def submit(self, key, coro):
+        """
+        Schedule a coroutine after all previously submitted ones with the same key.
+
+        :param key: Hashable ordering key. None runs the coroutine without ordering constraints
+        :param coro: Coroutine object
+        """
+        await self.slots.acquire()
+        if key is None:
+            key = object()
+        if key in self._queues:
+            self._queues[key].append(coro)
+            return
+        self._queues[key] = collections.deque([coro])
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception:
+                    self.log.exception(f"Error in dispatched coroutine with key {key}")
+                finally:
+                    queue.popleft()
+                    self.slots.release()
+        finally:
+            # only reached with coroutines left if cancelled
+            for coro in queue:
+                coro.close()
+                self.slots.release()
+            del self._queues[key]
+
+    def cancel(self):
+        """
+        Cancel all pending coroutines.
+        """
+        for task in self._tasks:
+            task.cancel()
+
+
+class ExpiryService:
+    """
+    Calls a callback once the deadline of a key has passed, e.g. to drop the api object of a finished request.
+
+    All deadlines are kept in one heap which is swept by a single task, instead of one sleeping task per key.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, log=None):
+        """
+        :param log: Logger for exceptions raised by the callbacks
+        """
+        self.log = log or task_superviser_log
+        # key -> [deadline, callback]
+        self._entries = {}
+        # (deadline, sequence number, key). May contain outdated items, these are skipped when popped
+        self._heap = []
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, delay, callback):
+        """
+        Call callback() in delay seconds. Replaces the deadline and callback of an already scheduled key.
+
+        :param key: Hashable key, e.g. a request id
+        :param delay: Time in seconds
+        :param callback: Called without arguments
+        """
+        deadline = time.monotonic() + delay
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= deadline:
+            # the heap item of the earlier deadline is moved back once popped, no need for another one
+            entry[0], entry[1] = deadline, callback
+            return
+        self._entries[key] = [deadline, callback]
+        if self._heap and deadline < self._heap[0][0] and self._wakeup:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key):
+        """
+        Remove a key without calling its callback. Unknown keys are ignored.
+        """
+        self._entries.pop(key, None)
+
+    def _compact(self):
+        self._heap = [(entry[0], next(self._counter), key) for key, entry in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                await event_wait(self._wakeup, delay)
+                continue
+            heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] > deadline:
+                heapq.heappush(self._heap, (entry[0], next(self._counter), key))
+                continue
+            del self._entries[key]
+            try:
+                entry[1]()
+            except Exception:
+                self.log.exception(f"Error in expiry callback for {key}")
+
+
+class RequestIdAllocator:
+    """
+    Hands out request ids that are unique across processes and network hops.
+
+    Ids are a per-process prefix (namespace and a random token) followed by a counter. Allocation costs the same
+    regardless of the arguments of a call. Forked processes detect the new pid and pick a fresh prefix.
+    """
+
+    def __init__(self, namespace):
+        """
+        :param namespace: Prefix shared by all ids of this peer, usually _memory.ID
+        """
+        self.namespace = namespace
+        # (pid, prefix, counter), replaced as a whole so that threads never combine a prefix with another counter
+        self._state = (None, None, None)
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        with self._lock:
+            if self._state[0] != os.getpid():
+                self._state = (os.getpid(), f"{self.namespace}-{secrets.token_hex(4)}-", itertools.count())
+            return self._state
+
+    def new(self, fname=None, args=(), kwargs=None):
+        """
+        Allocate a new request id.
+
+        :param fname: Name of the called function. Only used if VERBOSE_REQUEST_ID is set
+        :param args: Only used if VERBOSE_REQUEST_ID is set
+        :param kwargs: Only used if VERBOSE_REQUEST_ID is set
+        :return: Request id as string
+        """
+        state = self._state
+        if state[0] != os.getpid():
+            state = self._reset()
+        _, prefix, counter = state
+        # next() on itertools.count is atomic, no lock needed for calls from worker threads
+        request_id = prefix + str(next(counter))
+        if VERBOSE_REQUEST_ID and fname:
+            request_id += f":{fname}({reprlib.repr(args)}, {reprlib.repr(kwargs or {})})"
+        return request_id
 
 
     PLUGIN_REGISTRY = "/tmp/plugin_registry.json"
 
-def make_discoverable(id: str, endpoint: str, port: int, plugins: list) -> None:
+def make_discoverable(id: str, endpoint: str, port: int, plugins: list, ipc_endpoint: str = None) -> None:
     """
     Make oneself available by writing to the registry file.
     If the plugin is already registered, it will be updated with new values.
@@ -118,6 +388,7 @@ def make_discoverable(id: str, endpoint: str, port: int, plugins: list) -> None:
     :param endpoint: An IP-like string (e.g. "localhost", "example.com")
     :param port: A TCP port number
     :param description: A short human-readable description of the plugin
+    :param ipc_endpoint: ipc:// address for peers on the same host, if the server listens on one
     """
     registry = {}
     if os.path.exists(settings.PLUGIN_REGISTRY):
@@ -130,7 +401,8 @@ def make_discoverable(id: str, endpoint: str, port: int, plugins: list) -> None:
             existing_plugin.update({
                 "endpoint": endpoint,
                 "port": port,
-                "plugins": plugins
+                "plugins": plugins,
+                "ipc_endpoint": ipc_endpoint
             })
             break
     else:  # not found, so we're adding anew...
@@ -138,7 +410,8 @@ def make_discoverable(id: str, endpoint: str, port: int, plugins: list) -> None:
             "ID": id,
             "endpoint": endpoint,
             "port": port,
-            "plugins": plugins
+            "plugins": plugins,
+            "ipc_endpoint": ipc_endpoint
         }
     try:
         with open(settings.PLUGIN_REGISTRY, 'w') as f:
@@ -1,5 +1,6 @@
 from decouple import Config, RepositoryEnv, Csv, Choices, AutoConfig
 import os
+import tempfile
 import logging.config
 from rixaplugin.internal.rixalogger import RIXALogger as _RIXALogger
 from .internal import rixalogger
@@ -70,7 +71,7 @@ DEBUG = config("DEBUG", default=True, cast=bool)
 """Debug mode
 """
 VERBOSE_REQUEST_ID = config("VERBOSE_REQUEST_ID", default=False, cast=bool)
-"""Turns the request id from a hash to a readable string. This is useful for debugging but will lead to collisions.
+"""Appends a readable signature of the call to each request id. Useful for debugging, but makes messages larger.
 """
 
 PLUGIN_DEFAULT_PORT = config("PLUGIN_SERVER_PORT", default=15000, cast=int)
@@ -153,6 +154,15 @@ MAKE_REMOTES_IMPORTABLE = config("MAKE_REMOTES_IMPORTABLE", default=True, cast=b
 
 PLUGIN_REGISTRY = config("PLUGIN_REGISTRY", default="/tmp/plugin_registry.json")
 
+USE_IPC = config("USE_IPC", default=True, cast=bool)
+"""Servers additionally listen on an ipc:// endpoint, which is advertised in the PLUGIN_REGISTRY.
+Clients connecting to a server on the same host use it instead of tcp. ipc connections are not encrypted,
+access is restricted to the user running the server via the permissions of the socket file.
+Not used with USE_AUTH_SYSTEM, as ipc can't authenticate peers."""
+
+IPC_DIRECTORY = config("IPC_DIRECTORY", default=tempfile.gettempdir())
+"""Directory for the socket files of ipc endpoints. Paths longer than ~100 characters are not supported by the OS."""
+
 DEFAULT_MAX_WORKERS = config("DEFAULT_MAX_WORKERS", default=4, cast=int)
 """Default number of worker threads for a plugin server. This is the number of threads or processes that can execute plugin code.
 """
@@ -225,6 +235,124 @@ Multiple occurences can lead to a plugin being marked as offline and hence be di
 Also: Try to avoid timing out. It potentially leads to a plethora of error messages as everything along the call chain
 will subsequently time out too. All intermediate instances may raise some sort of error."""
 
+DEFAULT_CALL_DEADLINE = config("DEFAULT_CALL_DEADLINE", default=0, cast=float)
+"""Deadline in seconds for calls made without an explicit timeout. Deadlines are propagated to remotes and nested calls,
+which drop calls still queued once it passed. 0 means such calls have no deadline of their own."""
+
+PIPELINED_CALLS = config("PIPELINED_CALLS", default=False, cast=bool)
+"""Send remote calls without waiting for an acknowledgement. The return or exception of a call doubles as
+acknowledgement, which saves one network round trip per call and allows many calls in flight per connection.
+As there is no acknowledgement, an offline remote is not detected by the call itself and there is no time estimate."""
+
+STREAM_WINDOW = config("STREAM_WINDOW", default=16, cast=int)
+"""Maximum number of chunks a generator plugin function may produce ahead of the consumer.
+The producer (thread, process or remote) is paused until the consumer catches up."""
+
+HEARTBEAT_INTERVAL = config("HEARTBEAT_INTERVAL", default=2.0, cast=float)
+"""Seconds between heartbeats on each connection. 0 disables heartbeats.
+Any message counts as sign of life, heartbeats are only needed for idle connections."""
+
+HEARTBEAT_MISS_THRESHOLD = config("HEARTBEAT_MISS_THRESHOLD", default=3, cast=int)
+"""Number of heartbeat intervals without any message after which the plugins of a connection are marked offline.
+They are marked online again as soon as a message arrives."""
+
+REPLICA_POLICY = config("REPLICA_POLICY", default="least_tasks")
+"""How to choose between several remotes serving a plugin with the same name.
+One of least_tasks, power_of_two, expected_completion or a policy added via balancing.register_policy."""
+
+AUTO_RECONNECT = config("AUTO_RECONNECT", default=True, cast=bool)
+"""Whether clients reconnect to their server when the connection is lost (see HEARTBEAT_INTERVAL).
+Pending calls of functions marked as idempotent are sent again after reconnecting, all others fail immediately."""
+
+RECONNECT_BACKOFF_BASE = config("RECONNECT_BACKOFF_BASE", default=0.5, cast=float)
+"""Maximum delay in seconds before the first reconnect attempt. Doubles with every failed attempt (with random jitter)."""
+
+RECONNECT_BACKOFF_MAX = config("RECONNECT_BACKOFF_MAX", default=30.0, cast=float)
+"""Upper limit in seconds for the delay between reconnect attempts."""
+
+RECONNECT_MAX_ATTEMPTS = config("RECONNECT_MAX_ATTEMPTS", default=0, cast=int)
+"""Number of reconnect attempts before giving up. 0 means never give up."""
+
+COMPRESSION_ALGORITHMS = config("COMPRESSION_ALGORITHMS", default="zstd,lz4,zlib", cast=Csv())
+"""Compression algorithms offered during the connection handshake, in order of preference.
+zstd and lz4 require the zstandard/lz4 packages. Leave empty to disable compression."""
+
+COMPRESSION_THRESHOLD = config("COMPRESSION_THRESHOLD", default=16 * 1024, cast=int)
+"""Size in bytes from which messages are compressed (if a compression algorithm was negotiated).
+Out-of-band frames (see ZERO_COPY_THRESHOLD) are never compressed."""
+
+ZERO_COPY_THRESHOLD = config("ZERO_COPY_THRESHOLD", default=64 * 1024, cast=int)
+"""Size in bytes from which numpy arrays and raw buffers in call arguments/returns are sent as separate zmq frames
+instead of being serialized into the message. These frames are neither copied on send nor on receive.
+Arrays received this way are read-only views on the network buffer. 0 disables out-of-band transport."""
+
+MAX_INFLIGHT_PER_CONNECTION = config("MAX_INFLIGHT_PER_CONNECTION", default=0, cast=int)
+"""Maximum number of calls a peer may have running on this plugin over one connection. Advertised during the handshake.
+Peers hold further calls locally until earlier ones are done. 0 derives the limit from the number of workers and MAX_QUEUE_SIZE.
+Calls exceeding the limit (i.e. from peers ignoring it) are rejected immediately with a QueueOverflowException."""
+
+PENDING_REQUEST_EXPIRY = config("PENDING_REQUEST_EXPIRY", default=600, cast=float)
+"""Time in seconds after which a remote call without any answer is given up. Its future fails with a
+RemoteTimeoutException and the associated API object is dropped. Streams are kept as long as chunks arrive.
+One way calls keep their API object (for API calls from the remote) for this long."""
+
+MAX_CONCURRENT_HANDLERS = config("MAX_CONCURRENT_HANDLERS", default=64, cast=int)
+"""Maximum number of received messages per connection whose handling may be in progress at once (e.g. API calls
+awaiting a websocket push). Messages belonging to the same request are still handled in order.
+1 handles every message before the next one is received."""
+
+WORKER_AFFINITY = config("WORKER_AFFINITY", cast=Csv(), default='')
+"""Route calls with the same affinity key to the same worker, so that per-worker state (worker_context) stays warm.
+Comma separated sources of the key, tried in order: keys of the api state (e.g. session_id) or 'identity' for the
+calling connection. @plugfunc(affinity=...) takes precedence. Empty disables affinity i.e. all workers share one
+queue."""
+
+AFFINITY_SPILL_LOAD = config("AFFINITY_SPILL_LOAD", default=2, cast=int)
+"""Number of running and waiting calls of a worker from which further calls with its affinity key go to any free worker
+instead."""
+
+AUTOSCALE_MAX_WORKERS = config("AUTOSCALE_MAX_WORKERS", default=0, cast=int)
+"""If larger than the number of workers the plugin system is started with (DEFAULT_MAX_WORKERS), workers are added up
+to this many while calls are waiting and removed again once idle. worker_init only runs in the new workers.
+Scaling events are logged and counted in the executor metrics."""
+
+AUTOSCALE_QUEUE_LENGTH = config("AUTOSCALE_QUEUE_LENGTH", default=2, cast=int)
+"""Number of calls waiting for any worker from which workers are added."""
+
+AUTOSCALE_QUEUE_WAIT = config("AUTOSCALE_QUEUE_WAIT", default=0.5, cast=float)
+"""Time in s a call may wait for a worker before workers are added."""
+
+AUTOSCALE_IDLE_TIME = config("AUTOSCALE_IDLE_TIME", default=60, cast=float)
+"""Time in s after which an idle worker above the initial number is removed."""
+
+WORKER_MAX_TASKS = config("WORKER_MAX_TASKS", default=0, cast=int)
+"""Replace a process worker after this many calls, e.g. to get rid of memory leaks of plugins. The worker finishes its
+current call first and worker_init runs in the replacement. 0 disables."""
+
+WORKER_MAX_RSS = config("WORKER_MAX_RSS", default=0, cast=float)
+"""Replace a process worker before its next call once its resident memory exceeds this many MB. 0 disables."""
+
+WORKER_MAX_AGE = config("WORKER_MAX_AGE", default=0, cast=float)
+"""Replace a process worker before its next call once it is older than this many seconds. 0 disables."""
+
+EXECUTORS = config("EXECUTORS", cast=Csv(), default='')
+"""Named executors besides the default one of the plugin system mode (THREAD/PROCESS), as comma separated
+name:kind:workers, e.g. 'cpu:process:4,io:thread:32'. Kinds are thread, process and inline. Inline runs calls in the
+event loop thread, i.e. is only suited for quick functions that don't use the sync API.
+Sync functions pick one with @plugfunc(executor=...) or via PLUGIN_EXECUTORS."""
+
+PLUGIN_EXECUTORS = config("PLUGIN_EXECUTORS", cast=Csv(), default='')
+"""Executor of all sync functions of a plugin, as comma separated plugin:executor, e.g. 'xai:cpu,websearch:io'.
+@plugfunc(executor=...) takes precedence."""
+
+SHARED_MEMORY_THRESHOLD = config("SHARED_MEMORY_THRESHOLD", default=1048576, cast=int)
+"""Buffers (e.g. numpy arrays) of at least this many bytes are passed to and from process workers through shared
+memory instead of being copied through the pool's pipe. 0 disables shared memory."""
+
+SHARED_MEMORY_DIR = config("SHARED_MEMORY_DIR",
+                           default="/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+"""Folder for the shared memory files. Should be backed by RAM (tmpfs)."""
+
 if USE_RIXA_LOGGING:
     logging.setLoggerClass(_RIXALogger)
 LOGGING = {
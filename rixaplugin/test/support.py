@@ -0,0 +1,93 @@
+"""
+Plugin servers in separate processes for tests that need a real connection.
+"""
+import asyncio
+import multiprocessing
+import socket
+import time
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def run_server(port):
+    from rixaplugin import init_plugin_system, PluginModeFlags, create_and_start_plugin_server
+    from rixaplugin.decorators import plugfunc
+
+    # registered in the server process only, the client must reach them through the connection
+    @plugfunc()
+    def add(a, b):
+        return a + b
+
+    @plugfunc()
+    def slow(duration):
+        time.sleep(duration)
+        return duration
+
+    @plugfunc(idempotent=True)
+    def idempotent_slow(duration):
+        time.sleep(duration)
+        return duration
+
+    @plugfunc()
+    def fail(message):
+        raise ValueError(message)
+
+    @plugfunc()
+    def count_up(n, fail_at=None):
+        for i in range(n):
+            if i == fail_at:
+                raise ValueError(f"Failed at {i}")
+            yield i
+
+    async def main():
+        init_plugin_system(PluginModeFlags.THREAD)
+        server, future = await create_and_start_plugin_server(port, use_auth=False)
+        await future
+
+    asyncio.run(main())
+
+
+def start_server(port, wait=2):
+    """
+    :param port: Port of the server
+    :param wait: Seconds to wait for the server to start
+    :return: multiprocessing.Process of the server
+    """
+    process = multiprocessing.get_context("spawn").Process(target=run_server, args=(port,), daemon=True)
+    process.start()
+    time.sleep(wait)
+    return process
+
+
+def run_isolated(target, *args, timeout=60):
+    """
+    Run a test scenario in a fresh process, as the plugin system can only be initialized once per process.
+
+    :param target: Module level function. Its return value is passed back
+    :return: Return value of target
+    :raises AssertionError: If target raised, with its traceback as message
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_and_report, args=(queue, target, args))
+    process.start()
+    try:
+        ok, result = queue.get(timeout=timeout)
+    finally:
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+    if not ok:
+        raise AssertionError(result)
+    return result
+
+
+def _run_and_report(queue, target, args):
+    import traceback
+    try:
+        queue.put((True, target(*args)))
+    except BaseException:
+        queue.put((False, traceback.format_exc()))
@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import msgpack
+import numpy as np
+import pandas as pd
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import HeaderFlags
+from rixaplugin.internal import memory, networking
+from rixaplugin.internal.memory import PluginMemory
+from rixaplugin.internal.networking import serialize, deserialize
+
+
+def return_message(ret):
+    return {"HEAD": HeaderFlags.FUNCTION_RETURN, "request_id": "1", "return": ret}
+
+
+def sample_frame(rows):
+    return pd.DataFrame({"int": np.arange(rows), "float": np.linspace(0, 1, rows),
+                         "text": [f"row {i}" for i in range(rows)]}, index=pd.RangeIndex(10, 10 + rows, name="id"))
+
+
+def ext_encoder(obj):
+    return networking.encode_custom(obj, arrow=True)
+
+
+class ArrowTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(settings, "ZERO_COPY_THRESHOLD", 4096)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_round_trip(self, df, frames_expected):
+        frames = serialize(return_message({"df": df}), arrow=True)
+        self.assertEqual(len(frames), frames_expected)
+        pd.testing.assert_frame_equal(deserialize(frames)["return"]["df"], df)
+
+    def test_small_frame_is_sent_inline(self):
+        self.assert_round_trip(sample_frame(5), 1)
+
+    def test_large_frame_is_sent_as_own_frame(self):
+        self.assert_round_trip(sample_frame(2000), 2)
+
+    def test_frames_outside_of_payload(self):
+        df = sample_frame(3)
+        ext = networking.encode_custom(df, arrow=True)
+        self.assertEqual(ext.code, networking.DATAFRAME_EXT_TYPE)
+        packed = msgpack.packb({"df": df}, default=ext_encoder)
+        unpacked = msgpack.unpackb(packed, object_hook=networking.decode_custom, ext_hook=networking.decode_ext)
+        pd.testing.assert_frame_equal(unpacked["df"], df)
+
+    def test_split_encoding_for_peers_without_pyarrow(self):
+        df = sample_frame(2000)
+        frames = serialize(return_message(df))
+        self.assertEqual(len(frames), 1)
+        # decodable without pyarrow
+        with mock.patch.object(networking, "pa", None):
+            received = deserialize(frames)["return"]
+        pd.testing.assert_frame_equal(received, df, check_names=False)
+
+    def test_frames_arrow_cannot_represent(self):
+        for df in (pd.DataFrame({"a": [1, "x", {"k": 1}]}), pd.DataFrame({"a": [1, "x"] * 2000})):
+            frames = serialize(return_message({"df": df}), arrow=True)
+            self.assertEqual(len(frames), 1)
+            pd.testing.assert_frame_equal(deserialize(frames)["return"]["df"], df)
+
+
+class ArrowNegotiationTest(unittest.TestCase):
+
+    def setUp(self):
+        plugin_memory = PluginMemory()
+        for module in (memory, networking):
+            patcher = mock.patch.object(module, "_memory", plugin_memory)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.server = networking.NetworkAdapter(0, use_curve=False, manually_created=False)
+        self.server.is_server = True
+        self.server.first_connection = asyncio.Event()
+        self.sent = []
+
+        class Socket:
+            async def send_multipart(socket, frames, copy=True):
+                self.sent.append(frames[1:])
+
+        self.server.con = Socket()
+
+    def connect(self, identity, arrow):
+        msg = {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.CLIENT, "ID": "client", "INSTANCE": identity.decode()}
+        if arrow is not None:
+            msg["ARROW"] = arrow
+        asyncio.run(self.server.handle_remote_message(msg["HEAD"], msg, identity))
+        return deserialize(self.sent.pop())
+
+    def send_frame(self, identity):
+        asyncio.run(self.server.send(identity, return_message(sample_frame(3))))
+        header = msgpack.unpackb(self.sent.pop()[0], ext_hook=lambda code, data: code)
+        return header["return"]
+
+    def test_encoding_per_peer(self):
+        self.assertTrue(self.connect(b"new", True)["ARROW"])
+        self.connect(b"old", None)
+        self.connect(b"no_pyarrow", False)
+        self.assertEqual(self.send_frame(b"new"), networking.DATAFRAME_EXT_TYPE)
+        self.assertIn("__pandas_dataframe__", self.send_frame(b"old"))
+        self.assertIn("__pandas_dataframe__", self.send_frame(b"no_pyarrow"))
+
+    def test_not_advertised_without_pyarrow(self):
+        with mock.patch.object(networking, "pa", None):
+            self.assertFalse(self.connect(b"new", True)["ARROW"])
+            self.assertIn("__pandas_dataframe__", self.send_frame(b"new"))
+
+
+if __name__ == "__main__":
+    unittest.main()
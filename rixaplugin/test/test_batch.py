@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from rixaplugin.test import support
+
+
+def batch_scenario(port):
+    from rixaplugin import init_plugin_system, PluginModeFlags, create_and_start_plugin_client, async_execute_many
+    from rixaplugin.data_structures.enums import HeaderFlags
+    server = support.start_server(port)
+    result = {}
+
+    async def main():
+        init_plugin_system(PluginModeFlags.THREAD)
+        client = await create_and_start_plugin_client("localhost", port, use_auth=False)
+        sent = []
+        send = client.send
+
+        async def recording_send(identity, data, already_serialized=False):
+            if not already_serialized:
+                sent.append(data["HEAD"])
+            await send(identity, data, already_serialized)
+
+        client.send = recording_send
+        result["returns"] = await async_execute_many([("add", [1, 2]), ("add", [3, 4]), {"function_name": "add",
+                                                                                         "kwargs": {"a": 5, "b": 6}}])
+        result["batches"] = sum(1 for head in sent if head & HeaderFlags.FUNCTION_CALL_BATCH)
+        result["single_calls"] = sum(1 for head in sent if head & HeaderFlags.FUNCTION_CALL)
+        futures = await async_execute_many([("add", [1, 1]), ("fail", ["boom"]), ("add", [2, 2])],
+                                           return_future=True)
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+        result["partial"] = [i if not isinstance(i, Exception) else str(i) for i in outcomes]
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.kill()
+    return result
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_batch_round_trip(self):
+        result = support.run_isolated(batch_scenario, support.free_port())
+        self.assertEqual(result["returns"], [3, 7, 11])
+        self.assertEqual(result["batches"], 1)
+        self.assertEqual(result["single_calls"], 0)
+        # a failing call only fails its own future
+        self.assertEqual(result["partial"][0], 2)
+        self.assertIn("boom", result["partial"][1])
+        self.assertEqual(result["partial"][2], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from rixaplugin import settings
+from rixaplugin.data_structures.rixa_exceptions import DeadlineExceededException, RemoteTimeoutException
+from rixaplugin.internal import utils
+from rixaplugin.internal.executor import CountingThreadPoolExecutor, get_call_capacity
+from rixaplugin.internal.memory import _memory
+from rixaplugin.internal.networking import NetworkAdapter, advertised_call_credits
+
+
+class CallCreditsTest(unittest.TestCase):
+
+    def test_acquire_and_release(self):
+        async def run():
+            credits = utils.CallCredits(3)
+            await credits.acquire(2)
+            self.assertTrue(credits.available(1))
+            self.assertFalse(credits.available(2))
+            credits.release(2)
+            self.assertEqual(credits.in_use, 0)
+
+        asyncio.run(run())
+
+    def test_batch_waits_for_credits(self):
+        async def run():
+            credits = utils.CallCredits(3)
+            await credits.acquire(2)
+            batch = asyncio.create_task(credits.acquire(2))
+            await asyncio.sleep(0.01)
+            self.assertFalse(batch.done())
+            credits.release()
+            await asyncio.wait_for(batch, 1)
+            self.assertEqual(credits.in_use, 3)
+
+        asyncio.run(run())
+
+    def test_oversized_request_needs_all_credits(self):
+        async def run():
+            credits = utils.CallCredits(2)
+            await credits.acquire()
+            overflow = asyncio.create_task(credits.acquire(5))
+            await asyncio.sleep(0.01)
+            self.assertFalse(overflow.done())
+            credits.release()
+            # granted once nothing else is in flight instead of blocking forever
+            await asyncio.wait_for(overflow, 1)
+            self.assertEqual(credits.in_use, 5)
+
+        asyncio.run(run())
+
+    def test_release_never_goes_negative(self):
+        credits = utils.CallCredits(2)
+        credits.release(3)
+        self.assertEqual(credits.in_use, 0)
+
+    def test_raised_limit_wakes_waiters(self):
+        async def run():
+            credits = utils.CallCredits(1)
+            await credits.acquire()
+            waiter = asyncio.create_task(credits.acquire())
+            await asyncio.sleep(0.01)
+            credits.set_limit(2)
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(run())
+
+    def test_acquire_timeout(self):
+        async def run():
+            credits = utils.CallCredits(1)
+            await credits.acquire()
+            with self.assertRaises(asyncio.TimeoutError):
+                await credits.acquire(timeout=0.01)
+            self.assertEqual(credits.in_use, 1)
+            self.assertEqual(credits._waiters, [])
+            # a later release still serves waiters without timeout
+            waiter = asyncio.create_task(credits.acquire(timeout=1))
+            await asyncio.sleep(0.01)
+            credits.release()
+            await asyncio.wait_for(waiter, 1)
+            self.assertEqual(credits.in_use, 1)
+
+        asyncio.run(run())
+
+
+class CreditWaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = NetworkAdapter(0, use_curve=False, manually_created=False)
+        self.adapter.set_call_credits(b"peer", 1)
+
+    def hold_call(self, request_id):
+        # registered like a call that is about to be sent
+        future = asyncio.get_running_loop().create_future()
+        self.adapter.pending_requests[request_id] = {"future": future, "api_obj": None, "remote_id": b"peer"}
+        self.adapter.api_objs[request_id] = object()
+        return future
+
+    def test_wait_is_bounded_by_pending_request_expiry(self):
+        async def run():
+            await self.adapter._take_call_credits(b"peer", ["first"], [self.hold_call("first")])
+            with mock.patch.object(settings, "PENDING_REQUEST_EXPIRY", 0.05):
+                with self.assertRaises(RemoteTimeoutException):
+                    await self.adapter._take_call_credits(b"peer", ["second"], [self.hold_call("second")])
+            self.assertNotIn("second", self.adapter.pending_requests)
+            self.assertNotIn("second", self.adapter.api_objs)
+            self.assertIn("first", self.adapter.pending_requests)
+
+        asyncio.run(run())
+
+    def test_wait_is_bounded_by_deadline(self):
+        async def run():
+            await self.adapter._take_call_credits(b"peer", ["first"], [self.hold_call("first")])
+            started = time.time()
+            with self.assertRaises(DeadlineExceededException):
+                await self.adapter._take_call_credits(b"peer", ["second"], [self.hold_call("second")],
+                                                      deadline=time.time() + 0.05)
+            self.assertLess(time.time() - started, 1)
+            self.assertNotIn("second", self.adapter.pending_requests)
+
+        asyncio.run(run())
+
+    def test_credits_given_back_in_time(self):
+        async def run():
+            first = self.hold_call("first")
+            await self.adapter._take_call_credits(b"peer", ["first"], [first])
+            asyncio.get_running_loop().call_later(0.01, first.set_result, None)
+            await self.adapter._take_call_credits(b"peer", ["second"], [self.hold_call("second")],
+                                                  deadline=time.time() + 1)
+            self.assertIn("second", self.adapter.pending_requests)
+
+        asyncio.run(run())
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(settings, "MAX_INFLIGHT_PER_CONNECTION", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.adapter = NetworkAdapter(0, use_curve=False, manually_created=False)
+
+    def test_calls_within_credits_are_admitted(self):
+        self.assertTrue(self.adapter._admit_calls(b"peer", 3))
+        self.assertTrue(self.adapter._admit_calls(b"peer", 1))
+        self.assertFalse(self.adapter._admit_calls(b"peer", 1))
+        self.adapter._calls_done(b"peer")
+        self.assertTrue(self.adapter._admit_calls(b"peer", 1))
+
+    def test_oversized_batch_is_rejected_when_idle(self):
+        self.assertFalse(self.adapter._admit_calls(b"peer", 5))
+        self.assertNotIn(b"peer", self.adapter.inflight)
+
+    def test_peers_are_counted_separately(self):
+        self.assertTrue(self.adapter._admit_calls(b"peer", 4))
+        self.assertTrue(self.adapter._admit_calls(b"other", 4))
+
+
+class CapacityTest(unittest.TestCase):
+
+    def test_credits_match_executor_capacity(self):
+        executor = CountingThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        with mock.patch.object(_memory, "executor", executor), mock.patch.object(_memory, "max_queue", 3), \
+                mock.patch.object(settings, "MAX_INFLIGHT_PER_CONNECTION", 0):
+            self.assertEqual(get_call_capacity(executor), 5)
+            self.assertEqual(advertised_call_credits(), 5)
+
+    def test_running_calls_are_not_queued(self):
+        executor = CountingThreadPoolExecutor(2)
+        release = threading.Event()
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(release.set)
+        futures = [executor.submit(release.wait) for _ in range(3)]
+        self.assertEqual(executor.get_task_count(), 3)
+        self.assertEqual(executor.get_queued_task_count(), 1)
+        release.set()
+        for future in futures:
+            future.result(1)
+        self.assertEqual(executor.get_task_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import threading
+import unittest
+
+from rixaplugin.internal.executor import CountingThreadPoolExecutor
+
+
+class QueuedCancellationTest(unittest.TestCase):
+
+    def test_cancelled_call_is_not_queued_and_never_runs(self):
+        executor = CountingThreadPoolExecutor(1)
+        release = threading.Event()
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(release.set)
+        ran = []
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: ran.append(True))
+        self.assertEqual(executor.get_queued_task_count(), 1)
+        self.assertTrue(queued.cancel())
+        self.assertEqual(executor.get_queued_task_count(), 0)
+        release.set()
+        running.result(1)
+        executor.submit(lambda: None).result(1)
+        self.assertEqual(ran, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
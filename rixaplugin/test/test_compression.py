@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import HeaderFlags
+from rixaplugin.internal import networking
+from rixaplugin.internal.networking import serialize, deserialize, compress, negotiate_compression
+
+
+def call_message(args):
+    return {"HEAD": HeaderFlags.FUNCTION_CALL, "request_id": "1", "args": args, "kwargs": {}}
+
+
+class NegotiationTest(unittest.TestCase):
+
+    def test_first_offered_algorithm_supported_here_wins(self):
+        with mock.patch.object(settings, "COMPRESSION_ALGORITHMS", ["zlib", "lz4"]):
+            self.assertEqual(negotiate_compression(["zstd", "lz4", "zlib"]), "lz4")
+
+    def test_no_common_algorithm(self):
+        with mock.patch.object(settings, "COMPRESSION_ALGORITHMS", ["zlib"]):
+            self.assertIsNone(negotiate_compression(["lz4"]))
+        with mock.patch.object(settings, "COMPRESSION_ALGORITHMS", []):
+            self.assertIsNone(negotiate_compression(["zlib"]))
+        self.assertIsNone(negotiate_compression(None))
+
+    def test_uninstalled_algorithms_are_not_offered(self):
+        with mock.patch.object(settings, "COMPRESSION_ALGORITHMS", ["zstd", "zlib"]), \
+                mock.patch.dict(networking.COMPRESSORS, clear=False) as compressors:
+            compressors.pop("zstd", None)
+            self.assertEqual(networking.supported_compression(), ["zlib"])
+
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        for name, value in (("COMPRESSION_THRESHOLD", 1024), ("ZERO_COPY_THRESHOLD", 64 * 1024)):
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_round_trip_with_every_installed_algorithm(self):
+        msg = call_message(["text " * 1000, list(range(500))])
+        for algo in networking.COMPRESSORS:
+            with self.subTest(algo=algo):
+                frames = compress(serialize(msg), algo)
+                self.assertLess(len(frames[0]), len(serialize(msg)[0]))
+                self.assertEqual(deserialize(frames), msg)
+
+    def test_small_messages_are_not_compressed(self):
+        frames = serialize(call_message(["short"]))
+        self.assertIs(compress(frames, "zlib"), frames)
+
+    def test_incompressible_messages_are_sent_as_they_are(self):
+        frames = serialize(call_message([np.random.bytes(4096)]))
+        self.assertIs(compress(frames, "zlib"), frames)
+
+    def test_out_of_band_frames_are_not_compressed(self):
+        array = np.zeros(100000)
+        with mock.patch.object(settings, "ZERO_COPY_THRESHOLD", 1024):
+            frames = compress(serialize(call_message(["text " * 1000, array])), "zlib")
+        self.assertEqual(len(frames), 2)
+        self.assertIs(frames[1], array)
+        np.testing.assert_array_equal(deserialize(frames)["args"][1], array)
+
+    def test_unknown_algorithm_is_rejected(self):
+        frames = compress(serialize(call_message(["text " * 1000])), "zlib")
+        with mock.patch.dict(networking.COMPRESSORS) as compressors:
+            del compressors["zlib"]
+            with self.assertRaises(ValueError):
+                deserialize(frames)
+
+
+if __name__ == "__main__":
+    unittest.main()
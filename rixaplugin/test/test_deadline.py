@@ -0,0 +1,36 @@
+import time
+import unittest
+from unittest import mock
+
+from rixaplugin import settings
+from rixaplugin.internal import api
+from rixaplugin.internal.executor import call_deadline
+
+
+class CallDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api_obj = api.BaseAPI(0, 0)
+
+    def test_no_deadline_unless_requested(self):
+        with mock.patch.object(settings, "DEFAULT_CALL_DEADLINE", 0):
+            self.assertIsNone(call_deadline(self.api_obj))
+
+    def test_explicit_timeout(self):
+        deadline = call_deadline(self.api_obj, 5)
+        self.assertAlmostEqual(deadline, time.time() + 5, delta=1)
+
+    def test_default_from_settings(self):
+        with mock.patch.object(settings, "DEFAULT_CALL_DEADLINE", 20):
+            self.assertAlmostEqual(call_deadline(self.api_obj), time.time() + 20, delta=1)
+
+    def test_inherited_deadline_applies(self):
+        self.api_obj.deadline = time.time() + 2
+        with mock.patch.object(settings, "DEFAULT_CALL_DEADLINE", 0):
+            self.assertEqual(call_deadline(self.api_obj), self.api_obj.deadline)
+        self.assertEqual(call_deadline(self.api_obj, 10), self.api_obj.deadline)
+        self.assertLess(call_deadline(self.api_obj, 1), self.api_obj.deadline)
+
+
+if __name__ == "__main__":
+    unittest.main()
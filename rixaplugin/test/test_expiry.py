@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from rixaplugin.internal import utils
+
+
+class ExpiryServiceTest(unittest.TestCase):
+
+    def test_callbacks_run_in_order_of_deadline(self):
+        async def run():
+            expiry = utils.ExpiryService()
+            fired = []
+            for key, delay in [("c", 0.03), ("a", 0.01), ("b", 0.02)]:
+                expiry.schedule(key, delay, lambda key=key: fired.append(key))
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(expiry), 0)
+            return fired
+
+        self.assertEqual(asyncio.run(run()), ["a", "b", "c"])
+
+    def test_cancelled_key_does_not_fire(self):
+        async def run():
+            expiry = utils.ExpiryService()
+            fired = []
+            expiry.schedule("a", 0.01, lambda: fired.append("a"))
+            expiry.schedule("b", 0.02, lambda: fired.append("b"))
+            expiry.cancel("a")
+            expiry.cancel("unknown")
+            self.assertNotIn("a", expiry)
+            await asyncio.sleep(0.05)
+            return fired
+
+        self.assertEqual(asyncio.run(run()), ["b"])
+
+    def test_reschedule_later_postpones(self):
+        async def run():
+            expiry = utils.ExpiryService()
+            fired = []
+            expiry.schedule("a", 0.01, lambda: fired.append("first"))
+            expiry.schedule("a", 0.05, lambda: fired.append("second"))
+            await asyncio.sleep(0.03)
+            self.assertEqual(fired, [])
+            self.assertIn("a", expiry)
+            await asyncio.sleep(0.05)
+            return fired
+
+        self.assertEqual(asyncio.run(run()), ["second"])
+
+    def test_reschedule_earlier_wakes_the_sweeper(self):
+        async def run():
+            expiry = utils.ExpiryService()
+            fired = []
+            expiry.schedule("a", 10, lambda: fired.append("a"))
+            await asyncio.sleep(0)
+            expiry.schedule("a", 0.01, lambda: fired.append("a"))
+            await asyncio.sleep(0.05)
+            return fired, len(expiry)
+
+        self.assertEqual(asyncio.run(run()), (["a"], 0))
+
+    def test_failing_callback_does_not_stop_the_sweeper(self):
+        async def run():
+            expiry = utils.ExpiryService(log=mock.Mock())
+            fired = []
+            expiry.schedule("a", 0.01, lambda: 1 / 0)
+            expiry.schedule("b", 0.02, lambda: fired.append("b"))
+            await asyncio.sleep(0.05)
+            expiry.log.exception.assert_called_once()
+            return fired
+
+        self.assertEqual(asyncio.run(run()), ["b"])
+
+    def test_heap_is_compacted(self):
+        async def run():
+            expiry = utils.ExpiryService()
+            for i in range(500):
+                expiry.schedule(i, 10 - i / 1000, lambda: None)
+                expiry.cancel(i)
+            expiry.schedule("kept", 10, lambda: None)
+            self.assertLess(len(expiry._heap), 200)
+            self.assertEqual(len(expiry), 1)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
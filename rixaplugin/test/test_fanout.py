@@ -0,0 +1,123 @@
+import asyncio
+import gc
+import unittest
+from unittest import mock
+
+from rixaplugin.data_structures.enums import FunctionPointerType
+from rixaplugin.data_structures.rixa_exceptions import QuorumNotReachedException, RemoteOfflineException
+from rixaplugin.internal import fanout, memory
+from rixaplugin.internal.memory import PluginMemory
+
+
+def remote_plugins():
+    function = {"name": "query", "plugin_name": "shards", "plugin_id": "shards-id",
+                "type": FunctionPointerType.REMOTE}
+    return {"shards-id": {"name": "shards", "id": "shards-id", "type": FunctionPointerType.REMOTE,
+                          "functions": [function], "tags": [], "variables": {}}}
+
+
+class ScatterGatherTest(unittest.TestCase):
+    """
+    Replicas named a, b, c, ... Each answers with behaviours[name]: a value, an exception or a delay and a value.
+    """
+
+    def setUp(self):
+        self.memory = PluginMemory()
+        self.memory.allow_remote_functions = True
+        self.memory.plugin_system_active = True
+        for module in (memory, fanout):
+            patcher = mock.patch.object(module, "_memory", self.memory)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.behaviours = {}
+        self.cancelled = []
+
+        async def execute(plugin_entry, args, kwargs, api_obj, return_future=True, timeout=None, replica=None):
+            return asyncio.ensure_future(self.answer(replica["remote_id"]))
+
+        patcher = mock.patch.object(fanout, "_execute", execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_replicas(self, **behaviours):
+        self.behaviours.update(behaviours)
+        for name in behaviours:
+            self.memory.add_plugin(remote_plugins(), name, object(), instance=name)
+
+    async def answer(self, name):
+        behaviour = self.behaviours[name]
+        delay, result = behaviour if isinstance(behaviour, tuple) else (0, behaviour)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def scatter(self, **kwargs):
+        return asyncio.run(fanout.scatter_gather("query", api_obj=object(), **kwargs))
+
+    def test_concat(self):
+        self.add_replicas(a=[1, 2], b=[3], c=4)
+        self.assertEqual(sorted(self.scatter()), [1, 2, 3, 4])
+
+    def test_concat_skips_failures(self):
+        self.add_replicas(a=[1], b=ValueError("down"), c=[2])
+        self.assertEqual(sorted(self.scatter()), [1, 2])
+
+    def test_several_replicas_fail_at_once(self):
+        self.add_replicas(a=ValueError("a"), b=ValueError("b"), c=ValueError("c"), d=(1, "slow"))
+        loop_errors = []
+
+        async def run():
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: loop_errors.append(context))
+            try:
+                await fanout.scatter_gather("query", api_obj=object(), allow_partial=False)
+            finally:
+                # unretrieved exceptions are reported when their task is collected
+                gc.collect()
+                await asyncio.sleep(0)
+
+        with self.assertRaises(ValueError) as raised:
+            asyncio.run(run())
+        self.assertIn(str(raised.exception), "abc")
+        self.assertEqual(loop_errors, [])
+        self.assertEqual(self.cancelled, ["d"])
+
+    def test_all_replicas_fail(self):
+        self.add_replicas(a=ValueError("a"), b=ValueError("b"))
+        with self.assertRaises(ValueError):
+            self.scatter()
+        outcomes = self.scatter(reducer="outcomes")
+        self.assertTrue(all(isinstance(i["exception"], ValueError) for i in outcomes))
+
+    def test_first_success_cancels_the_rest(self):
+        self.add_replicas(a=ValueError("a"), b=(0.01, "fast"), c=(1, "slow"))
+        self.assertEqual(self.scatter(reducer="first_success"), "fast")
+        self.assertEqual(self.cancelled, ["c"])
+
+    def test_quorum(self):
+        self.add_replicas(a=1, b=1, c=2)
+        self.assertEqual(self.scatter(reducer="quorum"), 1)
+
+    def test_quorum_not_reached(self):
+        self.add_replicas(a=1, b=2, c=ValueError("c"))
+        with self.assertRaises(QuorumNotReachedException):
+            self.scatter(reducer="quorum")
+
+    def test_only_live_targets(self):
+        self.add_replicas(a=[1], b=[2])
+        origin = next(i["remote_origin"] for i in self.memory.plugins["shards-id"]["replicas"]
+                      if i["remote_id"] == "a")
+        self.memory.set_remote_alive(origin, "a", False)
+        self.assertEqual(self.scatter(), [2])
+        self.memory.set_remote_alive(next(i["remote_origin"] for i in self.memory.plugins["shards-id"]["replicas"]
+                                          if i["remote_id"] == "b"), "b", False)
+        with self.assertRaises(RemoteOfflineException):
+            self.scatter()
+
+
+if __name__ == "__main__":
+    unittest.main()
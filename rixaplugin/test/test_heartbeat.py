@@ -0,0 +1,53 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from rixaplugin import settings
+from rixaplugin.internal.networking import NetworkAdapter
+
+
+class HeartbeatTest(unittest.TestCase):
+
+    def check_liveness(self, adapter, silence):
+        async def run():
+            now = time.monotonic()
+            for identity in adapter.last_seen:
+                adapter.last_seen[identity] = now - silence
+            task = asyncio.create_task(adapter.heartbeat())
+            await asyncio.sleep(0.15)
+            task.cancel()
+
+        with mock.patch.object(settings, "HEARTBEAT_INTERVAL", 0.05), \
+                mock.patch.object(settings, "HEARTBEAT_MISS_THRESHOLD", 2):
+            asyncio.run(run())
+
+    def server_adapter(self):
+        adapter = NetworkAdapter(0, use_curve=False, manually_created=False)
+        adapter.is_server = True
+        return adapter
+
+    def test_silent_peer_with_heartbeats_goes_offline(self):
+        adapter = self.server_adapter()
+        adapter.last_seen[b"client"] = 0
+        adapter.heartbeat_intervals[b"client"] = 0.05
+        self.check_liveness(adapter, silence=1)
+        self.assertIn(b"client", adapter.offline)
+
+    def test_peer_without_heartbeats_stays_online(self):
+        adapter = self.server_adapter()
+        # old client or HEARTBEAT_INTERVAL = 0, i.e. no HEARTBEAT in its handshake
+        adapter.last_seen[b"client"] = 0
+        self.check_liveness(adapter, silence=1)
+        self.assertNotIn(b"client", adapter.offline)
+
+    def test_advertised_interval_is_used(self):
+        adapter = self.server_adapter()
+        adapter.last_seen[b"client"] = 0
+        adapter.heartbeat_intervals[b"client"] = 10
+        self.check_liveness(adapter, silence=1)
+        self.assertNotIn(b"client", adapter.offline)
+
+
+if __name__ == "__main__":
+    unittest.main()
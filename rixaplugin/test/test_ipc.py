@@ -0,0 +1,66 @@
+import asyncio
+import os
+import stat
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import zmq
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import HeaderFlags
+from rixaplugin.internal.memory import _memory
+from rixaplugin.internal.networking import IPC_IDENTITY_PREFIX, NetworkAdapter, PluginServer
+
+
+class IpcEndpointTest(unittest.TestCase):
+
+    def test_socket_file_is_private_from_the_start(self):
+        server = types.SimpleNamespace(ipc_con=None, ipc_address=None)
+        umask = os.umask(0o022)
+        os.umask(umask)
+        # permissions changed after bind would leave a window in which anyone can connect
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(settings, "IPC_DIRECTORY", directory), \
+                mock.patch("os.chmod"):
+            PluginServer._bind_ipc(server, 1)
+            self.addCleanup(_memory.delete_connection, server.ipc_con)
+            mode = os.stat(server.ipc_address[len("ipc://"):]).st_mode
+        self.assertEqual(stat.S_IMODE(mode) & 0o077, 0)
+        self.assertEqual(os.umask(umask), umask)
+
+    def test_connection_can_be_deleted_twice(self):
+        con = _memory.add_client_connection(zmq.DEALER)
+        _memory.delete_connection(con)
+        _memory.delete_connection(con)
+
+
+class AbandonedIdentityTest(unittest.TestCase):
+
+    def handshake(self, adapter, identity, instance):
+        msg = {"HEAD": HeaderFlags.ACKNOWLEDGE | HeaderFlags.CLIENT, "ID": "peer", "INSTANCE": instance}
+        return adapter.handle_remote_message(HeaderFlags(msg["HEAD"]), msg, identity)
+
+    def test_fallback_to_tcp_forgets_the_ipc_identity(self):
+        adapter = NetworkAdapter(0, use_curve=False, manually_created=False)
+        adapter.is_server = True
+        adapter.send = mock.AsyncMock()
+        self.addCleanup(_memory.connected_clients.clear)
+        ipc_identity = IPC_IDENTITY_PREFIX + b"client"
+
+        async def run():
+            adapter.first_connection = asyncio.Event()
+            await self.handshake(adapter, ipc_identity, "instance")
+            adapter.last_seen[ipc_identity] = 0
+            # the client did not get the answer in time and connects via tcp instead
+            await self.handshake(adapter, b"client", "instance")
+            await self.handshake(adapter, b"other", "other instance")
+
+        asyncio.run(run())
+        self.assertEqual(_memory.connected_clients, [b"client", b"other"])
+        self.assertNotIn(ipc_identity, adapter.last_seen)
+        self.assertNotIn(ipc_identity, adapter.peer_instances)
+
+
+if __name__ == "__main__":
+    unittest.main()
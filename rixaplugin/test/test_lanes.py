@@ -0,0 +1,195 @@
+import asyncio
+import os
+import threading
+import types
+import unittest
+from unittest import mock
+
+from rixaplugin import settings
+from rixaplugin.internal.executor import CountingProcessPoolExecutor, CountingThreadPoolExecutor
+from rixaplugin.internal.lanes import LaneExecutor
+from rixaplugin.internal.memory import _memory
+from rixaplugin.internal.utils import ExpiryService
+
+
+def thread_lane():
+    return CountingThreadPoolExecutor(max_workers=1)
+
+
+def process_lane():
+    return CountingProcessPoolExecutor(max_workers=1)
+
+
+class LaneTestCase(unittest.TestCase):
+
+    def patch_settings(self, **values):
+        for name, value in values.items():
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def setUp(self):
+        patcher = mock.patch.object(_memory, "tasks_in_system", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_executor(self, *args, lane_factory=thread_lane, **kwargs):
+        executor = LaneExecutor(lane_factory, *args, **kwargs)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+
+class AffinityTest(LaneTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_settings(WORKER_AFFINITY=["session_id"], AFFINITY_SPILL_LOAD=1)
+        self.executor = self.create_executor(3)
+
+    def test_same_key_runs_on_same_worker(self):
+        for key in ("alice", "bob", ["unhashable"]):
+            workers = {self.executor.submit(threading.get_ident, key=key).result(1) for _ in range(5)}
+            self.assertEqual(len(workers), 1)
+        self.assertEqual(self.executor.metrics["affinity_hits"], 15)
+
+    def test_saturated_worker_spills_to_free_one(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        keyed = self.executor.submit(lambda: (release.wait(), threading.get_ident())[1], key="alice")
+        spilled = self.executor.submit(threading.get_ident, key="alice")
+        # finishes while the worker of the key is still blocked
+        worker = spilled.result(1)
+        release.set()
+        self.assertNotEqual(keyed.result(1), worker)
+        self.assertEqual(self.executor.metrics["affinity_spills"], 1)
+
+    def test_unkeyed_calls_use_any_worker(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        blocked = [self.executor.submit(release.wait) for _ in range(2)]
+        self.assertTrue(self.executor.submit(threading.get_ident).result(1))
+        release.set()
+        for future in blocked:
+            future.result(1)
+        self.assertEqual(self.executor.metrics["affinity_unkeyed"], 3)
+
+
+class AutoscaleTest(LaneTestCase, unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_settings(AUTOSCALE_QUEUE_LENGTH=2, AUTOSCALE_QUEUE_WAIT=60, AUTOSCALE_IDLE_TIME=60)
+        self.release = threading.Event()
+
+    async def asyncSetUp(self):
+        # the autoscale checks run on the expiry service of the event loop
+        patcher = mock.patch.object(_memory, "expiry", ExpiryService())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.executor = self.create_executor(1, 3)
+        self.addCleanup(self.release.set)
+
+    def block(self, count):
+        return [self.executor.submit(self.release.wait) for _ in range(count)]
+
+    async def test_grows_with_queue_length(self):
+        futures = self.block(3)
+        self.assertEqual(len(self.executor.lanes), 3)
+        self.assertEqual(self.executor.get_active_task_count(), 3)
+        self.release.set()
+        for future in futures:
+            future.result(1)
+        self.assertEqual(self.executor.metrics["workers_added"], 2)
+
+    async def test_grows_with_queue_wait(self):
+        self.patch_settings(AUTOSCALE_QUEUE_LENGTH=100, AUTOSCALE_QUEUE_WAIT=0.1)
+        self.block(2)
+        self.assertEqual(len(self.executor.lanes), 1)
+        await asyncio.sleep(0.6)
+        self.assertEqual(len(self.executor.lanes), 2)
+        self.assertEqual(self.executor.get_queued_task_count(), 0)
+
+    async def test_does_not_exceed_max_workers(self):
+        self.block(6)
+        self.assertEqual(len(self.executor.lanes), 3)
+        self.assertEqual(self.executor.get_queued_task_count(), 3)
+
+    async def test_shrinks_when_idle(self):
+        self.patch_settings(AUTOSCALE_IDLE_TIME=0.1)
+        futures = self.block(3)
+        self.release.set()
+        for future in futures:
+            future.result(1)
+        await asyncio.sleep(0.6)
+        self.assertEqual(len(self.executor.lanes), 1)
+        self.assertEqual(self.executor.metrics["workers_removed"], 2)
+
+
+class RecycleTest(LaneTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_settings(WORKER_MAX_TASKS=0, WORKER_MAX_RSS=0, WORKER_MAX_AGE=0)
+
+    def call(self, executor):
+        executor.submit(lambda: None).result(1)
+        return executor.lanes[0].executor
+
+    def test_recycles_after_max_tasks(self):
+        self.patch_settings(WORKER_MAX_TASKS=2)
+        executor = self.create_executor(1, recycle=True)
+        workers = [self.call(executor) for _ in range(5)]
+        self.assertEqual(len(set(workers)), 3)
+        self.assertEqual(executor.metrics["workers_recycled_tasks"], 2)
+
+    def test_recycles_after_max_age(self):
+        self.patch_settings(WORKER_MAX_AGE=0.1)
+        executor = self.create_executor(1, recycle=True)
+        first = self.call(executor)
+        self.assertIs(self.call(executor), first)
+        executor.lanes[0].started -= 0.2
+        self.assertIsNot(self.call(executor), first)
+        self.assertEqual(executor.metrics["workers_recycled_age"], 1)
+
+    def test_no_recycling_unless_enabled(self):
+        self.patch_settings(WORKER_MAX_TASKS=1)
+        executor = self.create_executor(1)
+        workers = {self.call(executor) for _ in range(3)}
+        self.assertEqual(len(workers), 1)
+
+
+class MemoryRecycleTest(LaneTestCase, unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # process pools hand finished calls to the event loop
+        for name, value in (("event_loop", asyncio.get_running_loop()), ("expiry", ExpiryService())):
+            patcher = mock.patch.object(_memory, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.patch_settings(WORKER_MAX_TASKS=0, WORKER_MAX_AGE=0)
+        self.executor = self.create_executor(1, lane_factory=process_lane, recycle=True)
+        self.request_ids = iter(range(100))
+
+    async def call_getpid(self):
+        api_obj = types.SimpleNamespace(request_id=next(self.request_ids))
+        return await asyncio.wrap_future(self.executor.submit(os.getpid, api_obj))
+
+    async def test_worker_pids_are_reported(self):
+        self.patch_settings(WORKER_MAX_RSS=0)
+        pid = await self.call_getpid()
+        self.assertEqual(self.executor.lanes[0].executor.worker_pids(), {pid})
+
+    async def test_recycles_above_max_rss(self):
+        self.patch_settings(WORKER_MAX_RSS=1)
+        first = await self.call_getpid()
+        self.assertNotEqual(await self.call_getpid(), first)
+        self.assertEqual(self.executor.metrics["workers_recycled_memory"], 1)
+
+    async def test_keeps_worker_below_max_rss(self):
+        self.patch_settings(WORKER_MAX_RSS=2 ** 20)
+        pids = {await self.call_getpid() for _ in range(3)}
+        self.assertEqual(len(pids), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import zmq
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import HeaderFlags
+from rixaplugin.internal import utils
+from rixaplugin.internal.networking import serialize, deserialize
+
+
+def return_message(ret):
+    return {"HEAD": HeaderFlags.FUNCTION_RETURN, "request_id": "1", "return": ret}
+
+
+class OutOfBandFramesTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(settings, "ZERO_COPY_THRESHOLD", 1024)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_large_array_is_sent_as_own_frame(self):
+        array = np.arange(1000, dtype=np.float64)
+        frames = serialize(return_message(array))
+        self.assertEqual(len(frames), 2)
+        self.assertIs(frames[1], array)
+        received = deserialize(frames)["return"]
+        np.testing.assert_array_equal(received, array)
+        self.assertEqual(received.dtype, array.dtype)
+
+    def test_small_values_stay_in_message(self):
+        frames = serialize(return_message([np.arange(10), b"abc"]))
+        self.assertEqual(len(frames), 1)
+        received = deserialize(frames)["return"]
+        np.testing.assert_array_equal(received[0], np.arange(10))
+        self.assertEqual(received[1], b"abc")
+
+    def test_nested_arguments(self):
+        array = np.ones((20, 30), dtype=np.int32)
+        data = b"x" * 2048
+        msg = {"HEAD": HeaderFlags.FUNCTION_CALL, "request_id": "1", "args": [array, {"raw": data}],
+               "kwargs": {"tuple": (array.T, 1)}}
+        frames = serialize(msg)
+        self.assertEqual(len(frames), 4)
+        received = deserialize(frames)
+        np.testing.assert_array_equal(received["args"][0], array)
+        self.assertEqual(received["args"][1]["raw"], data)
+        # made contiguous before sending
+        np.testing.assert_array_equal(received["kwargs"]["tuple"][0], array.T)
+
+    def test_batch_calls(self):
+        array = np.arange(1000, dtype=np.float64)
+        msg = {"HEAD": HeaderFlags.FUNCTION_CALL_BATCH, "request_id": "1",
+               "calls": [{"request_id": str(i), "args": [array * i], "kwargs": {}} for i in range(3)]}
+        frames = serialize(msg)
+        self.assertEqual(len(frames), 4)
+        received = deserialize(frames)["calls"]
+        for i, call in enumerate(received):
+            np.testing.assert_array_equal(call["args"][0], array * i)
+
+    def test_small_messages_are_not_searched(self):
+        with mock.patch.object(utils, "map_structure", side_effect=AssertionError("searched")):
+            frames = serialize(return_message({"values": list(range(50)), "array": np.arange(10)}))
+        self.assertEqual(len(frames), 1)
+
+    def test_large_messages_without_buffers(self):
+        ret = {"text": ["x" * 100] * 100, "array": np.arange(10)}
+        frames = serialize(return_message(ret))
+        self.assertEqual(len(frames), 1)
+        received = deserialize(frames)["return"]
+        self.assertEqual(received["text"], ret["text"])
+        np.testing.assert_array_equal(received["array"], ret["array"])
+
+    def test_user_dicts_are_not_mistaken_for_frames(self):
+        ret = {"__oob_buffer__": 0, "kind": "bytes"}
+        for value in (ret, [ret, np.arange(1000)]):
+            frames = serialize(return_message(value))
+            received = deserialize(frames)["return"]
+            self.assertEqual(received if value is ret else received[0], ret)
+
+    def test_missing_frame(self):
+        frames = serialize(return_message(np.arange(1000)))
+        with self.assertRaises(ValueError):
+            deserialize(frames[:1])
+
+    def test_object_arrays_stay_in_message(self):
+        array = np.array([{"a": i} for i in range(200)], dtype=object)
+        with mock.patch.object(settings, "ZERO_COPY_THRESHOLD", 8):
+            frames = serialize(return_message(array))
+        self.assertEqual(len(frames), 1)
+
+    def test_protocol_fields_are_not_extracted(self):
+        frames = serialize({"HEAD": HeaderFlags.FUNCTION_RETURN, "request_id": "1", "state": b"x" * 4096,
+                            "return": None})
+        self.assertEqual(len(frames), 1)
+
+    def test_disabled(self):
+        with mock.patch.object(settings, "ZERO_COPY_THRESHOLD", 0):
+            frames = serialize(return_message(np.arange(1000)))
+        self.assertEqual(len(frames), 1)
+        np.testing.assert_array_equal(deserialize(frames)["return"], np.arange(1000))
+
+    def test_round_trip_over_zmq(self):
+        context = zmq.Context()
+        self.addCleanup(context.term)
+        sender, receiver = context.socket(zmq.PAIR), context.socket(zmq.PAIR)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        receiver.bind("inproc://oob-frames")
+        sender.connect("inproc://oob-frames")
+        array = np.random.random((100, 100))
+        sender.send_multipart(serialize(return_message({"array": array})), copy=False)
+        frames = receiver.recv_multipart(copy=False)
+        self.assertEqual(len(frames), 2)
+        received = deserialize(frames)["return"]["array"]
+        np.testing.assert_array_equal(received, array)
+        # a view on the received frame, not a copy
+        self.assertFalse(received.flags.owndata)
+
+
+if __name__ == "__main__":
+    unittest.main()
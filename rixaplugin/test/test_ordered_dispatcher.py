@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from rixaplugin.internal import utils
+
+
+class OrderedDispatcherTest(unittest.TestCase):
+
+    def test_same_key_runs_in_order_of_submission(self):
+        async def run():
+            dispatcher = utils.OrderedDispatcher(10)
+            done = []
+
+            async def handler(name, delay):
+                await asyncio.sleep(delay)
+                done.append(name)
+
+            # later handlers would finish first if they ran concurrently
+            for name, delay in [("a", 0.03), ("b", 0.02), ("c", 0.01)]:
+                await dispatcher.submit("key", handler(name, delay))
+            await asyncio.wait_for(asyncio.gather(*dispatcher._tasks), 1)
+            return done
+
+        self.assertEqual(asyncio.run(run()), ["a", "b", "c"])
+
+    def test_different_keys_complete_out_of_order(self):
+        async def run():
+            dispatcher = utils.OrderedDispatcher(10)
+            done = []
+
+            async def handler(name, delay):
+                await asyncio.sleep(delay)
+                done.append(name)
+
+            await dispatcher.submit("first", handler("slow", 0.05))
+            await dispatcher.submit("second", handler("fast", 0))
+            await dispatcher.submit(None, handler("unordered", 0.01))
+            await asyncio.wait_for(asyncio.gather(*dispatcher._tasks), 1)
+            return done
+
+        self.assertEqual(asyncio.run(run()), ["fast", "unordered", "slow"])
+
+    def test_submit_waits_for_a_free_slot(self):
+        async def run():
+            dispatcher = utils.OrderedDispatcher(2)
+            release = asyncio.Event()
+            await dispatcher.submit("a", release.wait())
+            await dispatcher.submit("b", release.wait())
+            third = asyncio.create_task(dispatcher.submit("c", asyncio.sleep(0)))
+            await asyncio.sleep(0.01)
+            self.assertFalse(third.done())
+            self.assertEqual(dispatcher.pending, 2)
+            release.set()
+            await asyncio.wait_for(third, 1)
+            await asyncio.wait_for(asyncio.gather(*dispatcher._tasks), 1)
+            self.assertEqual(dispatcher.pending, 0)
+
+        asyncio.run(run())
+
+    def test_failing_coroutine_does_not_stop_its_key(self):
+        async def run():
+            dispatcher = utils.OrderedDispatcher(10, log=mock.Mock())
+            done = []
+
+            async def fail():
+                raise ValueError("boom")
+
+            async def succeed():
+                done.append("after")
+
+            await dispatcher.submit("key", fail())
+            await dispatcher.submit("key", succeed())
+            await asyncio.wait_for(asyncio.gather(*dispatcher._tasks), 1)
+            dispatcher.log.exception.assert_called_once()
+            return done
+
+        self.assertEqual(asyncio.run(run()), ["after"])
+
+    def test_cancel_releases_pending_slots(self):
+        async def run():
+            dispatcher = utils.OrderedDispatcher(10)
+            await dispatcher.submit("key", asyncio.sleep(10))
+            await dispatcher.submit("key", asyncio.sleep(10))
+            await asyncio.sleep(0)
+            dispatcher.cancel()
+            await asyncio.gather(*dispatcher._tasks, return_exceptions=True)
+            self.assertEqual(dispatcher.pending, 0)
+            self.assertEqual(dispatcher._queues, {})
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from rixaplugin.data_structures.rixa_exceptions import RemoteTimeoutException
+from rixaplugin.internal import utils
+from rixaplugin.internal.networking import NetworkAdapter
+from rixaplugin.test import support
+
+
+async def _call(name, *args):
+    from rixaplugin import async_execute
+    return await (await async_execute(name, args=list(args), return_future=True))
+
+
+async def _wait_alive(alive, timeout):
+    from rixaplugin.internal.memory import _memory
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        states = [plugin["is_alive"] for plugin in _memory.plugins.values() if plugin.get("remote_origin")]
+        if states and all(state == alive for state in states):
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+def reconnect_scenario(port):
+    from rixaplugin import init_plugin_system, PluginModeFlags, create_and_start_plugin_client, settings
+    from rixaplugin import async_execute
+    settings.HEARTBEAT_INTERVAL = 0.2
+    settings.HEARTBEAT_MISS_THRESHOLD = 3
+    settings.RECONNECT_BACKOFF_BASE = 0.2
+    settings.RECONNECT_BACKOFF_MAX = 0.5
+    server = support.start_server(port)
+    result = {}
+
+    async def main():
+        nonlocal server
+        init_plugin_system(PluginModeFlags.THREAD)
+        client = await create_and_start_plugin_client("localhost", port, use_auth=False)
+        result["before"] = await _call("add", 1, 2)
+        plain = await async_execute("slow", args=[1], return_future=True)
+        idempotent = await async_execute("idempotent_slow", args=[1], return_future=True)
+        await asyncio.sleep(0.3)
+        server.kill()
+        server.join()
+        try:
+            await asyncio.wait_for(plain, 10)
+        except Exception as e:
+            result["plain"] = type(e).__name__
+        result["offline"] = await _wait_alive(False, 5)
+        server = support.start_server(port, wait=0)
+        result["online"] = await _wait_alive(True, 20)
+        result["idempotent"] = await asyncio.wait_for(idempotent, 20)
+        result["after"] = await _call("add", 2, 3)
+        result["pending"] = len(client.pending_requests)
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.kill()
+    return result
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def test_reconnect_after_server_restart(self):
+        result = support.run_isolated(reconnect_scenario, support.free_port(), timeout=90)
+        self.assertEqual(result["before"], 3)
+        # only idempotent calls survive the lost connection
+        self.assertEqual(result["plain"], "RemoteUnavailableException")
+        self.assertTrue(result["offline"])
+        self.assertTrue(result["online"])
+        self.assertEqual(result["idempotent"], 1)
+        self.assertEqual(result["after"], 5)
+        self.assertEqual(result["pending"], 0)
+
+
+class AcknowledgementTimeoutTest(unittest.TestCase):
+
+    def test_only_the_unacknowledged_call_fails(self):
+        adapter = NetworkAdapter(0, use_curve=False, manually_created=False)
+        adapter.is_server = True
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            other = loop.create_future()
+            adapter.pending_requests[1] = {"future": other, "remote_id": b"peer"}
+            adapter.pending_requests[2] = {"future": loop.create_future(), "remote_id": b"peer"}
+            adapter.time_estimate_events[2] = asyncio.Event()
+            with mock.patch.object(utils, "event_wait", mock.AsyncMock(return_value=False)):
+                with self.assertRaises(RemoteTimeoutException):
+                    await adapter._await_acknowledgement(2, {"plugin_name": "plugin"})
+            return other
+
+        other = asyncio.run(run())
+        self.assertNotIn(2, adapter.pending_requests)
+        self.assertIn(1, adapter.pending_requests)
+        self.assertFalse(other.done())
+        self.assertNotIn(b"peer", adapter.offline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import concurrent.futures
+import unittest
+from unittest import mock
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import FunctionPointerType
+from rixaplugin.data_structures.rixa_exceptions import RemoteOfflineException
+from rixaplugin.internal import balancing
+from rixaplugin.internal.memory import PluginMemory
+from rixaplugin.internal.utils import RollingLatency
+
+
+def remote_plugins(plugin_id="calc-id", name="calc"):
+    # fresh dict per call, add_plugin takes ownership of it
+    function = {"name": "add", "plugin_name": name, "plugin_id": plugin_id, "type": FunctionPointerType.REMOTE,
+                "args": ["a", "b"]}
+    return {plugin_id: {"name": name, "id": plugin_id, "type": FunctionPointerType.REMOTE, "functions": [function],
+                        "tags": [], "variables": {}}}
+
+
+class ReplicaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = PluginMemory()
+        self.memory.allow_remote_functions = True
+        self.first, self.second = object(), object()
+
+    def plugin(self):
+        return next(iter(self.memory.plugins.values()))
+
+    def test_same_plugin_from_two_remotes_becomes_replicas(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        self.memory.add_plugin(remote_plugins(), b"b", self.second, instance="i2")
+        self.assertEqual(len(self.memory.plugins), 1)
+        self.assertEqual(len(self.memory.function_list), 1)
+        replicas = self.plugin()["replicas"]
+        self.assertEqual([(i["remote_id"], i["remote_origin"]) for i in replicas],
+                         [(b"a", self.first), (b"b", self.second)])
+
+    def test_replicas_with_other_functions_are_refused(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        changed = remote_plugins()
+        changed["calc-id"]["functions"][0]["args"] = ["a", "b", "c"]
+        with self.assertLogs("rixa.core", "WARNING"):
+            self.memory.add_plugin(changed, b"b", self.second, instance="i2")
+        self.assertEqual([i["remote_id"] for i in self.plugin()["replicas"]], [b"a"])
+        self.assertEqual(self.plugin()["functions"][0]["args"], ["a", "b"])
+        self.assertEqual(len(self.memory.function_list), 1)
+
+    def test_ids_and_tags_may_differ_between_replicas(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1", tags=["first"])
+        # plugin ids depend on the path of the remote
+        other = remote_plugins(plugin_id="other-id")
+        other["other-id"]["functions"][0]["type"] |= FunctionPointerType.INDIRECT
+        self.memory.add_plugin(other, b"b", self.second, instance="i2", tags=["second"])
+        self.assertEqual(len(self.plugin()["replicas"]), 2)
+
+    def test_update_of_the_only_replica_may_change_functions(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        changed = remote_plugins()
+        changed["calc-id"]["functions"][0]["args"] = ["a", "b", "c"]
+        self.memory.add_plugin(changed, b"a", self.first, instance="i1")
+        self.assertEqual(self.plugin()["functions"][0]["args"], ["a", "b", "c"])
+        self.assertEqual(len(self.plugin()["replicas"]), 1)
+
+    def test_reconnect_replaces_replica(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        self.memory.add_plugin(remote_plugins(), b"b", self.second, instance="i2")
+        previous = self.memory.add_plugin(remote_plugins(), b"c", self.first, instance="i1")
+        self.assertEqual(previous, b"a")
+        self.assertEqual(sorted(i["remote_id"] for i in self.plugin()["replicas"]), [b"b", b"c"])
+
+    def test_offline_replicas_are_skipped(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        self.memory.add_plugin(remote_plugins(), b"b", self.second, instance="i2")
+        self.memory.set_remote_alive(self.first, b"a", False)
+        plugin = self.plugin()
+        self.assertTrue(plugin["is_alive"])
+        # plugin level pointers move to the live replica
+        self.assertIs(plugin["remote_origin"], self.second)
+        self.assertIs(plugin["functions"][0]["remote_origin"], self.second)
+        for _ in range(10):
+            self.assertEqual(balancing.choose_replica(plugin)["remote_id"], b"b")
+        self.memory.set_remote_alive(self.second, b"b", False)
+        self.assertFalse(plugin["is_alive"])
+        with self.assertRaises(RemoteOfflineException):
+            balancing.choose_replica(plugin)
+
+    def test_remove_remote(self):
+        self.memory.add_plugin(remote_plugins(), b"a", self.first, instance="i1")
+        self.memory.add_plugin(remote_plugins(), b"b", self.second, instance="i2")
+        self.memory.remove_remote(self.first, b"a")
+        self.assertEqual([i["remote_id"] for i in self.plugin()["replicas"]], [b"b"])
+        self.assertIs(self.plugin()["remote_origin"], self.second)
+        self.memory.remove_remote(self.second)
+        self.assertEqual(self.memory.plugins, {})
+        self.assertEqual(self.memory.function_list, [])
+
+
+def replica(name, active_tasks=0, latency=None):
+    entry = {"remote_id": name, "is_alive": True, "active_tasks": active_tasks, "latency": RollingLatency()}
+    if latency is not None:
+        entry["latency"].add(latency)
+    return entry
+
+
+class PolicyTest(unittest.TestCase):
+
+    def test_least_tasks(self):
+        replicas = [replica("a", 3), replica("b", 1), replica("c", 2)]
+        self.assertEqual(balancing.least_tasks(replicas)["remote_id"], "b")
+
+    def test_power_of_two_never_picks_the_busiest(self):
+        replicas = [replica("a", 0), replica("b", 1), replica("c", 5)]
+        for _ in range(50):
+            self.assertNotEqual(balancing.power_of_two(replicas)["remote_id"], "c")
+
+    def test_expected_completion(self):
+        slow, fast = replica("slow", 0, latency=1.0), replica("fast", 2, latency=0.1)
+        self.assertEqual(balancing.expected_completion([slow, fast])["remote_id"], "fast")
+        # replicas without measurements are tried first
+        self.assertEqual(balancing.expected_completion([slow, fast, replica("new", 4)])["remote_id"], "new")
+
+    def test_configured_policy_is_used(self):
+        plugin = {"name": "calc", "replicas": [replica("a"), replica("b")]}
+        balancing.register_policy("last", lambda replicas: replicas[-1])
+        self.addCleanup(balancing.POLICIES.pop, "last")
+        with mock.patch.object(settings, "REPLICA_POLICY", "last"):
+            self.assertEqual(balancing.choose_replica(plugin)["remote_id"], "b")
+
+    def test_call_accounting(self):
+        plugin, chosen = {"active_tasks": 0}, replica("a")
+        started = balancing.call_started(plugin, chosen)
+        self.assertEqual((plugin["active_tasks"], chosen["active_tasks"]), (1, 1))
+        # without a future the outcome is unknown and the latency is left alone
+        balancing.call_finished(plugin, chosen, started)
+        self.assertEqual((plugin["active_tasks"], chosen["active_tasks"]), (0, 0))
+        self.assertIsNone(chosen["latency"].mean)
+
+        future = concurrent.futures.Future()
+        future.set_result(None)
+        balancing.call_finished(plugin, chosen, balancing.call_started(plugin, chosen), future)
+        self.assertEqual((plugin["active_tasks"], chosen["active_tasks"]), (0, 0))
+        self.assertIsNotNone(chosen["latency"].mean)
+
+
+if __name__ == "__main__":
+    unittest.main()
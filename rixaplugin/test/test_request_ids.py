@@ -0,0 +1,57 @@
+import threading
+import unittest
+from unittest import mock
+
+from rixaplugin.internal import utils
+
+
+class RequestIdAllocatorTest(unittest.TestCase):
+
+    def test_ids_are_unique(self):
+        allocator = utils.RequestIdAllocator("peer")
+        ids = [allocator.new() for _ in range(1000)]
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertTrue(all(request_id.startswith("peer-") for request_id in ids))
+
+    def test_ids_are_unique_across_namespaces(self):
+        first, second = utils.RequestIdAllocator("a"), utils.RequestIdAllocator("b")
+        ids = [allocator.new() for allocator in (first, second) for _ in range(100)]
+        self.assertEqual(len(set(ids)), 200)
+
+    def test_allocators_of_one_namespace_get_distinct_prefixes(self):
+        # e.g. two processes that share the peer id
+        first, second = utils.RequestIdAllocator("peer"), utils.RequestIdAllocator("peer")
+        self.assertNotEqual(first.new(), second.new())
+
+    def test_ids_are_unique_across_threads(self):
+        allocator = utils.RequestIdAllocator("peer")
+        ids = []
+
+        def allocate():
+            ids.extend([allocator.new() for _ in range(1000)])
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 4000)
+
+    def test_forked_process_gets_new_prefix(self):
+        allocator = utils.RequestIdAllocator("peer")
+        parent = allocator.new()
+        with mock.patch("os.getpid", return_value=-1):
+            child = allocator.new()
+        self.assertNotEqual(parent.rsplit("-", 1)[0], child.rsplit("-", 1)[0])
+        self.assertTrue(child.endswith("-0"))
+
+    def test_verbose_ids_stay_unique(self):
+        allocator = utils.RequestIdAllocator("peer")
+        with mock.patch.object(utils, "VERBOSE_REQUEST_ID", True):
+            ids = {allocator.new("add", (1, 2)) for _ in range(10)}
+        self.assertEqual(len(ids), 10)
+        self.assertTrue(all(":add((1, 2), {})" in request_id for request_id in ids))
+
+
+if __name__ == "__main__":
+    unittest.main()
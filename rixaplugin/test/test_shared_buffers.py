@@ -0,0 +1,91 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from rixaplugin import settings
+from rixaplugin.internal import shared_buffers
+
+
+class SharedBuffersTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        for name, value in (("SHARED_MEMORY_THRESHOLD", 1024), ("SHARED_MEMORY_DIR", self.dir)):
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def files(self):
+        return os.listdir(self.dir)
+
+    def test_array_round_trip(self):
+        array = np.arange(10000, dtype=np.float64).reshape(100, 100)
+        payload = shared_buffers.pack(array)
+        self.assertIsInstance(payload, shared_buffers.SharedPayload)
+        self.assertEqual(len(self.files()), 1)
+        # only the small in-band part is pickled
+        self.assertLess(len(pickle.dumps(payload)), 1024)
+        loaded = shared_buffers.unpack(pickle.loads(pickle.dumps(payload)), release=True)
+        np.testing.assert_array_equal(loaded, array)
+        self.assertEqual(self.files(), [])
+        # the mapping outlives the file and changes are not shared
+        loaded[0, 0] = -1
+        self.assertEqual(array[0, 0], 0)
+
+    def test_dataframe_round_trip(self):
+        df = pd.DataFrame({"a": np.arange(5000), "b": np.linspace(0, 1, 5000), "c": ["x"] * 5000})
+        loaded = shared_buffers.unpack(shared_buffers.pack(df), release=True)
+        pd.testing.assert_frame_equal(loaded, df)
+
+    def test_nested_containers(self):
+        obj = {"arrays": [np.ones(1000), np.zeros(1000, dtype=np.int32)], "name": "x", "small": np.ones(3)}
+        payload = shared_buffers.pack((obj, 5))
+        self.assertIsInstance(payload, shared_buffers.SharedPayload)
+        self.assertEqual(len(payload.layout), 2)
+        self.assertTrue(all(offset % 64 == 0 for offset, _ in payload.layout))
+        loaded, number = shared_buffers.unpack(payload, release=True)
+        self.assertEqual(number, 5)
+        self.assertEqual(loaded["name"], "x")
+        np.testing.assert_array_equal(loaded["arrays"][0], obj["arrays"][0])
+        np.testing.assert_array_equal(loaded["arrays"][1], obj["arrays"][1])
+        np.testing.assert_array_equal(loaded["small"], obj["small"])
+
+    def test_small_objects_are_unchanged(self):
+        for obj in (np.ones(10), [1, 2, 3], "text", {"a": np.ones(10)}, None):
+            self.assertIs(shared_buffers.pack(obj), obj)
+            self.assertIs(shared_buffers.unpack(obj), obj)
+        # not contiguous, hence pickled in-band
+        strided = np.ones((100, 100))[:, ::2]
+        self.assertIs(shared_buffers.pack(strided), strided)
+        self.assertEqual(self.files(), [])
+
+    def test_disabled(self):
+        array = np.ones(10000)
+        with mock.patch.object(settings, "SHARED_MEMORY_THRESHOLD", 0):
+            self.assertIs(shared_buffers.pack(array), array)
+
+    def test_payload_for_several_receivers(self):
+        payload = shared_buffers.pack(np.ones(10000))
+        for _ in range(2):
+            np.testing.assert_array_equal(shared_buffers.unpack(payload), np.ones(10000))
+        shared_buffers.release(payload)
+        self.assertEqual(self.files(), [])
+        shared_buffers.release(payload)
+
+    def test_cleanup_removes_own_leftovers(self):
+        shared_buffers.pack(np.ones(10000))
+        shared_buffers.pack(np.ones(10000), owner_pid=os.getpid() + 1)
+        shared_buffers.cleanup()
+        self.assertEqual(len(self.files()), 1)
+        self.assertTrue(self.files()[0].startswith(f"rixaplugin-{os.getpid() + 1}-"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+
+import msgpack
+
+from rixaplugin import settings
+from rixaplugin.data_structures.enums import FunctionPointerType
+from rixaplugin.internal import memory
+from rixaplugin.internal.memory import PluginMemory
+
+
+class SendableCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = PluginMemory()
+        patcher = mock.patch.object(memory, "_memory", self.memory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calc = self.add_function("calc", "add")
+
+    def add_function(self, plugin_name, name):
+        self.memory.add_function({"name": name, "plugin_name": plugin_name, "type": FunctionPointerType.LOCAL,
+                                  "args": ["a"], "doc": None})
+        return memory.get_plugin_id(plugin_name)
+
+    def test_packed_signatures_are_reused(self):
+        first = self.memory.get_packed_plugins()
+        second = self.memory.get_packed_plugins()
+        self.assertIs(first[self.calc], second[self.calc])
+        self.assertIs(self.memory.get_sendable_plugins(), self.memory.get_sendable_plugins())
+        self.assertEqual(msgpack.unpackb(first[self.calc])["name"], "calc")
+        # a subset is served from the same encoding
+        self.assertIs(self.memory.get_packed_plugins([self.calc])[self.calc], first[self.calc])
+
+    def test_adding_a_plugin_invalidates(self):
+        first = self.memory.get_packed_plugins()
+        hashes = self.memory.get_signature_hashes()
+        text = self.add_function("text", "upper")
+        second = self.memory.get_packed_plugins()
+        self.assertEqual(set(second), {self.calc, text})
+        self.assertIsNot(second[self.calc], first[self.calc])
+        self.assertEqual(second[self.calc], first[self.calc])
+        self.assertEqual(self.memory.get_signature_hashes()[self.calc], hashes[self.calc])
+
+    def test_adding_a_function_invalidates(self):
+        hashes = self.memory.get_signature_hashes()
+        self.add_function("calc", "sub")
+        self.assertNotEqual(self.memory.get_signature_hashes()[self.calc], hashes[self.calc])
+        functions = msgpack.unpackb(self.memory.get_packed_plugins()[self.calc])["functions"]
+        self.assertEqual([i["name"] for i in functions], ["add", "sub"])
+
+    def test_removing_a_plugin_invalidates(self):
+        text = self.add_function("text", "upper")
+        self.assertEqual(set(self.memory.get_packed_plugins()), {self.calc, text})
+        self.memory.delete_plugin(text)
+        self.assertEqual(set(self.memory.get_packed_plugins()), {self.calc})
+        self.assertEqual(set(self.memory.get_signature_hashes()), {self.calc})
+
+    def test_remote_plugins_invalidate(self):
+        self.memory.allow_remote_functions = True
+        origin = object()
+        remote = {"name": "remote", "id": "remote-id", "type": FunctionPointerType.REMOTE, "tags": [],
+                  "variables": {}, "functions": [{"name": "f", "plugin_name": "remote", "plugin_id": "remote-id",
+                                                  "type": FunctionPointerType.REMOTE}]}
+        self.memory.get_packed_plugins()
+        with mock.patch.object(settings, "ALLOW_NETWORK_RELAY", True):
+            self.memory.add_plugin({"remote-id": remote}, b"peer", origin)
+            self.assertIn("remote-id", self.memory.get_packed_plugins())
+            # offline plugins are not sent
+            self.memory.set_remote_alive(origin, b"peer", False)
+            self.assertNotIn("remote-id", self.memory.get_packed_plugins())
+            self.memory.set_remote_alive(origin, b"peer", True)
+            self.assertIn("remote-id", self.memory.get_packed_plugins())
+            self.memory.remove_remote(origin)
+            self.assertNotIn("remote-id", self.memory.get_packed_plugins())
+
+    def test_invalidate_sendable_plugins(self):
+        first = self.memory.get_packed_plugins()
+        self.memory.invalidate_sendable_plugins()
+        self.assertIsNot(self.memory.get_packed_plugins()[self.calc], first[self.calc])
+
+    def test_entries_per_skip_set(self):
+        text = self.add_function("text", "upper")
+        self.assertEqual(set(self.memory.get_sendable_plugins(skip=[text])), {self.calc})
+        self.assertEqual(set(self.memory.get_sendable_plugins()), {self.calc, text})
+
+
+if __name__ == "__main__":
+    unittest.main()
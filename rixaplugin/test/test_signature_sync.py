@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from rixaplugin.data_structures.enums import FunctionPointerType, HeaderFlags
+from rixaplugin.internal import memory, networking
+from rixaplugin.internal.memory import PluginMemory, signature_hash, diff_signatures
+
+
+def add_local_function(plugin_memory, plugin_name, name):
+    plugin_memory.add_function({"name": name, "plugin_name": plugin_name, "type": FunctionPointerType.LOCAL,
+                         "args": ["a"], "doc": None})
+    return next(i["id"] for i in plugin_memory.plugins.values() if i["name"] == plugin_name)
+
+
+class SignatureHashTest(unittest.TestCase):
+
+    def test_hash_ignores_runtime_state(self):
+        plugin = {"name": "calc", "functions": [{"name": "add"}], "is_alive": True, "active_tasks": 0}
+        busy = dict(plugin, is_alive=False, active_tasks=3)
+        self.assertEqual(signature_hash(plugin), signature_hash(busy))
+        self.assertNotEqual(signature_hash(plugin), signature_hash(dict(plugin, functions=[{"name": "sub"}])))
+
+    def test_diff(self):
+        changed, removed = diff_signatures({"a": "1", "b": "2", "c": "3"}, {"a": "1", "b": "old", "d": "4"})
+        self.assertEqual(sorted(changed), ["b", "c"])
+        self.assertEqual(removed, ["d"])
+        self.assertEqual(diff_signatures({"a": "1"}, {"a": "1"}), ([], []))
+
+
+class PluginUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = PluginMemory()
+        for module in (memory, networking):
+            patcher = mock.patch.object(module, "_memory", self.memory)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.adapter = networking.NetworkAdapter(0, use_curve=False, manually_created=False)
+        self.sent = []
+
+        async def send(identity, data, already_serialized=False):
+            # round trip like the real adapter, the packed signatures must survive it
+            self.sent.append(networking.deserialize(networking.serialize(data)))
+
+        self.adapter.send = send
+
+    def update(self):
+        self.sent.clear()
+        asyncio.run(self.adapter.send_plugin_update(b"peer"))
+        return self.sent[0] if self.sent else None
+
+    def test_only_changes_are_sent(self):
+        calc = add_local_function(self.memory, "calc", "add")
+        msg = self.update()
+        self.assertTrue(msg["HEAD"] & HeaderFlags.UPDATE_REMOTE_PLUGINS)
+        self.assertEqual(list(msg["plugin_signatures"]), [calc])
+        self.assertEqual(msg["plugin_signatures"][calc]["name"], "calc")
+        self.assertEqual(msg["plugin_signatures"][calc]["type"], FunctionPointerType.REMOTE)
+        self.assertEqual(msg["removed_plugins"], [])
+
+        self.assertIsNone(self.update())
+
+        text = add_local_function(self.memory, "text", "upper")
+        msg = self.update()
+        self.assertEqual(list(msg["plugin_signatures"]), [text])
+        self.assertEqual(set(msg["plugin_hashes"]), {calc, text})
+
+        add_local_function(self.memory, "calc", "sub")
+        msg = self.update()
+        self.assertEqual(list(msg["plugin_signatures"]), [calc])
+        self.assertEqual([i["name"] for i in msg["plugin_signatures"][calc]["functions"]], ["add", "sub"])
+
+        self.memory.delete_plugin(text)
+        msg = self.update()
+        self.assertEqual(msg["plugin_signatures"], {})
+        self.assertEqual(msg["removed_plugins"], [text])
+
+    def test_peer_does_not_get_its_own_plugins(self):
+        add_local_function(self.memory, "calc", "add")
+        self.memory.allow_remote_functions = True
+        remote = {"name": "peer_plugin", "id": "peer-id", "type": FunctionPointerType.REMOTE, "tags": [],
+                  "variables": {}, "functions": [{"name": "f", "plugin_name": "peer_plugin", "plugin_id": "peer-id",
+                                                  "type": FunctionPointerType.REMOTE}]}
+        self.memory.add_plugin({"peer-id": remote}, b"peer", self.adapter)
+        msg = self.update()
+        self.assertNotIn("peer-id", msg["plugin_signatures"])
+        self.assertNotIn("peer-id", msg["plugin_hashes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
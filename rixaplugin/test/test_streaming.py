@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from rixaplugin.decorators import plugfunc
+from rixaplugin.test import support
+
+
+@plugfunc()
+def local_count_up(n):
+    for i in range(n):
+        yield i
+
+
+def network_scenario(port):
+    from rixaplugin import init_plugin_system, PluginModeFlags, create_and_start_plugin_client, async_execute
+    server = support.start_server(port)
+    result = {}
+
+    async def main():
+        init_plugin_system(PluginModeFlags.THREAD)
+        await create_and_start_plugin_client("localhost", port, use_auth=False)
+        stream = await async_execute("count_up", args=[50], return_future=True)
+        result["chunks"] = [chunk async for chunk in stream]
+        # awaiting a stream collects its chunks
+        result["collected"] = await (await async_execute("count_up", args=[3], return_future=True))
+        chunks = []
+        try:
+            async for chunk in await async_execute("count_up", args=[10], kwargs={"fail_at": 5},
+                                                   return_future=True):
+                chunks.append(chunk)
+        except Exception as e:
+            result["failure"] = (chunks, str(e))
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.kill()
+    return result
+
+
+def process_scenario():
+    import multiprocessing
+    from rixaplugin import init_plugin_system, PluginModeFlags, async_execute
+    # this process was spawned, its workers have to inherit the plugins
+    multiprocessing.set_start_method("fork", force=True)
+    from rixaplugin.internal.memory import _memory
+
+    async def main():
+        init_plugin_system(PluginModeFlags.PROCESS, num_workers=1)
+        try:
+            stream = await async_execute("local_count_up", args=[40], return_future=True)
+            return [chunk async for chunk in stream]
+        finally:
+            _memory.executor.shutdown()
+
+    return asyncio.run(main())
+
+
+class StreamingTest(unittest.TestCase):
+
+    def test_stream_over_network(self):
+        result = support.run_isolated(network_scenario, support.free_port())
+        # more chunks than the window, the producer waits for credits
+        self.assertEqual(result["chunks"], list(range(50)))
+        self.assertEqual(result["collected"], [0, 1, 2])
+        chunks, message = result["failure"]
+        self.assertEqual(chunks, [0, 1, 2, 3, 4])
+        self.assertIn("Failed at 5", message)
+
+    def test_stream_from_process_worker(self):
+        self.assertEqual(support.run_isolated(process_scenario), list(range(40)))
+
+
+if __name__ == "__main__":
+    unittest.main()